@@ -8,15 +8,142 @@ from modules.ui import (
     setup_language, apply_theme, render_header,
     landing_hero, dashboard_sidebar
 )
-from modules.extractors import parse_criteria_from_excel, extract_text_with_pages
-from modules.evaluator import evaluate_offers
-from modules.analyzer import analyze_sections_with_pages  # محدثة لتحليل الأقسام + الصفحات
+from modules.extractors import extract_text_with_pages, extraction_summary
+from modules.criteria import parse_criteria_from_excel
+from modules.evaluator import DEFAULT_MAX_WORKERS, EVAL_STRATEGIES, EVAL_STRATEGY
+from modules.chunking import pages_from_payload, estimate_document
+from modules.jobs import (
+    submit_evaluation, submit_sections, cancel_job, resume_job,
+    get_job, job_events, job_ranking, job_sections, job_rows, time_to_first_row, job_profile, FINAL, RESUMABLE,
+)
+from modules import tracing
+from modules.llm import timing_summary
+from modules.scheduler import scheduler_stats
+from modules.prompts import prompt_stats
+from modules.chatbot import ChatSession
+from modules.comparison import TopicComparison
+from modules.scoring import (
+    effective_weights, normalize_weights, score_matrix, rank_table, sensitivity, NORMALIZATIONS,
+)
 
 # ===== إعداد اللغة والتصميم =====
 T = setup_language()
 apply_theme()
 render_header(T)
 
+
+# ===== مهام الخلفية: رقم المهمة في الجلسة + الرابط حتى تبقى بعد تحديث الصفحة =====
+def active_job(key: str):
+    return st.session_state.get(key) or st.query_params.get(key)
+
+
+def start_job(key: str, job_id: str):
+    st.session_state[key] = job_id
+    st.query_params[key] = job_id
+
+
+def job_panel(job_id: str):
+    """حالة المهمة + الصفوف المبثوثة والنتائج الجزئية، تتحدث كل ثانية حتى تنتهي ثم تعيد تشغيل الصفحة."""
+    job = get_job(job_id)
+    if job is None:
+        st.warning(T("⚠️ المهمة غير موجودة.", "⚠️ Job not found."))
+        return None
+    polling = job["status"] not in FINAL
+
+    @st.fragment(run_every=1 if polling else None)
+    def _panel():
+        job = get_job(job_id)
+        done, total = job["done"], job["total"]
+        st.progress(
+            done / total if total else 1.0,
+            text=f"{T('المهمة', 'Job')} {job_id} — {job['status']} ({done}/{total})",
+        )
+        c1, c2 = st.columns(2)
+        if job["status"] in ("queued", "running") and c1.button(T("⏹️ إلغاء", "⏹️ Cancel"), key=f"cancel_{job_id}"):
+            cancel_job(job_id)
+        if job["status"] in RESUMABLE and c2.button(T("▶️ استئناف", "▶️ Resume"), key=f"resume_{job_id}"):
+            resume_job(job_id)
+            st.rerun()
+
+        ttfr = time_to_first_row(job_id)
+        if ttfr is not None:
+            st.caption(f"⏱️ {T('أول نتيجة بعد', 'First result after')} {ttfr}s")
+
+        if job["status"] not in FINAL:
+            rows = job_rows(job_id, limit=30)
+            if rows:
+                st.caption(T("📡 نتائج أولية تصل الآن (قبل دمج الأجزاء):", "📡 Live rows (before chunk merge):"))
+                cols = ["t", "file", "criterion", "score", "chunk"] if job["kind"] == "evaluate" \
+                    else ["t", "file", "section", "start_page", "end_page"]
+                live = pd.DataFrame(rows)
+                st.dataframe(live[[c for c in cols if c in live.columns]], width="stretch")
+            if job["kind"] == "evaluate":
+                ranked, _ = job_ranking(job_id)
+                if not ranked.empty:
+                    st.caption(T("ترتيب جزئي للعروض المكتملة حتى الآن:", "Partial ranking so far:"))
+                    st.dataframe(ranked[["file", "overall"]], width="stretch")
+            else:
+                for name, secs in job_sections(job_id).items():
+                    st.caption(f"✅ {name}: {len(secs)} {T('قسم', 'sections')}")
+
+        with st.expander(T("سجل المهمة", "Job log"), expanded=False):
+            for e in job_events(job_id):
+                st.caption(f"{e['level']}: {e['message']}")
+            timings = timing_summary()
+            if timings:
+                st.caption(T("⏱️ أزمنة الاستدعاءات (أول توكن / أول صف / الكلي):", "⏱️ Call timings (TTFT / first row / total):"))
+                st.dataframe(pd.DataFrame(timings).T, width="stretch")
+            limits = scheduler_stats()
+            if limits:
+                st.caption(T("🚦 حصص النماذج (انتظار، 429، إعادة محاولة، التزامن الحالي):",
+                             "🚦 Model quotas (waits, 429s, retries, current concurrency):"))
+                st.dataframe(pd.DataFrame(limits).T, width="stretch")
+            prompts = prompt_stats()
+            if prompts:
+                st.caption(T("🧱 التوجيهات (توكنات ثابتة/متغيرة، إعادة استخدام البادئة):",
+                             "🧱 Prompts (static/dynamic tokens, prefix reuse):"))
+                st.dataframe(pd.DataFrame(prompts).T, width="stretch")
+
+        with st.expander(T("⏱️ تنميط المراحل", "⏱️ Stage profiling"), expanded=False):
+            if not tracing.ENABLED:
+                st.caption(T("التتبع معطّل (TRACE=off). فعّله ثم شغّل مهمة جديدة لقياس كل مرحلة.",
+                             "Tracing is off (TRACE=off). Enable it, then run a new job to profile each stage."))
+                if st.button(T("تفعيل التتبع في الذاكرة", "Enable in-memory tracing"), key=f"trace_{job_id}"):
+                    tracing.configure("memory")
+                    st.rerun()
+            else:
+                stages, tokens = job_profile(job_id)
+                if tokens:
+                    st.caption(T("💰 التوكنات لهذه المنافسة (توجيه / رد، انتظار الطابور، زمن النموذج):",
+                                 "💰 Token spend for this tender (prompt / completion, queue wait, model time):"))
+                    st.dataframe(pd.DataFrame([tokens]), width="stretch")
+                if stages:
+                    st.caption(T("📊 زمن كل مرحلة (p50 / p95 بالمللي ثانية):",
+                                 "📊 Per-stage latency (p50 / p95 in ms):"))
+                    st.dataframe(pd.DataFrame(stages).T, width="stretch")
+                else:
+                    st.caption(T("لا توجد spans لهذه المهمة في هذه العملية بعد.",
+                                 "No spans for this job in this process yet."))
+                if tracing.trace_file():
+                    st.caption(f"📄 {tracing.trace_file()}")
+
+        if polling and job["status"] in FINAL:
+            st.rerun()
+
+    _panel()
+    return get_job(job_id)
+
+
+# ===== تحليل المواضيع: مقارنة الأقسام بين العروض =====
+def topic_comparison(topics: dict) -> TopicComparison:
+    """مقارنة المواضيع محفوظة في الجلسة حتى تتغير الأقسام (لا يُعاد التجميع مع كل تفاعل)."""
+    key = tuple((name, tuple(s.get("section", "") for s in secs or [])) for name, secs in topics.items())
+    if st.session_state.get("topic_cmp_key") != key:
+        st.session_state.topic_cmp = TopicComparison(topics)
+        st.session_state.topic_cmp_key = key
+    return st.session_state.topic_cmp
+
+
 # ===== المرحلة الأولى: رفع الملفات =====
 if "uploaded" not in st.session_state:
     st.session_state.uploaded = False
@@ -24,6 +151,11 @@ if "uploaded" not in st.session_state:
 if not st.session_state.uploaded:
     landing_hero(T)
 
+    for key in ("eval_job", "sections_job"):
+        if st.query_params.get(key):
+            st.caption(T("مهمة سابقة لهذه الصفحة (تستمر في الخلفية):", "Previous job for this page (runs in background):"))
+            job_panel(st.query_params[key])
+
     ex_file = st.file_uploader(
         T("📥 رفع ملف الإكسل (المعايير)", "📥 Upload Excel (criteria)"),
         type=["xlsx", "xls"]
@@ -59,17 +191,94 @@ if mode == T("تحليل العروض بالذكاء الاصطناعي", "AI Ev
 
     with st.expander(T("عرض المعايير", "Show criteria"), expanded=False):
         st.dataframe(criteria_df, width="stretch")
+        if criteria_df.attrs.get("default"):
+            st.caption(T("⚠️ لم تُكتشف أعمدة المعايير؛ تُستخدم قائمة افتراضية.",
+                         "⚠️ No criteria columns detected; using the default list."))
+        elif criteria_df.attrs.get("sheet"):
+            st.caption(f"{T('الورقة', 'Sheet')}: {criteria_df.attrs['sheet']} — "
+                       f"{T('صف العناوين', 'Header row')}: {criteria_df.attrs['header_row']}")
+
+    with st.expander(T("تقدير التوكنات والتكلفة وزمن الاستخراج قبل التشغيل", "Token / cost / extraction estimate"), expanded=False):
+        # جسم expander يُنفَّذ مع كل تفاعل حتى وهو مطوي: التقدير (استخراج + تقسيم) عند الطلب فقط
+        # ومحفوظ في الجلسة لكل ملف وعدد معايير
+        estimates = st.session_state.setdefault("estimates", {})
+        keys = [(f.name, f.size, len(criteria_list)) for f in st.session_state._offers]
+        if st.button(T("🧮 احسب التقدير", "🧮 Compute estimate")):
+            for f, key in zip(st.session_state._offers, keys):
+                if key in estimates:
+                    continue
+                with st.spinner(f"📄 {f.name}"):
+                    payload = extract_text_with_pages(f)
+                    estimates[key] = {
+                        "file": f.name,
+                        **estimate_document(pages_from_payload(payload), len(criteria_list)),
+                        **extraction_summary(payload),
+                    }
+        est = [estimates[k] for k in keys if k in estimates]
+        if est:
+            st.dataframe(pd.DataFrame(est), width="stretch")
+        else:
+            st.caption(T("التقدير يستخرج نص كل العروض، لذا يُحسب عند الطلب فقط.",
+                         "The estimate extracts every offer, so it is computed on demand."))
+
+    max_workers = st.slider(
+        T("عدد العروض المُقيّمة بالتوازي", "Offers evaluated in parallel"),
+        min_value=1, max_value=16, value=DEFAULT_MAX_WORKERS
+    )
+
+    strategy = st.radio(
+        T("طريقة التقييم", "Evaluation strategy"),
+        options=list(EVAL_STRATEGIES),
+        index=list(EVAL_STRATEGIES).index(EVAL_STRATEGY),
+        format_func=lambda k: {
+            "chunked": T("النص كاملًا (أجزاء بالتوازي)", "Full text (parallel chunks)"),
+            "retrieval": T("المقاطع الأكثر صلة بكل معيار (أسرع وأرخص)", "Top passages per criterion (faster, cheaper)"),
+        }[k],
+        horizontal=True,
+    )
+    pack = strategy == "chunked" and st.checkbox(
+        T("تجميع العروض القصيرة في طلب واحد (طلبات وتوكنات أقل)",
+          "Pack short offers into shared requests (fewer requests/tokens)"),
+        value=False,
+    )
 
     if st.button(T("⚙️ تشغيل التقييم الذكي", "⚙️ Run AI Evaluation"), type="primary"):
-        ranked, details = evaluate_offers(st.session_state._offers, criteria_list)
-        st.session_state.results = ranked
-        st.session_state.details = details
-        st.success(T("✅ تم اكتمال التقييم!", "✅ Evaluation completed!"))
+        start_job("eval_job", submit_evaluation(
+            st.session_state._offers, criteria_list, max_workers=max_workers, strategy=strategy, pack=pack,
+            weights=effective_weights(criteria_df),
+        ))
+        st.session_state.pop("results", None)
         st.rerun()
 
+    eval_job = active_job("eval_job")
+    if eval_job:
+        job = job_panel(eval_job)
+        if job and job["status"] in FINAL and job["done"]:
+            ranked, details = job_ranking(eval_job)
+            if not ranked.empty:
+                st.session_state.results = ranked
+                st.session_state.details = details
+
     if "results" in st.session_state:
-        ranked = st.session_state.results.copy()
         details = st.session_state.details
+        files = list(st.session_state.results["file"])
+        # إعادة الترتيب من مصفوفة الدرجات فقط: تعديل الأوزان فوري وبدون استدعاء النموذج
+        S = score_matrix(details, files, len(criteria_list))
+        with st.expander(T("⚖️ أوزان المعايير", "⚖️ Criteria weights"), expanded=False):
+            wdf = criteria_df[[c for c in ("criterion", "component") if c in criteria_df]].copy()
+            wdf["weight"] = (effective_weights(criteria_df) * 100).round(2)
+            edited = st.data_editor(wdf, disabled=["criterion", "component"], hide_index=True,
+                                    key="weights_editor", width="stretch")
+            normalization = st.radio(
+                T("التطبيع", "Normalization"), options=list(NORMALIZATIONS), horizontal=True,
+                format_func=lambda k: {
+                    "absolute": T("مطلق (الدرجة / 4)", "Absolute (score / 4)"),
+                    "minmax": T("نسبي بين العروض", "Relative across offers"),
+                    "zscore": T("انحراف عن المتوسط", "Z-score"),
+                }[k],
+            )
+        weights = normalize_weights(edited["weight"])
+        ranked = rank_table(files, S, weights, normalization=normalization)
         ranked[T("النسبة %", "% Score")] = (ranked["overall"] * 100).round(1)
 
         st.dataframe(ranked[["file", T("النسبة %", "% Score")]], width="stretch")
@@ -81,6 +290,20 @@ if mode == T("تحليل العروض بالذكاء الاصطناعي", "AI Ev
             unsafe_allow_html=True,
         )
 
+        # الخلايا (عرض × معيار) المعادة من المخزن مقابل المحسوبة في هذا التشغيل
+        reuse = pd.DataFrame({f: pd.Series(details[f]["reused"].to_numpy(dtype=bool)) for f in files
+                              if "reused" in details[f]}).T.fillna(False).astype(bool)
+        if not reuse.empty:
+            n_reused = int(reuse.to_numpy().sum())
+            st.caption(
+                f"♻️ {T('خلايا مُعادة', 'Reused cells')}: {n_reused} — "
+                f"🆕 {T('محسوبة الآن', 'Recomputed')}: {reuse.size - n_reused} "
+                f"({T('من', 'of')} {reuse.size})"
+            )
+            with st.expander(T("♻️ خريطة الخلايا المعادة والمحسوبة", "♻️ Reused vs recomputed cells"), expanded=False):
+                reuse.columns = criteria_list[:reuse.shape[1]]
+                st.dataframe(reuse.replace({True: "♻️", False: "🆕"}), width="stretch")
+
         st.markdown(T("### الشفافية لكل عرض", "### Transparency per Offer"))
         top_n = st.slider(
             T("اعرض تفاصيل لأفضل N عروض", "Show details for top N offers"),
@@ -91,11 +314,24 @@ if mode == T("تحليل العروض بالذكاء الاصطناعي", "AI Ev
             with st.expander(f"{T('تفاصيل العرض:','Details for:')} {fname}", expanded=False):
                 df_sc = details[fname].copy()
                 df_sc["تحويل (0..1)"] = ((df_sc["score"].astype(float) - 1) / 3).round(3)
-                st.dataframe(
-                    df_sc[["criterion", "score", "تحويل (0..1)", "reason", "ai_question"]],
-                    width="stretch"
-                )
+                cols = ["criterion", "score", "تحويل (0..1)", "reason", "ai_question"]
+                cols += [c for c in ("pages", "reused") if c in df_sc.columns]
+                st.dataframe(df_sc[cols], width="stretch")
                 st.caption(f"{T('المجموع المعياري (0..1):','Weighted Score (0..1):')} {r['overall']:.3f}")
+
+        if len(files) > 1:
+            with st.expander(T("🎯 ثبات الترتيب وحساسية الأوزان", "🎯 Rank stability & weight sensitivity"), expanded=False):
+                spread = st.slider(T("نطاق اضطراب الأوزان ±%", "Weight perturbation ±%"), 5, 50, 20) / 100
+                sens = sensitivity(S, weights, spread=spread, normalization=normalization)
+                st.caption(
+                    f"{T('نفس الترتيب الكامل في','Same full ranking in')} {sens['stability']:.0%} — "
+                    f"{T('نفس العرض الأول في','Same top offer in')} {sens['top_stability']:.0%}"
+                )
+                st.dataframe(sens["offers"].assign(file=files).set_index("file").sort_values("base_rank"),
+                             width="stretch")
+                st.caption(T("معامل وزن المعيار الذي يغيّر العرض الأول (فارغ = لا يتغيّر حتى ×3):",
+                             "Weight factor per criterion that changes the top offer (blank = none up to ×3):"))
+                st.dataframe(sens["criteria"].assign(criterion=criteria_list).set_index("criterion"), width="stretch")
     else:
         st.info(T("اضغط الزر لتشغيل التقييم.", "Click the button to run evaluation."))
 
@@ -108,53 +344,88 @@ elif mode == T("تحليل المواضيع", "Topic Explorer"):
 
     # 🚀 زر التحليل الجديد
     if st.button(T("🔎 تحليل الأقسام داخل العروض", "🔎 Analyze Sections in Offers"), type="primary"):
-        topics_data = {}
-        for offer in offers:
-            st.markdown(f"📂 **جاري تحليل العرض:** {offer.name}")
-
-            doc_payload = extract_text_with_pages(offer)  # 🧩 استخراج النصوص مع الصفحات
-            sections = analyze_sections_with_pages(doc_payload)  # 🧠 تحليل السحابي عبر Groq
-            topics_data[offer.name] = sections
+        start_job("sections_job", submit_sections(offers))
+        st.session_state.pop("topics", None)
+        st.rerun()
 
-        st.session_state.topics = topics_data
-        st.success(T("✅ تم تحليل جميع العروض واستخراج الأقسام.", "✅ All proposals analyzed successfully."))
+    sections_job = active_job("sections_job")
+    if sections_job:
+        job = job_panel(sections_job)
+        if job and job["status"] in FINAL and job["done"]:
+            st.session_state.topics = job_sections(sections_job)
 
     # 📖 عرض النتائج
     if "topics" in st.session_state and st.session_state.topics:
-        offers_names = list(st.session_state.topics.keys())
-        selected_offer = st.selectbox(T("اختر عرضًا:", "Select proposal:"), offers_names)
-
-        if selected_offer:
-            df = pd.DataFrame(st.session_state.topics[selected_offer])
-            if not df.empty:
-                section_names = df["section"].dropna().tolist()
-                section = st.selectbox(T("اختر قسمًا:", "Choose section:"), section_names)
-
-                if section:
-                    row = df[df["section"] == section].iloc[0]
-                    st.markdown(f"## 🟣 {row['section']}")
-                    st.markdown(f"**{T('صفحة البداية','Start Page')}:** {row.get('start_page', 1)}")
-                    st.markdown(f"**{T('ملخص','Summary')}:** {row['summary']}")
-                    st.markdown("---")
-
-                    st.markdown("#### 📝 " + T("النص الكامل", "Full Content"))
-                    st.markdown(
-                        f"<div style='background:#f9f9f9;padding:16px;border:1px solid #e6e6e6;"
-                        f"border-radius:10px;white-space:pre-wrap;direction:auto;text-align:justify;"
-                        f"font-family:Tajawal,Segoe UI,Arial,sans-serif;font-size:15px;line-height:1.7;'>"
-                        f"{row['content']}</div>",
-                        unsafe_allow_html=True,
-                    )
-
-                    st.download_button(
-                        label=T("⬇️ تنزيل نص القسم", "⬇️ Download section text"),
-                        data=row["content"].encode("utf-8"),
-                        file_name=f"{selected_offer}_{row['section']}.txt",
-                        mime="text/plain",
-                        use_container_width=True,
-                    )
-            else:
-                st.warning(T("❌ لا توجد أقسام لهذا العرض.", "❌ No sections found for this proposal."))
+        tab_one, tab_cmp = st.tabs([T("📄 عرض واحد", "📄 One proposal"),
+                                    T("🆚 مقارنة بين العروض", "🆚 Compare proposals")])
+        with tab_one:
+            offers_names = list(st.session_state.topics.keys())
+            selected_offer = st.selectbox(T("اختر عرضًا:", "Select proposal:"), offers_names)
+
+            if selected_offer:
+                df = pd.DataFrame(st.session_state.topics[selected_offer])
+                if not df.empty:
+                    # الاختيار بالموضع: قد يتكرر اسم القسم في العرض نفسه
+                    idx = st.selectbox(T("اختر قسمًا:", "Choose section:"), list(range(len(df))),
+                                       format_func=lambda i: f"{df['section'].iloc[i]} "
+                                                             f"(ص {df['start_page'].iloc[i]}–{df.get('end_page', df['start_page']).iloc[i]})")
+
+                    if idx is not None:
+                        row = df.iloc[idx]
+                        st.markdown(f"## 🟣 {row['section']}")
+                        st.markdown(f"**{T('الصفحات','Pages')}:** {row.get('start_page', 1)}–{row.get('end_page', row.get('start_page', 1))}")
+                        if row.get("heading") and row["heading"] != row["section"]:
+                            st.caption(f"{T('العنوان في المستند', 'Heading in document')}: {row['heading']}")
+                        st.markdown(f"**{T('ملخص','Summary')}:** {row['summary']}")
+                        st.markdown("---")
+
+                        st.markdown("#### 📝 " + T("النص الكامل", "Full Content"))
+                        st.markdown(
+                            f"<div style='background:#f9f9f9;padding:16px;border:1px solid #e6e6e6;"
+                            f"border-radius:10px;white-space:pre-wrap;direction:auto;text-align:justify;"
+                            f"font-family:Tajawal,Segoe UI,Arial,sans-serif;font-size:15px;line-height:1.7;'>"
+                            f"{row['content']}</div>",
+                            unsafe_allow_html=True,
+                        )
+
+                        st.download_button(
+                            label=T("⬇️ تنزيل نص القسم", "⬇️ Download section text"),
+                            data=row["content"].encode("utf-8"),
+                            file_name=f"{selected_offer}_{row['section']}.txt",
+                            mime="text/plain",
+                            use_container_width=True,
+                        )
+                else:
+                    st.warning(T("❌ لا توجد أقسام لهذا العرض.", "❌ No sections found for this proposal."))
+
+        # 🆚 موضوع واحد عبر كل العروض (modules.comparison — بدون استدعاءات للنموذج)
+        with tab_cmp:
+            cmp = topic_comparison(st.session_state.topics)
+            stats = cmp.stats()
+            st.caption(T(f"🧩 {stats['sections']} قسمًا من {stats['offers']} عروض في {stats['topics']} موضوعًا",
+                         f"🧩 {stats['sections']} sections from {stats['offers']} proposals in {stats['topics']} topics"))
+            if cmp.topics:
+                topic = st.selectbox(T("اختر موضوعًا:", "Choose topic:"), cmp.topics,
+                                     format_func=lambda t: f"{t} ({cmp.coverage[t]}/{len(cmp.offers)})")
+                cells = cmp.row(topic)
+                for start in range(0, len(cells), 3):
+                    for col, cell in zip(st.columns(3), cells[start:start + 3]):
+                        with col:
+                            st.markdown(f"**📄 {cell['offer']}**")
+                            if not cell["sections"]:
+                                st.caption(T("— لا يغطي هذا الموضوع", "— Not covered"))
+                                continue
+                            st.caption(f"{' / '.join(cell['sections'])} · {T('ص', 'p.')} {cell['pages']}")
+                            st.write(cell["summary"] or "—")
+                            with st.expander(T("النص الكامل", "Full content")):
+                                st.text(cell["content"])
+
+                with st.expander(T("🧮 مصفوفة العروض × المواضيع", "🧮 Proposals × topics matrix"), expanded=False):
+                    field = st.radio(T("الخلايا:", "Cells:"), ["summary", "pages", "count"], horizontal=True,
+                                     format_func=lambda f: {"summary": T("الملخص", "Summary"),
+                                                            "pages": T("الصفحات", "Pages"),
+                                                            "count": T("عدد الأقسام", "Sections")}[f])
+                    st.dataframe(cmp.matrix(field), width="stretch")
     else:
         st.info(T("اضغط الزر لتحليل العروض.", "Click the button to analyze proposals."))
 
@@ -163,7 +434,53 @@ elif mode == T("تحليل المواضيع", "Topic Explorer"):
 # ============================================
 elif mode == T("الشاتبوت", "Chatbot"):
     st.subheader(T("💬 الشاتبوت", "💬 Chatbot"))
-    st.info(T(
-        "سيتاح قريبًا دردشة ذكية لمناقشة تفاصيل العروض والأسئلة المرتبطة بها.",
-        "A chat assistant will soon be available to discuss proposal details and insights."
-    ))
+    offers = st.session_state._offers
+
+    # جلسة واحدة لكل مجموعة عروض؛ الفهرس نفسه مخزّن ببصمة المحتوى (لا يُعاد بناؤه بين الجلسات)
+    offers_key = tuple((f.name, f.size) for f in offers)
+    if st.session_state.get("chat_key") != offers_key:
+        with st.spinner(T("📚 تجهيز فهرس العروض...", "📚 Building the offers index...")):
+            docs = [(f.name, pages_from_payload(extract_text_with_pages(f))) for f in offers]
+            st.session_state.chat = ChatSession([(n, p) for n, p in docs if p])
+        st.session_state.chat_key = offers_key
+    session = st.session_state.chat
+
+    info = session.index_stats
+    st.caption(
+        f"📚 {info['offers']} {T('عرض', 'offers')} — {info['passages']} {T('مقطع', 'passages')} — "
+        f"{T('الفهرس', 'index')}: {info['index_s']}s ({info['index_source']})"
+    )
+    c1, c2 = st.columns([4, 1])
+    scope = c1.multiselect(T("تقييد الأسئلة بعروض معيّنة (اختياري)", "Limit to specific offers (optional)"),
+                           session.files)
+    if c2.button(T("🧹 محادثة جديدة", "🧹 New chat"), use_container_width=True):
+        session.reset()
+
+    def _show_citations(turn):
+        if turn["citations"]:
+            st.caption("📎 " + " · ".join(f"[{c['id']}] {c['file']} — {T('ص', 'p.')} {c['page']}"
+                                         for c in turn["citations"]))
+        with st.expander(T("المقاطع المسترجعة", "Retrieved passages"), expanded=False):
+            for s in turn["sources"]:
+                st.caption(f"[{s['id']}] {s['file']} — {T('ص', 'p.')} {s['page_num']} (score {s['score']})")
+                st.write(s["text"])
+
+    for turn in session.turns:
+        st.chat_message("user").write(turn["question"])
+        with st.chat_message("assistant"):
+            st.write(turn["answer"])
+            _show_citations(turn)
+
+    question = st.chat_input(T("اسأل عن محتوى العروض أو قارن بينها...", "Ask about or compare the offers..."))
+    if question:
+        st.chat_message("user").write(question)
+        with st.chat_message("assistant"):
+            try:
+                st.write_stream(session.stream(question, scope))
+                _show_citations(session.turns[-1])
+            except Exception as e:
+                st.error(f"{T('حدث خطأ أثناء المحادثة:', 'Chat error:')} {e}")
+
+    if session.turns:
+        with st.expander(T("⏱️ قياسات المحادثة", "⏱️ Chat metrics"), expanded=False):
+            st.dataframe(pd.DataFrame(session.turn_stats()), width="stretch")
@@ -0,0 +1,51 @@
+# benchmarks/bench_backend_overhead.py
+"""
+قياس الحمل الإضافي للتطبيق نفسه (بعيدًا عن زمن النموذج):
+نفس عروض التقييم تمر مرة عبر FakeBackend داخل العملية، ومرة عبر
+modules.llm_server (HTTP محلي + اتصال مُجمّع) بزمن نموذج = 0.
+
+python -m benchmarks.bench_backend_overhead --offers 200 --workers 8
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["LLM_CACHE"] = "0"  # نقيس زمن الاستدعاءات لا الكاش
+
+from modules.evaluator import evaluate_texts  # noqa: E402
+from modules.llm import FakeBackend, OpenAICompatBackend  # noqa: E402
+from modules.llm_server import serve  # noqa: E402
+
+
+def _run(label, backend, jobs, workers):
+    evaluate_texts(jobs[:workers], max_workers=workers, backend=backend)  # تسخين الاتصالات
+    t0 = time.perf_counter()
+    outcomes = evaluate_texts(jobs, max_workers=workers, backend=backend)
+    elapsed = time.perf_counter() - t0
+    ok = sum(1 for o in outcomes if o["result"] is not None)
+    print(f"{label:<14} total={elapsed:6.2f}s  per_offer={1000 * elapsed / len(jobs):6.2f}ms  ok={ok}/{len(jobs)}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--offers", type=int, default=200)
+    ap.add_argument("--criteria", type=int, default=20)
+    ap.add_argument("--workers", type=int, default=8)
+    args = ap.parse_args()
+
+    criteria = [f"معيار {i}" for i in range(args.criteria)]
+    jobs = [(f"offer_{i:03d}.pdf", f"نص العرض {i} " * 2000, criteria) for i in range(args.offers)]
+
+    server = serve(FakeBackend(), port=0, background=True)
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+    try:
+        _run("in-process", FakeBackend(), jobs, args.workers)
+        _run("http-pooled", OpenAICompatBackend(base_url=base_url), jobs, args.workers)
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
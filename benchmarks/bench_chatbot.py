@@ -0,0 +1,84 @@
+# benchmarks/bench_chatbot.py
+"""
+الشاتبوت (modules.chatbot) على منافسة مولّدة: زمن بناء الفهرس (بناء / ذاكرة / قرص)،
+زمن الاسترجاع لكل سؤال، وتوكنات كل جولة مع ذاكرة محدودة — بخلفية وهمية.
+
+python -m benchmarks.bench_chatbot --offers 20 --pages 40 --turns 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["LLM_CACHE"] = "0"
+os.environ["AI_TENDER_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench_chat_")
+
+import modules.retrieval as retrieval  # noqa: E402
+from modules.chatbot import ChatSession  # noqa: E402
+from modules.llm import FakeBackend  # noqa: E402
+
+TOPICS = ["المنهجية", "فريق العمل", "الجدول الزمني", "إدارة المخاطر", "ضمان الجودة", "الدعم الفني", "التدريب"]
+QUESTIONS = [
+    "ما هي منهجية التنفيذ المقترحة في العروض؟",
+    "قارن بين فرق العمل في العروض",
+    "وماذا عن مدة التنفيذ؟",
+    "كيف تتعامل العروض مع إدارة المخاطر؟",
+    "ما خطة ضمان الجودة؟",
+    "هل يوجد تدريب للمستخدمين؟",
+    "ما مدة الدعم الفني بعد التسليم؟",
+    "أي عرض يقدّم أفضل جدول زمني؟",
+]
+
+
+def _docs(n_offers: int, n_pages: int):
+    docs = []
+    for i in range(n_offers):
+        pages = []
+        for p in range(n_pages):
+            topic = TOPICS[(i + p) % len(TOPICS)]
+            text = (f"يتناول هذا القسم {topic} في عرض الشركة {i}. " * 6 +
+                    f"تلتزم الشركة {i} بتقديم {topic} خلال {4 + (i * p) % 20} أسبوعًا مع فريق من {3 + p % 9} خبراء. ") * 3
+            pages.append({"page_num": p + 1, "text": text})
+        docs.append((f"offer_{i}.pdf", pages))
+    return docs
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--offers", type=int, default=20)
+    ap.add_argument("--pages", type=int, default=40)
+    ap.add_argument("--turns", type=int, default=8)
+    ap.add_argument("--latency", type=float, default=0.2)
+    args = ap.parse_args()
+
+    docs = _docs(args.offers, args.pages)
+    backend = FakeBackend(latency=args.latency)
+
+    session = ChatSession(docs, backend=backend)
+    print(f"{args.offers} offers × {args.pages} pages → {session.index_stats['passages']} passages")
+    print(f"index build (cold)        : {session.index_stats['index_s'] * 1000:8.1f} ms  "
+          f"[{session.index_stats['index_source']}]")
+    warm = ChatSession(docs, backend=backend)
+    print(f"index (same process)      : {warm.index_stats['index_s'] * 1000:8.1f} ms  "
+          f"[{warm.index_stats['index_source']}]")
+    retrieval._memory.clear()
+    disk = ChatSession(docs, backend=backend)
+    print(f"index (new process, disk) : {disk.index_stats['index_s'] * 1000:8.1f} ms  "
+          f"[{disk.index_stats['index_source']}]")
+
+    print("turn  retrieval_ms  ttft_s  total_s  memory_turns  memory_tok  prompt_tok  citations")
+    t0 = time.perf_counter()
+    for n in range(args.turns):
+        turn = session.ask(QUESTIONS[n % len(QUESTIONS)])
+        s = turn["stats"]
+        cited = ", ".join(f"{c['file']}:{c['page']}" for c in turn["citations"])
+        print(f"{n + 1:4d}  {s['retrieval_ms']:12.2f}  {s['ttft_s']:6.3f}  {s['total_s']:7.3f}  "
+              f"{s['memory_turns']:12d}  {s['memory_tokens']:10d}  {s['prompt_tokens']:10d}  "
+              f"{cited}")
+    print(f"{args.turns} turns in {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
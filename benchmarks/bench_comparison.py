@@ -0,0 +1,88 @@
+# benchmarks/bench_comparison.py
+"""
+مصفوفة المقارنة (modules.comparison) على منافسة مولّدة: عشرات العروض بمئات الأقسام،
+عناوين بصياغات عربية/إنجليزية وترقيم مختلف ومواضيع خاصة ببعض العروض.
+زمن التجميع وبناء المصفوفة، طريقة إسناد كل قسم، ودقة الموضوع مقابل الحقيقة المولّدة —
+بدون أي استدعاء للنموذج (مقابل n² مقارنة أزواج).
+
+python -m benchmarks.bench_comparison --offers 50 100 --sections 30
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.comparison import CANONICAL_TOPICS, OTHER_TOPIC, TopicComparison  # noqa: E402
+
+# مواضيع غير موجودة في المعجم، تتكرر بين العروض بصياغات متقاربة
+EXTRA = {
+    "الأمن السيبراني": ["الأمن السيبراني", "أمن المعلومات والأمن السيبراني", "Cybersecurity"],
+    "الاستدامة": ["الاستدامة", "الاستدامة البيئية", "Sustainability"],
+    "المحتوى المحلي": ["المحتوى المحلي", "نسبة المحتوى المحلي", "Local Content"],
+    "Cloud Platform Design": ["Cloud Platform Design", "Cloud platform design", "Cloud Platform Design Details"],
+}
+LETTERS = "ابتثجحخدذرزسشصضطظعغفقكلمنهوي"
+
+
+def _tender(n_offers: int, n_sections: int, seed: int = 7):
+    rnd = random.Random(seed)
+    canon = list(CANONICAL_TOPICS.items())
+    topics, truth = {}, []
+    for i in range(n_offers):
+        secs = []
+        for n in range(n_sections):
+            r = rnd.random()
+            if r < 0.8:
+                topic, aliases = canon[rnd.randrange(len(canon))]
+            elif r < 0.95:
+                topic, aliases = rnd.choice(list(EXTRA.items()))
+            else:
+                word = lambda: "".join(rnd.choice(LETTERS) for _ in range(rnd.randint(4, 7)))  # noqa: E731
+                topic, aliases = OTHER_TOPIC, [f"{word()} {word()}"]
+            title = rnd.choice(aliases)
+            if rnd.random() < 0.5:
+                title = f"{rnd.randint(1, 9)}.{rnd.randint(1, 9)} {title}"
+            secs.append({"section": title, "summary": f"ملخص {title} في العرض {i}",
+                         "start_page": n + 1, "end_page": n + 2, "content": f"نص {title}"})
+            truth.append(topic)
+        topics[f"offer_{i:03d}.pdf"] = secs
+    return topics, truth
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--offers", type=int, nargs="+", default=[50, 100])
+    ap.add_argument("--sections", type=int, default=30)
+    args = ap.parse_args()
+
+    for n in args.offers:
+        topics, truth = _tender(n, args.sections)
+        t0 = time.perf_counter()
+        cmp = TopicComparison(topics)
+        build_ms = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        matrix = cmp.matrix("summary")
+        row = cmp.row(cmp.topics[0])
+        view_ms = (time.perf_counter() - t0) * 1000
+
+        # النقاء: نسبة الأقسام التي يوافق موضوعها الحقيقي أغلبية مجموعتها،
+        # والتشتت: مواضيع حقيقية موزعة على أكثر من موضوع (مثل صياغتين بلغتين مع تضمين hash)
+        df = cmp.sections.assign(truth=truth)
+        majority = df.groupby("topic")["truth"].agg(lambda v: v.value_counts().iloc[0]).sum()
+        split = (df[df["truth"] != OTHER_TOPIC].groupby("truth")["topic"].nunique() > 1).sum()
+        s = cmp.stats()
+        pairs = s["sections"] * (s["sections"] - 1) // 2
+        print(f"offers={n} sections={s['sections']} distinct_titles={s['distinct_titles']}")
+        print(f"  cluster + assign     : {build_ms:8.1f} ms  topics={s['topics']}  "
+              f"lexicon={s.get('lexicon', 0)} similarity={s.get('similarity', 0)} cluster={s.get('cluster', 0)}")
+        print(f"  matrix + one row     : {view_ms:8.1f} ms  matrix={matrix.shape[0]}×{matrix.shape[1]}  "
+              f"row_offers={len(row)}")
+        print(f"  purity               : {majority / len(df):8.1%}  split_topics={split}  "
+              f"llm_calls=0 (pairwise design: {pairs} pairs)")
+
+
+if __name__ == "__main__":
+    main()
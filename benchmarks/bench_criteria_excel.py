@@ -0,0 +1,163 @@
+# benchmarks/bench_criteria_excel.py
+"""
+قراءة ملفات معايير Excel كبيرة مولّدة (عدة أوراق، صفوف عنوان، محاور بخلايا مدمجة):
+modules.criteria (متدفق + كاش ببصمة المحتوى) مقابل قراءة الورقة كاملة بـ pandas.
+قبل القياس: فحوص سلوك لاكتشاف الورقة والعناوين، والخلايا المدمجة، والترقيم الهرمي (1، 1.1، ٣-١).
+
+python -m benchmarks.bench_criteria_excel --rows 2000 20000
+python -m benchmarks.bench_criteria_excel --check   # الفحوص فقط
+"""
+import argparse
+import io
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["LLM_CACHE"] = "1"
+os.environ["AI_TENDER_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench_criteria_")
+
+import pandas as pd  # noqa: E402
+from openpyxl import Workbook  # noqa: E402
+
+import modules.criteria as criteria  # noqa: E402
+
+
+def _workbook(path: str, n_rows: int, subs: int = 5):
+    """ورقتان قبل ورقة المعايير، وصفا عنوان قبل العناوين، والمحور ووزنه مدمجان على معاييره."""
+    wb = Workbook()
+    wb.active.title = "Cover"
+    wb.active.append(["كراسة الشروط والمواصفات"])
+    notes = wb.create_sheet("Instructions")
+    for i in range(200):
+        notes.append([f"تعليمات رقم {i}", "يجب الالتزام بالشروط"])
+    ws = wb.create_sheet("معايير التقييم")
+    ws.append(["جدول معايير التقييم الفني"])
+    ws.merge_cells("A1:E1")
+    ws.append([])
+    ws.append(["م", "المحور", "وزن المحور", "المعيار الفرعي", "الوزن"])
+    r = 4
+    for c in range(n_rows // subs):
+        for s in range(subs):
+            ws.append([c + 1 if s == 0 else None, f"محور {c}" if s == 0 else None,
+                       f"{1 + c % 7}%" if s == 0 else None, f"معيار {c}.{s} للتحقق من الجودة", 10 + s])
+        ws.merge_cells(start_row=r, end_row=r + subs - 1, start_column=2, end_column=2)
+        ws.merge_cells(start_row=r, end_row=r + subs - 1, start_column=3, end_column=3)
+        r += subs
+    wb.save(path)
+
+
+def _xlsx(build) -> bytes:
+    wb = Workbook()
+    build(wb)
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def _rows(cs) -> list:
+    nan = lambda v: None if isinstance(v, float) and math.isnan(v) else v  # noqa: E731
+    return [(c.name, c.component, nan(c.weight), nan(c.component_weight)) for c in cs.items]
+
+
+def _check():
+    """فحوص على ملفات صغيرة في الذاكرة: ورقة مدمجة الخلايا بعد ورقة ملاحظات، وورقة بترقيم هرمي، وملف تالف."""
+    def merged(wb):
+        wb.active.title = "Notes"
+        wb.active.append(["ملاحظات", "يرجى قراءة الشروط"])
+        ws = wb.create_sheet("التقييم")
+        ws.append(["جدول معايير التقييم"])
+        ws.merge_cells("A1:E1")
+        ws.append([])
+        ws.append(["م", "المحور", "وزن المحور", "المعيار الفرعي", "الوزن"])
+        ws.append([1, "العرض الفني", "60%", "الخبرة", 30])
+        ws.append([None, None, None, "المنهجية", 35])
+        ws.append([None, None, None, "خطة العمل", None])
+        ws.merge_cells("B4:B6")
+        ws.merge_cells("C4:C6")
+        ws.merge_cells("E5:E6")  # وزن واحد مدمج على معيارين
+        ws.append([2, "العرض المالي", "40%", None, None])
+        ws.append([None, "المجموع", "100%", None, None])
+
+    cs = criteria.load_criteria(_xlsx(merged))
+    assert (cs.sheet, cs.header_row, cs.default) == ("التقييم", 3, False), (cs.sheet, cs.header_row, cs.schema)
+    assert _rows(cs) == [("الخبرة", "العرض الفني", 30.0, 60.0), ("المنهجية", "العرض الفني", 35.0, 60.0),
+                         ("خطة العمل", "العرض الفني", 35.0, 60.0),
+                         ("العرض المالي", "العرض المالي", None, 40.0)], _rows(cs)
+
+    def outline(wb):
+        ws = wb.active
+        ws.title = "Criteria"
+        ws.append(["المعيار", "الوزن"])
+        for row in (["1. الخبرة الفنية", 50], ["1.1 خبرة الشركة", 20], ["1.2 خبرة الفريق", 30],
+                    ["2- المنهجية", 30], ["٣. الجودة", 20], ["٣-١ خطة الجودة", "20%"], ["الإجمالي", 100]):
+            ws.append(row)
+
+    cs = criteria.load_criteria(_xlsx(outline))
+    assert (cs.sheet, cs.header_row) == ("Criteria", 1), (cs.sheet, cs.header_row)
+    assert _rows(cs) == [("خبرة الشركة", "الخبرة الفنية", 20.0, 50.0), ("خبرة الفريق", "الخبرة الفنية", 30.0, 50.0),
+                         ("المنهجية", "المنهجية", None, 30.0), ("خطة الجودة", "الجودة", 20.0, 20.0)], _rows(cs)
+
+    assert criteria.load_criteria(b"not an excel file").default
+    print("✅ criteria checks passed")
+
+
+def _measure(fn):
+    """زمن التشغيل بدون tracemalloc (يبطئ openpyxl كثيرًا)، ثم ذروة الذاكرة في تشغيل ثانٍ."""
+    t0 = time.perf_counter()
+    out = fn()
+    dt = time.perf_counter() - t0
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out, dt * 1000, peak / 2 ** 20
+
+
+def _cold(path):
+    criteria._memo.clear()
+    criteria.criteria_cache.clear()
+    return criteria.load_criteria(path)
+
+
+def _new_process(path):
+    criteria._memo.clear()
+    return criteria.load_criteria(path)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, nargs="+", default=[2000, 20000])
+    ap.add_argument("--check", action="store_true", help="فحوص السلوك فقط بدون قياس")
+    args = ap.parse_args()
+
+    _check()
+    if args.check:
+        return
+
+    for n in args.rows:
+        path = os.path.join(tempfile.mkdtemp(), f"criteria_{n}.xlsx")
+        _workbook(path, n)
+        size = os.path.getsize(path) / 2 ** 20
+        print(f"rows={n} file={size:.1f} MB")
+
+        df, ms, mb = _measure(lambda: pd.read_excel(path, sheet_name="معايير التقييم", header=2))
+        print(f"  pandas full sheet read     : {ms:9.1f} ms  peak={mb:7.1f} MB  (rows={len(df)})")
+
+        cs, ms, mb = _measure(lambda: _cold(path))
+        assert len(cs.items) == n and not cs.default, (len(cs.items), cs.schema)
+        print(f"  streaming parse (cold)     : {ms:9.1f} ms  peak={mb:7.1f} MB  "
+              f"(criteria={len(cs.items)} sheet={cs.sheet} header_row={cs.header_row})")
+
+        _, ms, mb = _measure(lambda: _new_process(path))
+        print(f"  same file, new process     : {ms:9.1f} ms  peak={mb:7.1f} MB  (disk cache by content hash)")
+
+        _, ms, mb = _measure(lambda: criteria.load_criteria(path))
+        print(f"  same file, same process    : {ms:9.1f} ms  peak={mb:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
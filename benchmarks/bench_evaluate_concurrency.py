@@ -0,0 +1,58 @@
+# benchmarks/bench_evaluate_concurrency.py
+"""
+قياس تسريع evaluate_texts (تسلسلي مقابل ThreadPool) باستخدام FakeBackend
+مع تأخير مُحقن — بدون أي اتصال بالشبكة.
+
+python -m benchmarks.bench_evaluate_concurrency --offers 30 --latency 0.5 --workers 1 4 8
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["LLM_CACHE"] = "0"  # نقيس زمن الاستدعاءات لا الكاش
+
+from modules.evaluator import evaluate_texts, rank_outcomes  # noqa: E402
+from modules.llm import FakeBackend  # noqa: E402
+
+
+def _jobs(n_offers: int, criteria):
+    return [
+        (f"offer_{i:03d}.pdf", f"نص العرض رقم {i} " * (50 + i), criteria)
+        for i in range(n_offers)
+    ]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--offers", type=int, default=30)
+    ap.add_argument("--criteria", type=int, default=10)
+    ap.add_argument("--latency", type=float, default=0.5)
+    ap.add_argument("--jitter", type=float, default=0.2)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    args = ap.parse_args()
+
+    criteria = [f"معيار {i}" for i in range(args.criteria)]
+    jobs = _jobs(args.offers, criteria)
+
+    baseline, reference = None, None
+    print(f"offers={args.offers} latency={args.latency}s jitter={args.jitter}s")
+    for w in args.workers:
+        backend = FakeBackend(latency=args.latency, jitter=args.jitter)
+        t0 = time.perf_counter()
+        outcomes = evaluate_texts(jobs, max_workers=w, backend=backend)
+        elapsed = time.perf_counter() - t0
+        ranked, _ = rank_outcomes(outcomes)
+
+        order = ranked["file"].tolist()
+        reference = reference or order
+        baseline = baseline or elapsed
+        print(
+            f"workers={w:<3d} time={elapsed:7.2f}s  speedup={baseline / elapsed:5.2f}x  "
+            f"calls={backend.calls}  same_ranking={order == reference}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# benchmarks/bench_extraction.py
+"""
+ذاكرة وإنتاجية استخراج PDF على ملفات مولّدة بمئات الصفحات:
+  legacy  → كل الصفحات قائمة dicts في الذاكرة + pickle (ما كان يحدث داخل st.cache_data)
+  store   → PageStore على القرص (تسلسلي)
+  store∥  → PageStore مع توزيع نطاقات الصفحات على عدة عمليات
+
+python -m benchmarks.bench_extraction --pages 300 600 --processes 4
+"""
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fitz  # noqa: E402
+
+import modules.extractors as ex  # noqa: E402
+
+PARA = ("تتضمن المنهجية المقترحة مراحل التحليل والتصميم والتنفيذ. "
+        "The proposed methodology covers analysis, design and delivery. ")
+
+
+def make_pdf(n_pages: int) -> bytes:
+    doc = fitz.open()
+    for i in range(n_pages):
+        page = doc.new_page()
+        page.insert_textbox(page.rect + (36, 36, -36, -36), f"Page {i + 1}\n" + PARA * 40, fontsize=8)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def _legacy(data: bytes):
+    doc = fitz.open(stream=data, filetype="pdf")
+    pages = [{"page_num": i + 1, "text": p.get_text("text") or ""} for i, p in enumerate(doc)]
+    doc.close()
+    return pickle.dumps((data, pages))  # ما يخزّنه st.cache_data (المفتاح + القيمة)
+
+
+def _store(data: bytes, fid: str):
+    store = ex.extract_pdf_pages("bench.pdf", data, fid)
+    return sum(len(p["text"]) for p in store)  # قراءة كسولة صفحة بصفحة
+
+
+def _measure(label, fn, n_pages):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    fn()
+    dt = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<8} time={dt:6.2f}s  pages/s={n_pages / dt:8.1f}  peak_py_mem={peak / 2**20:7.1f} MiB")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, nargs="+", default=[300, 600])
+    ap.add_argument("--processes", type=int, default=4)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        ex.PAGES_DIR = root
+        for n in args.pages:
+            data = make_pdf(n)
+            print(f"pages={n} size={len(data) / 2**20:.1f} MiB")
+            _measure("legacy", lambda: _legacy(data), n)
+
+            ex.EXTRACT_PROCESSES = 1
+            _measure("store", lambda: _store(data, f"seq{n}"), n)
+
+            ex.EXTRACT_PROCESSES, ex.PARALLEL_MIN_PAGES = args.processes, 1
+            _measure("store∥", lambda: _store(data, f"par{n}"), n)
+
+            _measure("reread", lambda: _store(data, f"par{n}"), n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# benchmarks/bench_incremental.py
+"""
+إعادة التقييم التزايدية (modules.cells): طلبات النموذج والخلايا المحسوبة بعد
+إضافة معيار، وتعديل صياغة معيار، ورفع عرض متأخر — مقابل إعادة تقييم كل شيء.
+
+python -m benchmarks.bench_incremental --offers 12 --criteria 15 --strategy chunked
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# مخزن الخلايا يحتاج الكاش مفعّلًا: مجلد مؤقت حتى لا يختلط بكاش التطبيق
+os.environ["LLM_CACHE"] = "1"
+os.environ["AI_TENDER_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench_cells_")
+
+from modules.cells import cell_stats, reset_cell_stats  # noqa: E402
+from modules.evaluator import evaluate_texts, rank_outcomes  # noqa: E402
+from modules.llm import FakeBackend  # noqa: E402
+
+PARA = "يلتزم المورد بتنفيذ المشروع خلال المدة المحددة مع فريق عمل مؤهل وخطة جودة واضحة. "
+
+
+def _offer(i: int):
+    pages = [{"page_num": p + 1, "text": f"عرض {i} صفحة {p} " + PARA * 20} for p in range(4 + i % 3)]
+    return f"offer_{i}.pdf", pages
+
+
+def _run(label, offers, criteria, strategy, pack, latency):
+    reset_cell_stats()
+    backend = FakeBackend(latency=latency)
+    t0 = time.perf_counter()
+    outcomes = evaluate_texts([(n, p, criteria) for n, p in offers], max_workers=4, backend=backend,
+                              strategy=strategy, pack=pack)
+    dt = time.perf_counter() - t0
+    ranked, _ = rank_outcomes(outcomes)
+    assert len(ranked) == len(offers), [o["message"] for o in outcomes if o["message"]]
+    s = cell_stats()
+    print(f"{label:<22s} requests={backend.calls:4d}  prompt_tokens={backend.prompt_tokens:7d}  "
+          f"cells reused={s.get('reused', 0):4d} computed={s.get('computed', 0):4d}  wall={dt:5.2f}s")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--offers", type=int, default=12)
+    ap.add_argument("--criteria", type=int, default=15)
+    ap.add_argument("--strategy", choices=["chunked", "retrieval"], default="chunked")
+    ap.add_argument("--pack", action="store_true")
+    ap.add_argument("--latency", type=float, default=0.1)
+    args = ap.parse_args()
+
+    offers = [_offer(i) for i in range(args.offers)]
+    criteria = [f"معيار رقم {i}" for i in range(args.criteria)]
+    print(f"{args.offers} offers × {args.criteria} criteria, strategy={args.strategy} pack={args.pack}")
+
+    run = lambda label, o, c: _run(label, o, c, args.strategy, args.pack, args.latency)  # noqa: E731
+    run("cold (full matrix)", offers, criteria)
+    run("unchanged", offers, criteria)
+    criteria = criteria + ["معيار مضاف لاحقًا"]
+    run("+1 criterion", offers, criteria)
+    criteria = criteria[:3] + [criteria[3] + " (صياغة معدّلة)"] + criteria[4:]
+    run("1 criterion reworded", offers, criteria)
+    offers = offers + [_offer(args.offers)]
+    run("+1 late offer", offers, criteria)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# benchmarks/bench_local_llm.py
+"""
+إنتاجية وزمن الاستدلال المحلي بالتجميع المستمر (modules.local_llm) عند أحجام دفعات مختلفة:
+requests/sec، توكنات مولّدة/ثانية، زمن أول توكن، وزمن الطلب (p50/p95).
+
+على CPU بنموذج صغير بديل عن ALLaM:
+  python -m benchmarks.bench_local_llm --model HuggingFaceTB/SmolLM2-135M-Instruct --quantize int8
+بدون torch (محرّك محاكاة):
+  python -m benchmarks.bench_local_llm --model fake
+"""
+import argparse
+import os
+import sys
+import time
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["LLM_CACHE"] = "0"
+
+from modules.local_llm import LocalBackend, FakeEngine, TorchEngine  # noqa: E402
+
+PROMPT = "لخّص العرض الفني التالي في ثلاث نقاط: يلتزم المورد بتنفيذ المشروع خلال {i} أسابيع مع فريق عمل مؤهل."
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))]
+
+
+def _run(backend, n_requests: int, max_new: int):
+    ttft, latency = [], []
+    lock = threading.Lock()
+
+    def _one(i):
+        t0 = time.perf_counter()
+        first = None
+        for _ in backend.stream([{"role": "user", "content": PROMPT.format(i=i)}], max_tokens=max_new,
+                                temperature=0.0):
+            if first is None:
+                first = time.perf_counter() - t0
+        with lock:
+            ttft.append(first if first is not None else time.perf_counter() - t0)
+            latency.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=_one, args=(i,)) for i in range(n_requests)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0, ttft, latency
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default="HuggingFaceTB/SmolLM2-135M-Instruct")
+    ap.add_argument("--quantize", default="none", choices=["none", "int8", "bf16"])
+    ap.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--requests", type=int, default=16)
+    ap.add_argument("--max-new", type=int, default=64)
+    args = ap.parse_args()
+
+    engine = FakeEngine() if args.model == "fake" else TorchEngine(args.model, args.quantize, "cpu")
+    print(f"model={args.model} quantize={args.quantize} requests={args.requests} max_new={args.max_new}")
+    for b in args.batch_sizes:
+        backend = LocalBackend(args.model, max_batch=b, engine=engine)
+        wall, ttft, latency = _run(backend, args.requests, args.max_new)
+        s = backend.batcher.stats()
+        print(
+            f"batch={b:<3d} req/s={args.requests / wall:6.2f}  gen tok/s={s['generated_tokens'] / wall:8.1f}  "
+            f"avg_batch={s['avg_batch']:5.2f}  ttft p50={_pct(ttft, .5):5.2f}s  "
+            f"latency p50={_pct(latency, .5):5.2f}s p95={_pct(latency, .95):5.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
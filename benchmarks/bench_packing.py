@@ -0,0 +1,61 @@
+# benchmarks/bench_packing.py
+"""
+طلبات وتوكنات كل منافسة مع تجميع العروض القصيرة (pack) مقابل طلب لكل عرض:
+عروض قصيرة (صفحة أو صفحتان) مع بعض العروض الطويلة، بخلفية وهمية تعدّ الطلبات والتوكنات.
+
+python -m benchmarks.bench_packing --offers 20 --long 2 --criteria 12 --latency 0.3
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["LLM_CACHE"] = "0"
+
+import modules.structured as structured  # noqa: E402
+from modules.evaluator import evaluate_texts, rank_outcomes, EVAL_PACK_TOKENS  # noqa: E402
+from modules.llm import FakeBackend  # noqa: E402
+
+PARA = "يلتزم المورد بتنفيذ المشروع خلال المدة المحددة مع فريق عمل مؤهل وخطة جودة واضحة. "
+
+
+def _tender(n_offers: int, n_long: int, criteria):
+    named = []
+    for i in range(n_offers):
+        n_pages = 40 if i < n_long else 1 + i % 2
+        pages = [{"page_num": p + 1, "text": f"عرض {i} صفحة {p} " + PARA * 12} for p in range(n_pages)]
+        named.append((f"offer_{i}.pdf", pages, criteria))
+    return named
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--offers", type=int, default=20)
+    ap.add_argument("--long", type=int, default=2)
+    ap.add_argument("--criteria", type=int, default=12)
+    ap.add_argument("--latency", type=float, default=0.3)
+    ap.add_argument("--workers", type=int, default=4)
+    args = ap.parse_args()
+
+    criteria = [f"معيار رقم {i}" for i in range(args.criteria)]
+    named = _tender(args.offers, args.long, criteria)
+    print(f"{args.offers} offers ({args.long} long), {args.criteria} criteria, pack budget={EVAL_PACK_TOKENS} tokens")
+
+    for pack in (False, True):
+        structured.reset_metrics()
+        backend = FakeBackend(latency=args.latency)
+        t0 = time.perf_counter()
+        outcomes = evaluate_texts(named, max_workers=args.workers, backend=backend, strategy="chunked", pack=pack)
+        dt = time.perf_counter() - t0
+        ranked, _ = rank_outcomes(outcomes)
+        assert len(ranked) == args.offers, [o["message"] for o in outcomes if o["message"]]
+        print(
+            f"{'packed' if pack else 'unpacked':<9s} requests={backend.calls:4d}  "
+            f"prompt_tokens={backend.prompt_tokens:7d}  completion_tokens={backend.completion_tokens:6d}  "
+            f"wall={dt:5.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
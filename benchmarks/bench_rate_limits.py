@@ -0,0 +1,156 @@
+# benchmarks/bench_rate_limits.py
+"""
+حمل تقييم بالجملة + أسئلة شاتبوت متفرقة على خادم محلي يفرض حصصًا ويعيد 429
+(modules.llm_server --rpm/--tpm)، مع المجدول وبدونه:
+عدد الطلبات الفاشلة، ردود 429 من الخادم، الزمن الكلي، وزمن انتظار الشاتبوت.
+قبل القياس: فحوص سلوك لدلو التوكنات والتسوية ومزامنة الرؤوس والتكيّف مع 429.
+
+python -m benchmarks.bench_rate_limits --bulk 60 --threads 12 --rpm 40 --window 10
+python -m benchmarks.bench_rate_limits --check   # الفحوص فقط
+"""
+import argparse
+import os
+import sys
+import time
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["LLM_CACHE"] = "0"
+
+from modules import scheduler  # noqa: E402
+from modules.llm import FakeBackend, LLMResult, OpenAICompatBackend, chat  # noqa: E402
+from modules.llm_server import serve  # noqa: E402
+
+PROMPT = "قيّم العرض التالي وفق المعايير وأعد JSON فقط. " + "نص العرض الفني للمشروع. " * 40
+
+
+class _Throttled(Exception):
+    """429 كما تعيده مكتبات HTTP: status_code + response.headers."""
+    status_code = 429
+
+    def __init__(self, retry_after: str):
+        super().__init__("429 Too Many Requests")
+        self.response = type("Response", (), {"headers": {"Retry-After": retry_after}})()
+
+
+def _check():
+    """فحوص بأزمنة صريحة (بلا شبكة): امتلاء الدلو وتفريغه، التسوية بالاستهلاك الفعلي، الرؤوس، وإعادة المحاولة."""
+    b = scheduler.Bucket(60, period=60.0)
+    t = b.updated
+    assert b.wait_time(10, t) == 0.0
+    b.take(60)
+    assert abs(b.wait_time(10, t) - 10.0) < 1e-9          # 10 توكنات بمعدل توكن/ثانية
+    assert abs(b.wait_time(10, t + 4) - 6.0) < 1e-9
+    assert b.wait_time(10, t + 120) == 0.0 and b.level == 60  # لا يتجاوز السعة
+    assert b.wait_time(500, t + 120) == 0.0                 # أكبر من السعة يمر عند الامتلاء
+    assert scheduler.Bucket(None).wait_time(10 ** 9, t) == 0.0
+
+    u = scheduler.Bucket()  # الحصة مجهولة حتى أول رد
+    u.sync("1000", "200", scheduler.parse_duration("8s"), now=t)
+    assert (u.capacity, u.level, u.period) == (1000.0, 200.0, 10.0), vars(u)
+    assert (scheduler.parse_duration("1m2.5s"), scheduler.parse_duration("250ms"),
+            scheduler.parse_duration("later")) == (62.5, 0.25, None)
+
+    lim = scheduler.ModelLimiter("check", {"rpm": 100, "tpm": 1000})
+    lim.acquire(400, scheduler.BULK)
+    lim.release(400, 100)  # حُجز 400 واستُهلك 100 فقط
+    assert 899 < lim.tokens.level <= 1000, lim.tokens.level
+    lim.acquire(10, scheduler.BULK)
+    lim.release(10, 0, {"X-RateLimit-Limit-Tokens": "1000", "X-RateLimit-Remaining-Tokens": "50",
+                        "X-RateLimit-Reset-Tokens": "1m"}, throttled=True, retry_after=30)
+    s = lim.snapshot()
+    assert lim.tokens.level <= 50 and s["concurrency_limit"] == scheduler.MAX_CONCURRENCY / 2, s
+    assert lim.blocked_until - time.monotonic() > 25 and s["rate_limited"] == 1 and s["in_flight"] == 0, s
+
+    enabled = scheduler.ENABLED
+    scheduler.ENABLED = True
+    scheduler.reset()
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise _Throttled("0.05")
+        return LLMResult(text="ok", model="check", prompt_tokens=5, completion_tokens=5)
+
+    def broken():
+        raise ValueError("bad request")
+
+    messages = [{"role": "user", "content": "x"}]
+    res = scheduler.run("evaluator", FakeBackend(), "check", messages, 10, flaky)
+    try:
+        scheduler.run("evaluator", FakeBackend(), "check", messages, 10, broken)
+        raise AssertionError("non-retryable error swallowed")
+    except ValueError:
+        pass
+    s = scheduler.scheduler_stats()["fake:check"]
+    assert res.text == "ok" and len(calls) == 2, calls
+    assert (s["calls"], s["rate_limited"], s["retries"], s["failures"], s["in_flight"]) == (3, 1, 1, 1, 0), s
+    scheduler.ENABLED = enabled
+    scheduler.reset()
+    print("✅ scheduler checks passed")
+
+
+def _run(enabled: bool, args):
+    scheduler.ENABLED = enabled
+    scheduler.reset()
+    server = serve(FakeBackend(latency=args.latency), port=0, background=True,
+                   rpm=args.rpm, tpm=args.tpm, window=args.window)
+    backend = OpenAICompatBackend(base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    failures, chat_lat = [], []
+
+    def bulk(i):
+        try:
+            chat("evaluator", [{"role": "user", "content": f"{i} {PROMPT}"}], max_tokens=300, backend=backend)
+        except Exception as e:
+            failures.append(type(e).__name__)
+
+    def interactive(i):
+        time.sleep(i * args.window / max(args.chats, 1) / 2)
+        t0 = time.perf_counter()
+        try:
+            chat("chatbot", [{"role": "user", "content": f"سؤال {i}"}], max_tokens=100, backend=backend)
+            chat_lat.append(time.perf_counter() - t0)
+        except Exception as e:
+            failures.append(type(e).__name__)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads + args.chats) as pool:
+        futs = [pool.submit(bulk, i) for i in range(args.bulk)]
+        futs += [pool.submit(interactive, i) for i in range(args.chats)]
+        for f in futs:
+            f.result()
+    dt = time.perf_counter() - t0
+    server.shutdown()
+    ok = args.bulk + args.chats - len(failures)
+    p50 = statistics.median(chat_lat) if chat_lat else float("nan")
+    print(f"scheduler={'on ' if enabled else 'off'} ok={ok}/{args.bulk + args.chats} "
+          f"server_429={server.limits.rejected:<4d} time={dt:6.2f}s  chatbot_p50={p50:5.2f}s")
+    if enabled:
+        for k, v in scheduler.scheduler_stats().items():
+            print(f"   {k}: {v}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bulk", type=int, default=60)
+    ap.add_argument("--chats", type=int, default=6)
+    ap.add_argument("--threads", type=int, default=12)
+    ap.add_argument("--latency", type=float, default=0.2)
+    ap.add_argument("--rpm", type=int, default=40, help="طلبات لكل نافذة")
+    ap.add_argument("--tpm", type=int, default=None, help="توكنات لكل نافذة")
+    ap.add_argument("--window", type=float, default=10.0)
+    ap.add_argument("--check", action="store_true", help="فحوص السلوك فقط بدون قياس")
+    args = ap.parse_args()
+
+    _check()
+    if args.check:
+        return
+    scheduler.MAX_RETRIES = 8
+    for enabled in (False, True):
+        _run(enabled, args)
+
+
+if __name__ == "__main__":
+    main()
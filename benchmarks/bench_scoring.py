@@ -0,0 +1,64 @@
+# benchmarks/bench_scoring.py
+"""
+زمن إعادة الترتيب بعد تعديل الأوزان: مصفوفة NumPy واحدة (modules.scoring) مقابل
+DataFrame لكل عرض كما كان rank_outcomes يحسب المتوسط، مع زمن تحليل الحساسية.
+
+python -m benchmarks.bench_scoring --offers 200 --criteria 60
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from modules.scoring import normalize_weights, rank_table, score_matrix, sensitivity  # noqa: E402
+
+
+def _per_offer(details, weights):
+    """الطريقة السابقة: DataFrame لكل عرض ثم DataFrame للنتائج."""
+    rows = []
+    for name, df in details.items():
+        s = pd.to_numeric(df["score"], errors="coerce").fillna(0)
+        rows.append({"file": name, "overall": float((s * weights).sum() / 4)})
+    return pd.DataFrame(rows).sort_values("overall", ascending=False, kind="mergesort")
+
+
+def _time(fn, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        out = fn()
+    return (time.perf_counter() - t0) / repeat * 1000, out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--offers", type=int, default=200)
+    ap.add_argument("--criteria", type=int, default=60)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    criteria = [f"معيار {j}" for j in range(args.criteria)]
+    files = [f"offer_{i}.pdf" for i in range(args.offers)]
+    details = {f: pd.DataFrame({"criterion": criteria, "score": rng.integers(1, 5, args.criteria)}) for f in files}
+    weights = normalize_weights(rng.uniform(1, 10, args.criteria))
+
+    S = score_matrix(details, files, args.criteria)
+    old_ms, old = _time(lambda: _per_offer(details, weights), args.repeat)
+    new_ms, new = _time(lambda: rank_table(files, S, weights), args.repeat)
+    assert list(old["file"]) == list(new["file"])
+    sens_ms, sens = _time(lambda: sensitivity(S, weights), max(1, args.repeat // 5))
+
+    print(f"{args.offers} offers × {args.criteria} criteria")
+    print(f"re-rank per-offer DataFrames: {old_ms:8.2f} ms")
+    print(f"re-rank score matrix        : {new_ms:8.2f} ms")
+    print(f"sensitivity (2000 samples + per-criterion sweep): {sens_ms:8.2f} ms  "
+          f"stability={sens['stability']:.2f} top={sens['top_stability']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# benchmarks/bench_sections.py
+"""
+تحليل الأقسام على PDF مولّد بعناوين معروفة (عريضة/أكبر، مرقّمة، وبدون ترقيم):
+زمن التقسيم المحلي، دقة حدود الأقسام مقابل الحقيقة، وتوكنات النموذج (تسمية + ملخص لكل معرّف)
+مقابل تقدير التصميم السابق الذي يعيد محتوى كل قسم حرفيًا في JSON — بخلفية وهمية.
+
+python -m benchmarks.bench_sections --pages 40 120 --decode-tps 250
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["LLM_CACHE"] = "0"
+os.environ["LLM_BACKEND"] = "fake"
+os.environ["AI_TENDER_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench_sections_")
+
+import fitz  # noqa: E402
+
+from modules.analyzer import analyze_sections_with_pages  # noqa: E402
+from modules.chunking import estimate_tokens, pages_from_payload  # noqa: E402
+from modules.extractors import extract_text_with_pages  # noqa: E402
+from modules.llm import get_backend  # noqa: E402
+from modules.segmentation import segment_pages  # noqa: E402
+
+HEADINGS = ["Executive Summary", "Project Understanding", "Scope of Work", "Methodology", "Solution Architecture",
+            "Integration Layer", "Work Plan", "Project Team", "Risk Management", "Quality Assurance",
+            "Training", "Support and Maintenance", "Deliverables", "Conclusion"]
+LINE = "The supplier will deliver the platform within the agreed schedule using agile sprints and reviews"
+
+
+def _pdf(path: str, n_pages: int, every: int = 3):
+    """عنوان كل every صفحات تقريبًا، بأساليب مختلفة؛ يعيد صفحات بداية الأقسام الحقيقية."""
+    doc = fitz.open()
+    truth = []
+    for p in range(n_pages):
+        page = doc.new_page()
+        y = 60
+        if p % every == 0:
+            n = len(truth)
+            title = HEADINGS[n % len(HEADINGS)]
+            if n % 3 == 1:
+                title = f"{n + 1}.{n % 4 + 1} {title}"
+            page.insert_text((50, y), title, fontsize=15 if n % 3 != 2 else 10,
+                             fontname="hebo")
+            y += 26
+            truth.append(p + 1)
+        for i in range(40):
+            page.insert_text((50, y), f"{LINE} ({p + 1}.{i}).", fontsize=10, fontname="helv")
+            y += 17
+    doc.save(path)
+    return truth
+
+
+class _File:
+    def __init__(self, path):
+        self.name = os.path.basename(path)
+        self._f = open(path, "rb")
+
+    def read(self, *a):
+        return self._f.read(*a)
+
+    def seek(self, *a):
+        return self._f.seek(*a)
+
+    def tell(self):
+        return self._f.tell()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, nargs="+", default=[40, 120])
+    ap.add_argument("--decode-tps", type=float, default=250.0, help="سرعة توليد افتراضية لتقدير زمن الرد")
+    args = ap.parse_args()
+
+    backend = get_backend()
+    for n in args.pages:
+        path = os.path.join(tempfile.mkdtemp(), f"offer_{n}.pdf")
+        truth = _pdf(path, n)
+        payload = extract_text_with_pages(_File(path), styles=True)
+
+        t0 = time.perf_counter()
+        segments = segment_pages(pages_from_payload(payload), payload["pages"].styles())
+        seg_ms = (time.perf_counter() - t0) * 1000
+        found = [s["start_page"] for s in segments]
+        hits = len(set(found) & set(truth))
+
+        calls, pt, ct = backend.calls, backend.prompt_tokens, backend.completion_tokens
+        t0 = time.perf_counter()
+        sections = analyze_sections_with_pages(payload)
+        wall = time.perf_counter() - t0
+        calls, pt, ct = backend.calls - calls, backend.prompt_tokens - pt, backend.completion_tokens - ct
+
+        doc_tokens = sum(estimate_tokens(p["text"]) for p in pages_from_payload(payload))
+        verbatim = sum(estimate_tokens(s["content"]) for s in sections) + 60 * len(sections)
+        print(f"pages={n} doc_tokens={doc_tokens}")
+        print(f"  local segmentation   : {seg_ms:8.1f} ms  sections={len(segments)} "
+              f"boundaries matched={hits}/{len(truth)}")
+        print(f"  labels + summaries   : requests={calls}  prompt_tokens={pt}  completion_tokens={ct}  "
+              f"wall={wall:.2f}s (fake)")
+        print(f"  verbatim JSON design : completion_tokens≈{verbatim}  "
+              f"(decode ≈{verbatim / args.decode_tps:6.1f}s vs ≈{ct / args.decode_tps:5.1f}s "
+              f"at {args.decode_tps:.0f} tok/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# benchmarks/bench_sections_pipeline.py
+"""
+تحليل أقسام منافسة كاملة (20 عرضًا افتراضيًا) من طرف لطرف بخلفية وهمية بتأخير مُحقن:
+- serial: حلقة عرض تلو الآخر (استخراج ثم analyze_sections_with_pages) كما في الحلقات السابقة
+- per-offer pool: عرض لكل thread، ولكل عرض مجمّع تسمية خاص (التزامن = العروض × دفعات العرض)
+- pipeline: analyzer.analyze_offers_sections (استخراج متوازٍ + مجمّع تسمية واحد بحد مشترك)
+
+python -m benchmarks.bench_sections_pipeline --offers 20 --pages 60 --latency 0.8
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["LLM_CACHE"] = "0"
+os.environ["LLM_BACKEND"] = "fake"
+os.environ["AI_TENDER_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench_sections_pipeline_")
+
+import modules.analyzer as analyzer  # noqa: E402
+from benchmarks.bench_sections import _pdf  # noqa: E402
+from modules.batch import LocalFile  # noqa: E402
+from modules.extractors import PAGES_DIR, extract_text_with_pages  # noqa: E402
+from modules.llm import get_backend  # noqa: E402
+
+
+def _one(f, first):
+    out = analyzer.analyze_sections_with_pages(extract_text_with_pages(f, styles=True))
+    first.append(time.perf_counter())
+    return out
+
+
+def _serial(files, workers, first):
+    return [_one(f, first) for f in files]
+
+
+def _per_offer(files, workers, first):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda f: _one(f, first), files))
+
+
+def _pipeline(files, workers, first):
+    return analyzer.analyze_offers_sections(
+        files, extract_workers=workers, on_offer=lambda *a: first.append(time.perf_counter()),
+    )
+
+
+class _InFlight:
+    """ذروة الطلبات المتزامنة الفعلية على الخلفية (تغليف complete/stream)."""
+
+    def __init__(self, backend):
+        self.now = self.peak = 0
+        self._lock = threading.Lock()
+        for name in ("complete", "stream"):
+            setattr(backend, name, self._wrap(getattr(backend, name), name == "stream"))
+
+    def _enter(self):
+        with self._lock:
+            self.now += 1
+            self.peak = max(self.peak, self.now)
+
+    def _exit(self):
+        with self._lock:
+            self.now -= 1
+
+    def _wrap(self, fn, streaming):
+        def complete(*a, **kw):
+            self._enter()
+            try:
+                return fn(*a, **kw)
+            finally:
+                self._exit()
+
+        def stream(*a, **kw):
+            self._enter()
+            try:
+                yield from fn(*a, **kw)
+            finally:
+                self._exit()
+        return stream if streaming else complete
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--offers", type=int, default=20)
+    ap.add_argument("--pages", type=int, default=60)
+    ap.add_argument("--latency", type=float, default=0.8)
+    ap.add_argument("--jitter", type=float, default=0.3)
+    ap.add_argument("--workers", type=int, default=4, help="عروض متزامنة (استخراج)")
+    ap.add_argument("--label-workers", type=int, default=analyzer.SECTIONS_LABEL_WORKERS)
+    ap.add_argument("--batch-size", type=int, default=10, help="أقسام لكل طلب تسمية")
+    args = ap.parse_args()
+
+    os.environ["LLM_FAKE_LATENCY"] = str(args.latency)
+    os.environ["LLM_FAKE_JITTER"] = str(args.jitter)
+    analyzer.SECTIONS_BATCH_SIZE = args.batch_size
+    analyzer.SECTIONS_LABEL_WORKERS = args.label_workers
+    backend = get_backend()
+    inflight = _InFlight(backend)
+
+    d = tempfile.mkdtemp()
+    paths = []
+    for i in range(args.offers):
+        path = os.path.join(d, f"offer_{i:02d}.pdf")
+        _pdf(path, args.pages + i % 5, every=2)
+        paths.append(path)
+    print(f"offers={args.offers} pages≈{args.pages} latency={args.latency}s jitter={args.jitter}s "
+          f"batch={args.batch_size} label_workers={args.label_workers}")
+
+    reference = None
+    for label, run in [("serial", _serial), ("per-offer pool", _per_offer), ("pipeline", _pipeline)]:
+        shutil.rmtree(PAGES_DIR, ignore_errors=True)  # كل وضع يستخرج من جديد
+        files = [LocalFile(p) for p in paths]
+        calls = backend.calls
+        first = []
+        inflight.peak = 0
+        t0 = time.perf_counter()
+        results = run(files, args.workers, first)
+        wall = time.perf_counter() - t0
+        for f in files:
+            f.close()
+        shape = [[(s["start_page"], s["end_page"], s["section"]) for s in secs or []] for secs in results]
+        reference = reference or shape
+        ttfo = f"{min(first) - t0:6.2f}s"
+        print(f"{label:<15s} wall={wall:6.2f}s  first_offer={ttfo}  requests={backend.calls - calls:4d}  "
+              f"peak_inflight={inflight.peak:3d}  "
+              f"sections={sum(len(s) for s in shape):5d}  same_output={shape == reference}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# benchmarks/bench_streaming.py
+"""
+زمن أول نتيجة مع البث مقابل انتظار الرد كاملًا: تقييم عرض واحد عبر خادم OpenAI المحلي
+(modules.llm_server) بخلفية وهمية ذات تأخير، وقياس زمن أول توكن / أول صف / الزمن الكلي.
+قبل القياس: فحوص سلوك للمحلل التدريجي ومسار الإنقاذ/الإصلاح/إعادة السؤال بردود تالفة ومقطوعة.
+
+python -m benchmarks.bench_streaming --latency 2.0 --criteria 20 --runs 3
+python -m benchmarks.bench_streaming --check   # الفحوص فقط
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["LLM_CACHE"] = "0"
+
+import modules.structured as structured  # noqa: E402
+from modules.evaluator import _evaluate_text  # noqa: E402
+from modules.llm import FakeBackend, OpenAICompatBackend, timing_summary  # noqa: E402
+from modules.llm_server import serve  # noqa: E402
+
+PARA = "يلتزم المورد بتنفيذ المشروع خلال المدة المحددة مع فريق عمل مؤهل وخطة جودة واضحة. "
+
+
+def _asked(prompt: str) -> list:
+    return json.loads(prompt.split("CRITERIA:", 1)[1])
+
+
+def _build(subset) -> str:
+    return "CRITERIA:" + json.dumps(subset, ensure_ascii=False)
+
+
+def _check():
+    """فحوص بلا شبكة: JSONArrayStream على رد مقطوع/تالف، ثم request_scores بالإنقاذ والإصلاح وإعادة السؤال."""
+    cut = ('```json\n{"overall_comment": "نص فيه [أقواس] و{معقوفات}", "other": [{"criterion": "دخيل"}], '
+           '"scores": [{"criterion": "أ", "score": 3, "reason": "علامة } و \\" داخل النص", "pages": [1, 2]}, '
+           '{"criterion": "ب", "score": }, {"criterion": "ج", "score": 1}, {"criterion": "د", "sco')
+    parser = structured.JSONArrayStream("scores")
+    items = [item for ch in cut for item in parser.feed(ch)]  # حرفًا حرفًا كما في البث
+    assert [i["criterion"] for i in items] == ["أ", "ج"], items
+    assert items[0]["reason"] == 'علامة } و " داخل النص' and items[0]["pages"] == [1, 2]
+    assert structured.salvage_items(cut, "scores") == items
+    assert structured.salvage_items('[{"a": 1}, {"a": [2, {"b": 3}]}, {"a"') == [{"a": 1}, {"a": [2, {"b": 3}]}]
+    assert structured.salvage_items('{"scores": [}', "scores") == []
+    assert structured.extract_json('النتيجة:\n```json\n{"scores": []}\n``` انتهى') == {"scores": []}
+    assert structured.extract_json("لا يوجد JSON هنا {") is None
+
+    crits = ["أ", "ب", "ج"]
+
+    # رد مبثوث مقطوع عند المعيار الأخير → إنقاذ المكتمل وإعادة السؤال عن الناقص فقط
+    def truncated(prompt, seed):
+        asked = _asked(prompt)
+        full = json.dumps({"scores": [{"criterion": c, "score": 3, "pages": "ص 4، 5"} for c in asked]},
+                          ensure_ascii=False)
+        return full if len(asked) == 1 else full[:full.index(f'"{asked[-1]}"')]
+
+    structured.reset_metrics()
+    streamed = []
+    data, missing = structured.request_scores("evaluator", _build, crits, backend=FakeBackend(responder=truncated),
+                                              on_row=streamed.append)
+    assert missing == [] and [r["criterion"] for r in data["scores"]] == crits, (data, missing)
+    assert sorted(r["criterion"] for r in streamed) == sorted(crits) and data["scores"][0]["pages"] == [4, 5]
+    m = structured.parse_metrics()
+    assert (m["salvaged"], m["reasks"], m["reasked_criteria"], m.get("repairs", 0)) == (1, 1, 1, 0), m
+
+    # رد بلا JSON ولا عناصر → طلب إصلاح بالرد وحده، ومعيار لا يعود أبدًا → ناقص بعد كل المحاولات
+    def garbage(prompt, seed):
+        if "could not be parsed" in prompt:
+            assert "CRITERIA:" not in prompt  # الإصلاح لا يعيد إرسال التوجيه
+            return '{"scores": [{"criterion": "أ", "score": 2}, {"criterion": "ب", "score": 9}]}'
+        asked = _asked(prompt)
+        if asked == crits:
+            return "الدرجات: أ=2 ، ب=9"
+        return json.dumps({"scores": [{"criterion": c, "score": 1} for c in asked if c != "ج"]})
+
+    structured.reset_metrics()
+    data, missing = structured.request_scores("evaluator", _build, crits, backend=FakeBackend(responder=garbage),
+                                              max_retries=2)
+    assert missing == ["ج"] and [(r["criterion"], r["score"]) for r in data["scores"]] == [("أ", 2.0), ("ب", 4.0)]
+    m = structured.parse_metrics()
+    assert (m["repairs"], m["reasks"], m["reasked_criteria"], m["failed"]) == (1, 2, 2, 1), m
+    structured.reset_metrics()
+    print("✅ structured checks passed")
+
+
+def _run(backend, criteria, pages, stream: bool, runs: int):
+    first, total = [], []
+    for r in range(runs):
+        t0 = time.perf_counter()
+        seen = []
+        on_row = (lambda row: seen.append(time.perf_counter() - t0)) if stream else None
+        o = _evaluate_text(f"offer_{r}.pdf", pages, criteria, backend=backend, strategy="retrieval", on_row=on_row)
+        dt = time.perf_counter() - t0
+        assert o["result"] is not None, o["message"]
+        total.append(dt)
+        first.append(seen[0] if seen else dt)
+    return sum(first) / runs, sum(total) / runs
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latency", type=float, default=2.0)
+    ap.add_argument("--criteria", type=int, default=20)
+    ap.add_argument("--pages", type=int, default=30)
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--check", action="store_true", help="فحوص السلوك فقط بدون قياس")
+    args = ap.parse_args()
+
+    _check()
+    if args.check:
+        return
+
+    server = serve(FakeBackend(latency=args.latency), port=0, background=True)
+    backend = OpenAICompatBackend(base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    criteria = [f"معيار رقم {i}" for i in range(args.criteria)]
+
+    for mode in ("blocking", "streaming"):
+        structured.reset_metrics()
+        # نص مختلف لكل وضع حتى لا تتشارك الفهارس أو الردود
+        pages = [{"page_num": i + 1, "text": f"{mode} {i} " + PARA * 15} for i in range(args.pages)]
+        first, total = _run(backend, criteria, pages, mode == "streaming", args.runs)
+        print(f"{mode:<10s} first_result={first:6.2f}s  total={total:6.2f}s")
+    print("per-call:", timing_summary().get("evaluator"))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
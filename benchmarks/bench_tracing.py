@@ -0,0 +1,86 @@
+# benchmarks/bench_tracing.py
+"""
+كلفة التتبع (modules.tracing) لكل وضع: off / memory / jsonl.
+- span فارغ: نانوثانية لكل with span(...) (الحد الأدنى لكلفة كل نقطة قياس)
+- خط تقييم كامل بخلفية وهمية بلا تأخير (أسوأ حالة: كل الزمن محلي فيظهر أثر التتبع كاملًا)
+  مع عدد الـ spans ونسبتها من الزمن (spans × كلفة span ÷ الزمن الكلي) والفرق المقيس مقابل off.
+
+python -m benchmarks.bench_tracing --offers 20 --pages 30 --criteria 10 --repeat 3
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["LLM_CACHE"] = "0"
+os.environ["LLM_BACKEND"] = "fake"
+os.environ["LLM_FAKE_LATENCY"] = "0"
+os.environ["LLM_FAKE_JITTER"] = "0"
+os.environ["AI_TENDER_CACHE_DIR"] = tempfile.mkdtemp(prefix="bench_tracing_")
+
+from modules import tracing  # noqa: E402
+from modules.evaluator import evaluate_texts, rank_outcomes  # noqa: E402
+
+MODES = ["off", "memory", "jsonl"]
+LINE = "The supplier will deliver the platform within the agreed schedule using agile sprints and reviews. "
+
+
+def _span_ns(n: int) -> float:
+    t0 = time.perf_counter_ns()
+    for _ in range(n):
+        with tracing.span("bench", i=1) as sp:
+            sp.set(ok=True)
+    return (time.perf_counter_ns() - t0) / n
+
+
+def _offers(n_offers: int, n_pages: int, criteria, run: int):
+    # نص مختلف في كل تشغيل حتى لا تُعاد خلايا تقييم سابقة
+    return [(f"offer_{i:02d}.pdf",
+             [{"page_num": p + 1, "text": f"[run {run} offer {i} page {p + 1}] " + LINE * 25} for p in range(n_pages)],
+             criteria)
+            for i in range(n_offers)]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--offers", type=int, default=20)
+    ap.add_argument("--pages", type=int, default=30)
+    ap.add_argument("--criteria", type=int, default=10)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--spans", type=int, default=200000, help="تكرارات قياس span الفارغ")
+    args = ap.parse_args()
+    criteria = [f"Criterion {k + 1}" for k in range(args.criteria)]
+
+    print(f"offers={args.offers} pages={args.pages} criteria={args.criteria} repeat={args.repeat} (fake, 0 latency)")
+    cost = {}
+    for mode in MODES:
+        tracing.configure(mode)
+        cost[mode] = _span_ns(args.spans)
+        tracing.reset_traces()
+
+    # الأوضاع متناوبة في كل تكرار (ضجيج الزمن الكلي أكبر من كلفة التتبع نفسها) وأفضل زمن لكل وضع
+    best, n_spans, run = {}, {}, 0
+    for _ in range(args.repeat):
+        for mode in MODES:
+            tracing.configure(mode)
+            tracing.reset_traces()
+            run += 1
+            named = _offers(args.offers, args.pages, criteria, run)
+            t0 = time.perf_counter()
+            rank_outcomes(evaluate_texts(named, strategy="chunked"))
+            wall = time.perf_counter() - t0
+            best[mode] = min(best.get(mode, wall), wall)
+            n_spans[mode] = len(tracing.spans())
+
+    for mode in MODES:
+        share = n_spans[mode] * cost[mode] / 1e9 / best[mode]
+        print(f"{mode:<7s} span={cost[mode]:7.0f} ns  pipeline={best[mode] * 1000:7.1f} ms  "
+              f"vs off={best[mode] / best['off'] - 1:+6.1%}  spans/run={n_spans[mode]:4d}  "
+              f"span cost share={share:6.2%}")
+    tracing.configure("off")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,219 +1,309 @@
 # modules/analyzer.py
-import os, json, hashlib, re
-import streamlit as st
-from groq import Groq
-
-# ============================================================
-# ☁️ إعداد Groq (سحابي فقط)
-# ============================================================
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-client = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+import os, json, hashlib, threading
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from modules.chunking import estimate_tokens, pages_from_payload
+from modules.llm import chat, get_backend, model_for
+from modules.segmentation import segment_pages, strip_numbering
+from modules.structured import request_labels
+from modules.cache import llm_cache, make_key
+from modules.extractors import extract_text_with_pages
+from modules import tracing
+from modules.progress import get_reporter, use_reporter
+from modules.translation import translation_cache
+from modules.prompts import PromptTemplate
 
 def _md5(s: str) -> str:
     return hashlib.md5(s.encode("utf-8", "ignore")).hexdigest()
 
-@st.cache_data(show_spinner=False)
-def _llm_json_only(prompt: str) -> str:
-    """يستدعي Groq ويعيد استجابة نصية (يتوقع JSON فقط)."""
-    if not client:
-        raise RuntimeError("⚠️ GROQ_API_KEY غير مضبوط.")
-    resp = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.25,
+SECTIONS_TEMPERATURE = 0.25
+
+def _llm_labels(prompt, ids, on_label=None):
+    """
+    يستدعي النموذج (موضع analyzer) ويعيد {id: {"section","summary"}} للأقسام المطلوبة
+    (تحقق + إنقاذ + إصلاح عبر modules.structured) — مع كاش دائم على القرص.
+    on_label(id, label): كل تسمية فور اكتمالها في الرد المبثوث (أو كلها من الكاش).
+    """
+    key = make_key(
+        "section-labels", _md5(json.dumps(prompt, ensure_ascii=False)), get_backend().name, model_for("analyzer"),
+        SECTIONS_TEMPLATE.key, SECTIONS_TEMPERATURE,
     )
-    return resp.choices[0].message.content.strip()
-
-def _safe_json_loads(s: str):
-    """يحاول استخراج JSON حتى لو أضاف النموذج نصوصاً زائدة."""
-    try:
-        return json.loads(s)
-    except Exception:
-        m = re.search(r"(\[.*\])", s, re.DOTALL)
-        if m:
-            try:
-                return json.loads(m.group(1))
-            except:
-                pass
-    return None
+    labels = llm_cache.get(key)
+    if labels is None:
+        labels = request_labels("analyzer", prompt, ids, on_label=on_label, temperature=SECTIONS_TEMPERATURE,
+                                max_tokens=SECTIONS_LABEL_TOKENS * len(ids) + 100)
+        if len(labels) == len(ids):
+            llm_cache.set(key, labels)
+    elif on_label:
+        for sid, label in labels.items():
+            on_label(sid, label)
+    return labels
 
 # ============================================================
 # 💾 نظام كاش للترجمات (دائم ومحلي)
 # ============================================================
+# المخزن: SQLite بوضع WAL (modules.translation.translation_cache) — بحث بالمفتاح بدون
+# قراءة الملف كاملًا، كتابة ذرّية آمنة بين الجلسات والعمليات، وإخلاء LRU حسب الحجم.
+# ملف JSON القديم يُرحَّل مرة واحدة عند أول استخدام ثم يُعاد تسميته.
 CACHE_DIR = "cache_translations"
 CACHE_FILE = os.path.join(CACHE_DIR, "translations.json")
-os.makedirs(CACHE_DIR, exist_ok=True)
 
-def _load_cache():
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
+_migrated = False
+_migrate_lock = threading.Lock()
 
-def _save_cache(cache):
-    with open(CACHE_FILE, "w", encoding="utf-8") as f:
-        json.dump(cache, f, ensure_ascii=False, indent=2)
+def _doc_key(text_hash: str) -> str:
+    return make_key("translate-doc", text_hash, "ar")
 
-@st.cache_data(show_spinner=False)
+def migrate_json_translations(path: str = CACHE_FILE) -> int:
+    """نقل translations.json القديم ({md5: ترجمة}) إلى المخزن الجديد في معاملة واحدة."""
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        old = json.load(f)
+    n = translation_cache.set_many((_doc_key(h), v) for h, v in old.items())
+    os.replace(path, path + ".migrated")
+    return n
+
+def _ensure_migrated():
+    global _migrated
+    with _migrate_lock:
+        if not _migrated:
+            try:
+                n = migrate_json_translations()
+                if n:
+                    get_reporter().caption(f"🗄️ تم ترحيل {n} ترجمة من {CACHE_FILE} إلى الكاش الجديد")
+            except Exception as e:
+                get_reporter().warning(f"⚠️ تعذّر ترحيل كاش الترجمات القديم ({e})")
+            _migrated = True
+
+@lru_cache(maxsize=256)
 def translate_with_cache(text: str) -> str:
     """🌍 ترجمة ذكية إلى العربية مع كاش دائم"""
-    text_hash = hashlib.md5(text.encode("utf-8")).hexdigest()
-    cache = _load_cache()
-
-    if text_hash in cache:
-        return cache[text_hash]
+    _ensure_migrated()
+    key = _doc_key(hashlib.md5(text.encode("utf-8")).hexdigest())
+    cached = translation_cache.get(key)
+    if cached is not None:
+        return cached
 
-    st.info("🌍 يتم الآن ترجمة النص إلى العربية (مرة واحدة فقط)...")
+    get_reporter().info("🌍 يتم الآن ترجمة النص إلى العربية (مرة واحدة فقط)...")
     prompt = f"ترجم النص التالي إلى العربية ترجمة احترافية بدون حذف أو اختصار:\n{text[:20000]}"
 
-    response = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.3,
-    )
-
-    translated = response.choices[0].message.content.strip()
-    cache[text_hash] = translated
-    _save_cache(cache)
+    translated = chat("translator", [{"role": "user", "content": prompt}], temperature=0.3).text
+    translation_cache.set(key, translated)
     return translated
 
 # ============================================================
 # 📄 تحليل الأقسام مع أرقام الصفحات
 # ============================================================
-def analyze_sections_with_pages(doc_payload: dict):
+# التقسيم والمحتوى محليان (modules.segmentation)؛ النموذج يعطي اسمًا قصيرًا وملخصًا لكل معرّف قسم فقط،
+# فتوكنات الرد ثابتة لكل قسم بدل أن تساوي طول المستند.
+# عدد دفعات التسمية التي تُرسل بالتوازي للمستند الواحد
+SECTIONS_CHUNK_WORKERS = int(os.getenv("SECTIONS_CHUNK_WORKERS", "4"))
+# حدود الدفعة الواحدة: عدد الأقسام وتوكنات المقتطفات
+SECTIONS_BATCH_SIZE = int(os.getenv("SECTIONS_BATCH_SIZE", "20"))
+SECTIONS_BATCH_TOKENS = int(os.getenv("SECTIONS_BATCH_TOKENS", "4000"))
+# مقتطف بداية كل قسم المرسل للنموذج، وحد توكنات الرد لكل قسم
+SECTIONS_EXCERPT_CHARS = int(os.getenv("SECTIONS_EXCERPT_CHARS", "600"))
+SECTIONS_LABEL_TOKENS = 80
+
+SECTIONS_TEMPLATE = PromptTemplate("sections", "v4", static="""
+أمامك أقسام عرض فني مقسّم مسبقًا. لكل قسم: معرّف، وعنوانه الأصلي إن وجد، وصفحاته، ومقتطف من بدايته.
+لكل قسم أعط:
+- "section": اسمًا قصيرًا (2–5 كلمات) يصف موضوعه مثل: المقدمة، الأهداف، فهم المشروع، المنهجية،
+  خطة التنفيذ، الفريق، النتائج، الخاتمة — واستخدم العنوان الأصلي إذا كان واضحًا.
+- "summary": ملخص القسم بالعربية في جملة أو جملتين.
+لا تُعد نص الأقسام. أعد النتيجة بصيغة JSON فقط بدون أي نص خارجه، بنفس معرّفات الأقسام:
+
+{{"sections": [{{"id": "s1", "section": "اسم القسم", "summary": "ملخص القسم"}}]}}
+""", dynamic="""
+الأقسام:
+{blocks}
+""")
+
+def _section_block(sec: dict) -> str:
+    body = sec["content"][len(sec["heading"]):] if sec["heading"] and sec["content"].startswith(sec["heading"]) \
+        else sec["content"]
+    pages = f"{sec['start_page']}–{sec['end_page']}" if sec["end_page"] != sec["start_page"] else sec["start_page"]
+    return (f"<<<SECTION id={sec['id']} pages={pages}\n"
+            f"العنوان: {sec['heading'] or '—'}\n"
+            f"{' '.join(body.split())[:SECTIONS_EXCERPT_CHARS]}\n>>>")
+
+def _label_batches(sections) -> list:
+    """دفعات أقسام متتالية بحد SECTIONS_BATCH_SIZE قسمًا و SECTIONS_BATCH_TOKENS توكن مقتطفات."""
+    batches, cur, size = [], [], 0
+    for sec in sections:
+        block = _section_block(sec)
+        t = estimate_tokens(block)
+        if cur and (len(cur) >= SECTIONS_BATCH_SIZE or size + t > SECTIONS_BATCH_TOKENS):
+            batches.append(cur)
+            cur, size = [], 0
+        cur.append((sec, block))
+        size += t
+    if cur:
+        batches.append(cur)
+    return batches
+
+def _section_record(sec: dict, label, is_pdf: bool) -> dict:
+    fallback = strip_numbering(sec["heading"]) or \
+        (f"ص {sec['start_page']}–{sec['end_page']}" if is_pdf else f"القسم {sec['id'][1:]}")
+    return {
+        "id": sec["id"],
+        "section": (label or {}).get("section") or fallback,
+        "summary": (label or {}).get("summary", ""),
+        "heading": sec["heading"],
+        "start_page": sec["start_page"] if is_pdf else 1,
+        "end_page": sec["end_page"] if is_pdf else 1,
+        "content": sec["content"],
+    }
+
+def _label_batch(batch, is_pdf: bool, on_section=None, offer: str = None) -> dict:
+    """
+    دفعة واحدة: ({id: سجل القسم}، عدد الأقسام بلا تسمية). كل قسم يُمرَّر إلى on_section
+    فور وصول تسميته، والأقسام التي لم تُسمَّ بعد انتهاء الرد بعنوانها الأصلي.
+    offer: اسم العرض لسمات التتبع فقط.
+    """
+    by_id = {sec["id"]: sec for sec, _ in batch}
+    with tracing.span("sections.label", offer=offer, sections=len(by_id)) as sp:
+        prompt = SECTIONS_TEMPLATE.messages({}, blocks="\n\n".join(block for _, block in batch))
+        emit = (lambda sid, label: on_section(_section_record(by_id[sid], label, is_pdf))) if on_section else None
+        labels = _llm_labels(prompt, list(by_id), emit)
+        sp.set(labeled=len(labels))
+    records = {sid: _section_record(sec, labels.get(sid), is_pdf) for sid, sec in by_id.items()}
+    if on_section:
+        for sid in by_id:
+            if sid not in labels:
+                on_section(records[sid])
+    return records, len(by_id) - len(labels)
+
+def analyze_sections_with_pages(doc_payload: dict, on_section=None):
     """
     doc_payload:
       - PDF: {"type":"pdf","pages":[{"page_num":1,"text":"..."}, ...]}
       - DOCX: {"type":"docx","text":"..."}
-    يعيد قائمة أقسام JSON:
+    يعيد قائمة الأقسام بترتيب المستند:
     [
-      {"section":"...","summary":"...","start_page":1,"content":"..."}
+      {"id":"s1","section":"...","summary":"...","heading":"...","start_page":1,"end_page":3,"content":"..."}
     ]
+    الأقسام وحدودها ومحتواها الحرفي محلية (modules.segmentation)، والنموذج يسمّي ويلخص فقط
+    على دفعات متوازية. on_section(section): كل قسم مكتمل فور وصول تسميته للعرض التدريجي.
     """
-    st.info("☁️ جاري تحليل المستند عبر Groq…")
-
-    if doc_payload.get("type") == "pdf":
-        # دمج النصوص مع علامات الصفحة
-        parts = [f"[[PAGE:{p['page_num']}]]\n{p['text']}" for p in doc_payload["pages"]]
-        full = "\n\n".join(parts)
-        clipped = full[:20000]
-
-        prompt = f"""
-اقرأ النص التالي (عرض فني) المرسل مع علامات صفحات بالشكل [[PAGE:n]].
-قسّمه إلى أقسام رئيسية مثل: المقدمة، الأهداف، فهم المشروع، المنهجية، خطة التنفيذ، الفريق، النتائج، الخاتمة.
-أعد النتيجة بصيغة JSON فقط بدون أي نص خارجه:
-
-[
-  {{
-    "section": "اسم القسم",
-    "summary": "ملخص القسم بالعربية",
-    "start_page": رقم الصفحة التي يبدأ عندها القسم (استدل عليها من [[PAGE:n]]),
-    "content": "النص الكامل للقسم كما هو دون حذف أو اختصار، واجمع الفقرات المتصلة من الصفحات المتتابعة"
-  }}
-]
-
-النص المعلّم بالصفحات:
------------------------
-{clipped}
-"""
-        reply = _llm_json_only(prompt)
-        data = _safe_json_loads(reply)
-
-        if not data:
-            st.warning("⚠️ لم يُرجع النموذج JSON صالحًا — تم حفظ النص كاملًا كقسم واحد.")
-            return [{
-                "section": "النص الكامل",
-                "summary": "تحليل عام",
-                "start_page": 1,
-                "content": reply
-            }]
-
-        out = []
-        for item in data:
-            out.append({
-                "section": str(item.get("section", "")).strip(),
-                "summary": str(item.get("summary", "")).strip(),
-                "start_page": int(item.get("start_page", 1) or 1),
-                "content": str(item.get("content", "")).strip(),
-            })
-        return out
-
-    elif doc_payload.get("type") == "docx":
-        full = doc_payload["text"]
-        clipped = full[:20000]
-        prompt = f"""
-اقرأ النص التالي (عرض فني). قسّمه إلى أقسام رئيسية مثل: المقدمة، الأهداف، المنهجية، خطة التنفيذ، الفريق، النتائج، الخاتمة.
-أعد النتيجة بصيغة JSON فقط بهذا الشكل:
-[
-  {{
-    "section": "اسم القسم",
-    "summary": "ملخص القسم بالعربية",
-    "start_page": 1,
-    "content": "النص الكامل للقسم"
-  }}
-]
-النص:
-------
-{clipped}
-"""
-        reply = _llm_json_only(prompt)
-        data = _safe_json_loads(reply)
-        if not data:
-            return [{
-                "section": "النص الكامل",
-                "summary": "تحليل عام",
-                "start_page": 1,
-                "content": reply
-            }]
-        out = []
-        for item in data:
-            out.append({
-                "section": str(item.get("section", "")).strip(),
-                "summary": str(item.get("summary", "")).strip(),
-                "start_page": 1,
-                "content": str(item.get("content", "")).strip(),
-            })
-        return out
-
-    else:
-        st.error("صيغة الملف غير مدعومة.")
+    sections, is_pdf = _segment_payload(doc_payload)
+    if not sections:
         return []
+    get_reporter().info(f"☁️ جاري تسمية {len(sections)} قسمًا وتلخيصها…")
+
+    batches = _label_batches(sections)
+    records, unlabeled = {}, 0
+    with ThreadPoolExecutor(max_workers=max(1, min(SECTIONS_CHUNK_WORKERS, len(batches)))) as pool:
+        futures = [pool.submit(tracing.wrap(_label_batch), b, is_pdf, on_section) for b in batches]
+        for fut in as_completed(futures):
+            got, missing = fut.result()
+            records.update(got)
+            unlabeled += missing
+    return _ordered_sections(sections, records, unlabeled)
+
+def _segment_payload(doc_payload: dict, offer: str = None):
+    """(الأقسام المقسّمة محليًا، PDF؟) — قائمة فارغة لصيغة غير مدعومة. offer: لسمات التتبع فقط."""
+    kind = doc_payload.get("type") if isinstance(doc_payload, dict) else None
+    if kind not in ("pdf", "docx"):
+        get_reporter().error("صيغة الملف غير مدعومة.")
+        return [], False
+    pages = doc_payload.get("pages")
+    with tracing.span("sections.segment", offer=offer, type=kind) as sp:
+        styles = pages.styles() if hasattr(pages, "styles") else None
+        sections = segment_pages(pages_from_payload(doc_payload), styles)
+        sp.set(sections=len(sections))
+    return sections, kind == "pdf"
+
+def _ordered_sections(sections, records, unlabeled: int, name: str = "") -> list:
+    if unlabeled:
+        get_reporter().warning(f"⚠️ لم يُرجع النموذج تسمية لـ {unlabeled} من {len(sections)} أقسام"
+                               f"{f' في {name}' if name else ''} — استُخدم عنوانها الأصلي.")
+    return [records[sec["id"]] for sec in sections]
 
 # ============================================================
-# 🧠 الدالة الرئيسية لتحليل جميع العروض
+# 🧠 تحليل أقسام كل العروض (خط واحد متوازٍ)
 # ============================================================
-def analyze_all_offers(offers):
-    """تحليل العروض واستخراج الأقسام + الترجمة + الكاش"""
-    st.info("🤖 جاري تحليل العروض سحابيًا عبر Groq...")
-    from modules.extractors import extract_text
-    topics_data = {}
-
-    for offer in offers:
-        st.markdown(f"📂 **جاري تحليل العرض:** {offer.name}")
-        try:
-            full_text = extract_text(offer)
-            if not full_text or len(full_text.strip()) < 200:
-                st.warning(f"⚠️ النص في {offer.name} فارغ أو قصير جدًا")
-                continue
-
-            # إعداد الحمولة حسب نوع الملف
-            if offer.name.lower().endswith(".pdf"):
-                from modules.extractors import fitz
-                doc = fitz.open(stream=offer.read(), filetype="pdf")
-                offer.seek(0)
-                pages = [{"page_num": i+1, "text": p.get_text("text")} for i, p in enumerate(doc)]
-                payload = {"type": "pdf", "pages": pages}
-            else:
-                payload = {"type": "docx", "text": full_text}
-
-            # تحليل الأقسام
-            data = analyze_sections_with_pages(payload)
-            topics_data[offer.name] = data
-            st.success(f"✅ تم تحليل {offer.name} بنجاح.")
-
-        except Exception as e:
-            st.error(f"❌ خطأ أثناء تحليل {offer.name}: {e}")
-
-    st.session_state.topics = topics_data
-    st.success("🎯 تم تحليل جميع العروض واستخراج الأقسام.")
+# استخراج العروض المتزامن، والحد الأعلى لدفعات التسمية المتزامنة عبر كل عروض المنافسة
+SECTIONS_EXTRACT_WORKERS = int(os.getenv("SECTIONS_EXTRACT_WORKERS", "4"))
+SECTIONS_LABEL_WORKERS = int(os.getenv("SECTIONS_LABEL_WORKERS", "8"))
+
+def _with_reporter(rep, fn, *args):
+    """تشغيل fn في thread عامل مع reporter المستدعي (الرسائل تصل لنفس الواجهة / سجل المهمة)."""
+    with use_reporter(rep):
+        return fn(*args)
+
+def analyze_offers_sections(offers, on_offer=None, on_section=None,
+                            extract_workers: int = SECTIONS_EXTRACT_WORKERS,
+                            label_workers: int = SECTIONS_LABEL_WORKERS, should_stop=None) -> list:
+    """
+    تحليل أقسام عدة عروض: استخراج العروض بالتوازي، ثم تقسيم كل عرض محليًا فور استخراجه،
+    ودفعات التسمية والتلخيص من كل العروض في مجمّع واحد بحد label_workers طلبًا متزامنًا
+    (فلا يتضاعف التزامن بعدد العروض).
+      offers: ملفات بواجهة UploadedFile (name + read/seek) بترتيب الرفع
+      on_offer(i, name, sections, level, message): من الـ thread المستدعي فور اكتمال كل عرض
+          (sections=None عند الفشل، [] إذا لم تُستخرج أقسام)؛ بدونه تُعرض الرسالة عبر get_reporter()
+      on_section(i, name, section): كل قسم فور وصول تسميته (من thread عامل)
+      should_stop(): يُفحص بين المراحل؛ True → إلغاء ما لم يبدأ، والعروض غير المكتملة لا تُمرَّر
+    يعيد الأقسام لكل عرض بنفس ترتيب الإدخال (None للعرض الفاشل أو غير المكتمل).
+    """
+    rep = get_reporter()
+    results = [None] * len(offers)
+    state = {}  # i → {"sections", "is_pdf", "records", "pending", "unlabeled"}
+
+    def _finish(i, sections, level=None, message=None):
+        results[i] = sections
+        state.pop(i, None)
+        if on_offer:
+            on_offer(i, offers[i].name, sections, level, message)
+        elif message:
+            getattr(rep, level)(message)
+
+    def _section_sink(i):
+        return (lambda sec: on_section(i, offers[i].name, sec)) if on_section else None
+
+    if not offers:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(extract_workers, len(offers))),
+                            thread_name_prefix="sections-extract") as extract_pool, \
+            ThreadPoolExecutor(max_workers=max(1, label_workers), thread_name_prefix="sections-label") as label_pool:
+        extract = partial(extract_text_with_pages, styles=True)
+        futures = {extract_pool.submit(tracing.wrap(_with_reporter), rep, extract, f): ("extract", i)
+                   for i, f in enumerate(offers)}
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            stopping = should_stop is not None and should_stop()
+            if stopping:
+                for fut in futures:
+                    fut.cancel()
+            for fut in done:
+                stage, i = futures.pop(fut)
+                name = offers[i].name
+                if fut.cancelled() or (stopping and stage == "extract") or (stage == "label" and i not in state):
+                    continue
+                try:
+                    value = fut.result()
+                except Exception as e:
+                    _finish(i, None, "error", f"❌ {name}: {e}")
+                    continue
+
+                if stage == "extract":
+                    sections, is_pdf = _segment_payload(value, name)
+                    if not sections:
+                        _finish(i, [], "warning", f"⚠️ لم تُستخرج أقسام من: {name}")
+                        continue
+                    batches = _label_batches(sections)
+                    state[i] = {"sections": sections, "records": {}, "pending": len(batches), "unlabeled": 0}
+                    for b in batches:
+                        futures[label_pool.submit(tracing.wrap(_with_reporter), rep, _label_batch, b, is_pdf,
+                                                  _section_sink(i), name)] = ("label", i)
+                    continue
 
+                st = state[i]
+                got, missing = value
+                st["records"].update(got)
+                st["unlabeled"] += missing
+                st["pending"] -= 1
+                if not st["pending"]:
+                    _finish(i, _ordered_sections(st["sections"], st["records"], st["unlabeled"], name))
+    return results
@@ -0,0 +1,242 @@
+# modules/batch.py
+"""
+تشغيل خط التقييم كاملًا بدون Streamlit (للتشغيل الليلي والقياس من طرف لطرف).
+
+منافسة واحدة:
+  python -m modules.batch --criteria criteria.xlsx --offers offers/ --out results/
+
+عدة منافسات (كل مجلد فرعي فيه ملف Excel للمعايير + ملفات العروض):
+  python -m modules.batch --tenders tenders/ --out results/ --workers 8 --sections
+
+المخرجات لكل منافسة: ranked / details / sections / topics (عروض × مواضيع) بصيغ csv | json | parquet + run.json بالأزمنة.
+--trace memory|jsonl|otel: زمن كل مرحلة والتوكنات في run.json ("profile")، و jsonl يكتب كل span (modules.tracing).
+"""
+import os
+import io
+import sys
+import json
+import time
+import logging
+import argparse
+
+import pandas as pd
+
+from modules import tracing
+from modules.criteria import parse_criteria_from_excel
+from modules.evaluator import evaluate_offers, DEFAULT_MAX_WORKERS, EVAL_STRATEGIES, EVAL_STRATEGY
+from modules.analyzer import analyze_offers_sections
+from modules.comparison import TopicComparison
+from modules.progress import LogReporter, use_reporter
+from modules.structured import parse_metrics
+from modules.prompts import prompt_stats
+from modules.scoring import effective_weights, score_matrix, sensitivity, NORMALIZATIONS
+
+OFFER_EXTS = (".pdf", ".docx")
+EXCEL_EXTS = (".xlsx", ".xls")
+FORMATS = ("csv", "json", "parquet")
+
+
+class LocalFile(io.FileIO):
+    """ملف محلي بنفس واجهة UploadedFile (name = اسم الملف فقط)."""
+
+    def __init__(self, path: str):
+        super().__init__(path, "rb")
+        self.name = os.path.basename(path)
+
+
+# ============================================================
+# 📁 اكتشاف المنافسات والعروض
+# ============================================================
+def list_offers(offers_dir: str) -> list:
+    return sorted(
+        os.path.join(offers_dir, f) for f in os.listdir(offers_dir)
+        if f.lower().endswith(OFFER_EXTS) and not f.startswith("~$")
+    )
+
+
+def find_tenders(root: str) -> list:
+    """[(اسم المنافسة، ملف المعايير، [ملفات العروض])] لكل مجلد فرعي صالح."""
+    tenders = []
+    for name in sorted(os.listdir(root)):
+        d = os.path.join(root, name)
+        if not os.path.isdir(d):
+            continue
+        excels = sorted(f for f in os.listdir(d) if f.lower().endswith(EXCEL_EXTS) and not f.startswith("~$"))
+        offers = list_offers(d)
+        if excels and offers:
+            tenders.append((name, os.path.join(d, excels[0]), offers))
+        else:
+            logging.warning(f"⚠️ تم تجاهل {d}: يلزم ملف Excel للمعايير وعرض واحد على الأقل")
+    return tenders
+
+
+# ============================================================
+# 💾 الكتابة
+# ============================================================
+def write_frame(df: pd.DataFrame, base: str, formats) -> list:
+    written = []
+    for fmt in formats:
+        path = f"{base}.{fmt}"
+        if fmt == "csv":
+            df.to_csv(path, index=False, encoding="utf-8-sig")
+        elif fmt == "json":
+            df.to_json(path, orient="records", force_ascii=False, indent=2)
+        elif fmt == "parquet":
+            try:
+                df.to_parquet(path, index=False)
+            except ImportError as e:
+                logging.error(f"❌ تعذّر الكتابة بصيغة parquet (ثبّت pyarrow): {e}")
+                continue
+        written.append(path)
+    return written
+
+
+# ============================================================
+# 🚀 تشغيل منافسة واحدة
+# ============================================================
+def _cell_counts(details) -> dict:
+    """خلايا (عرض × معيار) مُعادة من المخزن مقابل المحسوبة في هذا التشغيل."""
+    reused = sum(int(df["reused"].sum()) for df in details.values() if "reused" in df)
+    total = sum(len(df) for df in details.values())
+    return {"reused": reused, "computed": total - reused}
+
+
+def run_tender(criteria_path: str, offer_paths, out_dir: str, workers: int = DEFAULT_MAX_WORKERS,
+               strategy: str = EVAL_STRATEGY, formats=("csv", "json"), sections: bool = False,
+               pack: bool = False, tender: str = None, normalization: str = "absolute") -> dict:
+    """
+    منافسة واحدة من طرف لطرف؛ tender = اسمها في التتبع (افتراضيًا اسم مجلد المخرجات).
+    normalization: تطبيع الترتيب، ويُستخدم نفسه في تحليل الحساسية.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    tender = tender or os.path.basename(os.path.normpath(out_dir))
+    with tracing.span("tender", tender=tender, offers=len(offer_paths)):
+        summary = _run_tender(criteria_path, offer_paths, out_dir, workers, strategy, formats, sections, pack,
+                              normalization)
+    if tracing.ENABLED:
+        rows = [r for r in tracing.spans() if r["attributes"].get("tender") == tender]
+        summary["profile"] = {"stages": tracing.stage_summary(rows),
+                              "tokens": tracing.token_summary(rows).get(tender, {})}
+    with open(os.path.join(out_dir, "run.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def _run_tender(criteria_path, offer_paths, out_dir, workers, strategy, formats, sections, pack,
+                normalization) -> dict:
+    timings = {}
+
+    t0 = time.perf_counter()
+    criteria_df = parse_criteria_from_excel(criteria_path)
+    criteria_list = criteria_df["criterion"].tolist()
+    weights = effective_weights(criteria_df)
+    timings["criteria_s"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    files = [LocalFile(p) for p in offer_paths]
+    try:
+        ranked, details = evaluate_offers(files, criteria_list, max_workers=workers, strategy=strategy,
+                                          pack=pack, weights=weights, normalization=normalization)
+    finally:
+        for f in files:
+            f.close()
+    timings["evaluate_s"] = time.perf_counter() - t0
+
+    outputs = []
+    if not ranked.empty:
+        outputs += write_frame(ranked, os.path.join(out_dir, "ranked"), formats)
+        long = pd.concat([df.assign(file=name) for name, df in details.items()], ignore_index=True)
+        outputs += write_frame(long, os.path.join(out_dir, "details"), formats)
+    stability = None
+    if len(ranked) > 1:
+        sens = sensitivity(score_matrix(details, ranked["file"], len(criteria_list)), weights,
+                           normalization=normalization)
+        outputs += write_frame(sens["offers"].assign(file=ranked["file"]), os.path.join(out_dir, "sensitivity"),
+                               formats)
+        stability = {"ranking": sens["stability"], "top": sens["top_stability"]}
+
+    if sections:
+        t0 = time.perf_counter()
+        files = [LocalFile(p) for p in offer_paths]
+        try:
+            results = analyze_offers_sections(files, extract_workers=workers)
+        finally:
+            for f in files:
+                f.close()
+        cmp = TopicComparison({f.name: secs or [] for f, secs in zip(files, results)})
+        rows = [{"file": f.name, **sec} for f, secs in zip(files, results) for sec in secs or []]
+        outputs += write_frame(pd.DataFrame(rows).assign(topic=cmp.sections["topic"].values),
+                               os.path.join(out_dir, "sections"), formats)
+        outputs += write_frame(cmp.matrix("pages").reset_index(), os.path.join(out_dir, "topics"), formats)
+        timings["sections_s"] = time.perf_counter() - t0
+
+    summary = {
+        "criteria": criteria_path,
+        "offers": len(offer_paths),
+        "evaluated": int(len(ranked)),
+        "strategy": strategy,
+        "pack": pack,
+        "weights": dict(zip(criteria_list, weights.round(4).tolist())),
+        "rank_stability": stability,
+        "cells": _cell_counts(details),
+        "workers": workers,
+        "timings": {k: round(v, 3) for k, v in timings.items()},
+        "outputs": outputs,
+        "parse_metrics": parse_metrics(),
+        "prompt_stats": prompt_stats(),
+    }
+    return summary
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Headless batch tender evaluation")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--tenders", help="مجلد يحتوي منافسة في كل مجلد فرعي")
+    src.add_argument("--offers", help="مجلد عروض منافسة واحدة")
+    ap.add_argument("--criteria", help="ملف Excel للمعايير (مع --offers)")
+    ap.add_argument("--out", default="results")
+    ap.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS)
+    ap.add_argument("--strategy", choices=EVAL_STRATEGIES, default=EVAL_STRATEGY)
+    ap.add_argument("--normalization", choices=NORMALIZATIONS, default="absolute",
+                    help="تطبيع الترتيب (ويُطبَّق نفسه على تحليل الحساسية)")
+    ap.add_argument("--format", nargs="+", choices=FORMATS, default=["csv", "json"])
+    ap.add_argument("--sections", action="store_true", help="تشغيل تحليل الأقسام أيضًا")
+    ap.add_argument("--pack", action="store_true", help="تجميع العروض القصيرة في طلبات مشتركة")
+    ap.add_argument("--trace", help="تفعيل التتبع: memory | jsonl | otel (أو تركيبة مفصولة بفواصل)")
+    ap.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s %(levelname)s %(message)s",
+    )
+    if args.offers and not args.criteria:
+        ap.error("--criteria مطلوب مع --offers")
+    if args.trace:
+        tracing.configure(args.trace)
+
+    if args.tenders:
+        tenders = [(n, c, o) for n, c, o in find_tenders(args.tenders)]
+    else:
+        tenders = [(os.path.basename(os.path.normpath(args.offers)), args.criteria, list_offers(args.offers))]
+
+    t_all = time.perf_counter()
+    failed = 0
+    with use_reporter(LogReporter()):
+        for name, criteria, offers in tenders:
+            out_dir = os.path.join(args.out, name) if args.tenders else args.out
+            try:
+                s = run_tender(criteria, offers, out_dir, args.workers, args.strategy, args.format, args.sections,
+                               args.pack, tender=name, normalization=args.normalization)
+                print(f"✅ {name}: {s['evaluated']}/{s['offers']} offers  {s['timings']}")
+            except Exception as e:
+                failed += 1
+                logging.exception(f"❌ {name}: {e}")
+    print(f"🏁 {len(tenders) - failed}/{len(tenders)} tenders in {time.perf_counter() - t_all:.1f}s")
+    if tracing.trace_file():
+        print(f"🧵 trace: {tracing.trace_file()}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+# modules/cache.py
+"""
+كاش دائم على القرص (SQLite بوضع WAL) مشترك بين كل العمليات على نفس الخادم.
+
+- المفاتيح content-addressed: make_key(...) يبني SHA-256 من أجزاء المفتاح.
+- يبقى بعد إعادة تشغيل الخادم ويُقرأ من كل الجلسات/العمليات في نفس الوقت.
+- إخلاء حسب العمر (max_age) والحجم (max_bytes، الأقدم استخدامًا أولًا).
+- إحصاءات hit/miss محفوظة في نفس القاعدة.
+
+python -m modules.cache stats | clear | compact [name]
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+CACHE_ROOT = os.getenv("AI_TENDER_CACHE_DIR", "cache")
+
+
+def make_key(*parts) -> str:
+    """مفتاح ثابت من أي أجزاء قابلة للتحويل إلى JSON."""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    def __init__(self, name: str, max_bytes: int = None, max_age: float = None, enabled: bool = None):
+        self.name = name
+        self.path = os.path.join(CACHE_ROOT, f"{name}.sqlite3")
+        self.max_bytes = max_bytes if max_bytes is not None else \
+            int(float(os.getenv("CACHE_MAX_MB", "512")) * 1024 * 1024)
+        self.max_age = max_age if max_age is not None else \
+            float(os.getenv("CACHE_MAX_AGE_DAYS", "30")) * 86400
+        self.enabled = enabled if enabled is not None else os.getenv("LLM_CACHE", "1") != "0"
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    # ---------- اتصال لكل thread ----------
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(CACHE_ROOT, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at);
+                CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+                INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0), ('evictions', 0);
+            """)
+            self._local.conn = conn
+        return conn
+
+    def _bump(self, conn, stat: str, n: int = 1):
+        conn.execute("UPDATE stats SET value = value + ? WHERE name = ?", (n, stat))
+
+    # ---------- القراءة والكتابة ----------
+    def get(self, key: str, default=None):
+        if not self.enabled:
+            return default
+        conn = self._conn()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, created_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or (self.max_age and now - row[1] > self.max_age):
+            self._bump(conn, "misses")
+            return default
+        conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        self._bump(conn, "hits")
+        return json.loads(row[0])
+
+    def get_many(self, keys) -> dict:
+        """{key: value} للمفاتيح الموجودة فقط، باستعلام واحد لكل 500 مفتاح."""
+        keys = list(dict.fromkeys(keys))
+        if not self.enabled or not keys:
+            return {}
+        conn = self._conn()
+        now = time.time()
+        found = {}
+        for s in range(0, len(keys), 500):
+            batch = keys[s:s + 500]
+            marks = ",".join("?" * len(batch))
+            for key, raw, created in conn.execute(
+                f"SELECT key, value, created_at FROM entries WHERE key IN ({marks})", batch
+            ):
+                if not (self.max_age and now - created > self.max_age):
+                    found[key] = json.loads(raw)
+        if found:
+            conn.executemany("UPDATE entries SET accessed_at = ? WHERE key = ?", [(now, k) for k in found])
+        self._bump(conn, "hits", len(found))
+        self._bump(conn, "misses", len(keys) - len(found))
+        return found
+
+    def set(self, key: str, value):
+        if not self.enabled:
+            return
+        raw = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+            (key, raw, len(raw.encode("utf-8")), now, now),
+        )
+        with self._lock:
+            self._writes += 1
+            due = self._writes % 50 == 1
+        if due:
+            self.evict()
+
+    def set_many(self, items) -> int:
+        """كتابة عدة مفاتيح في معاملة واحدة (للترحيل من كاش قديم)."""
+        if not self.enabled:
+            return 0
+        now = time.time()
+        rows = []
+        for key, value in items:
+            raw = json.dumps(value, ensure_ascii=False)
+            rows.append((key, raw, len(raw.encode("utf-8")), now, now))
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.evict()
+        return len(rows)
+
+    def evict(self) -> int:
+        """حذف المنتهي عمره ثم الأقدم استخدامًا حتى ينزل الحجم إلى 90% من الحد."""
+        conn = self._conn()
+        removed = 0
+        if self.max_age:
+            removed += conn.execute(
+                "DELETE FROM entries WHERE created_at < ?", (time.time() - self.max_age,)
+            ).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if self.max_bytes and total > self.max_bytes:
+            target = total - int(self.max_bytes * 0.9)
+            freed = 0
+            victims = []
+            for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at"):
+                victims.append((key,))
+                freed += size
+                if freed >= target:
+                    break
+            conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+            removed += len(victims)
+        if removed:
+            self._bump(conn, "evictions", removed)
+        return removed
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM entries")
+        conn.execute("UPDATE stats SET value = 0")
+
+    def compact(self):
+        """إخلاء ثم إعادة بناء الملف (VACUUM) وتفريغ سجل WAL لاسترجاع المساحة على القرص."""
+        self.evict()
+        conn = self._conn()
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def stats(self) -> dict:
+        conn = self._conn()
+        out = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        lookups = out.get("hits", 0) + out.get("misses", 0)
+        out.update({
+            "name": self.name,
+            "entries": entries,
+            "bytes": size,
+            "hit_rate": round(out.get("hits", 0) / lookups, 3) if lookups else 0.0,
+        })
+        return out
+
+
+# ============================================================
+# 🗄️ الكاشات المشتركة في التطبيق
+# ============================================================
+llm_cache = DiskCache("llm")
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    cmd = argv[0] if argv else "stats"
+    names = argv[1:]
+    if not names and os.path.isdir(CACHE_ROOT):
+        names = [f[:-len(".sqlite3")] for f in sorted(os.listdir(CACHE_ROOT))
+                 if f.endswith(".sqlite3") and f != "jobs.sqlite3"]
+    for name in names:
+        cache = DiskCache(name)
+        if cmd == "clear":
+            cache.clear()
+            print(f"🧹 {name}: cleared")
+        elif cmd == "compact":
+            cache.compact()
+            print(json.dumps(cache.stats(), ensure_ascii=False))
+        else:
+            print(json.dumps(cache.stats(), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# modules/cells.py
+"""
+مخزن خلايا التقييم: كل خلية (عرض، معيار) تُخزَّن وحدها على القرص بمفتاح
+(بصمة نص العرض، بصمة نص المعيار، سياق التقييم).
+
+- إضافة معيار أو تعديل صياغته → تُحسب خلايا ذلك المعيار فقط لكل العروض.
+- رفع عرض متأخر → تُحسب خلايا ذلك العرض فقط.
+- السياق (الخلفية، النموذج، مفتاح القالب، الحرارة، الاستراتيجية ومعاملها) جزء من المفتاح،
+  فتغيير أي منها يُبطل الخلايا المتأثرة به فقط.
+- الترتيب يُعاد بناؤه من الخلايا المخزنة (modules.scoring) دون أي استدعاء للنموذج.
+"""
+import hashlib
+import threading
+from collections import Counter
+
+from modules.cache import DiskCache, make_key
+
+cell_cache = DiskCache("cells")
+# حقول الخلية المحفوظة (الباقي — مثل reused أو chunk — خاص بالعرض الحالي)
+CELL_FIELDS = ("criterion", "score", "ai_question", "reason", "pages")
+
+_counts = Counter()
+_counts_lock = threading.Lock()
+
+
+def offer_hash(pages) -> str:
+    text = "\n".join(p["text"] for p in pages)
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+def criterion_hash(criterion) -> str:
+    """بصمة المعيار بعد توحيد المسافات (تغيير المسافات فقط لا يُبطل الخلية)."""
+    return hashlib.md5(" ".join(str(criterion).split()).encode("utf-8")).hexdigest()
+
+
+def _key(offer: str, criterion, context) -> str:
+    return make_key("cell", offer, criterion_hash(criterion), context)
+
+
+def load_cells(offer: str, criteria_list, context):
+    """يعيد (cells, todo): cells = {المعيار: الصف المخزن}، todo = المعايير بلا خلية (بترتيبها)."""
+    keys = {c: _key(offer, c, context) for c in criteria_list}
+    found = cell_cache.get_many(keys.values())
+    cells = {c: found[k] for c, k in keys.items() if k in found}
+    todo = [c for c in dict.fromkeys(criteria_list) if c not in cells]
+    return cells, todo
+
+
+def save_cells(offer: str, rows, context):
+    """rows: صفوف درجات مكتملة (لكل منها criterion)؛ تُكتب في معاملة واحدة."""
+    items = [(_key(offer, r["criterion"], context), {k: r.get(k) for k in CELL_FIELDS}) for r in rows]
+    if items:
+        cell_cache.set_many(items)
+
+
+def load_comment(offer: str, context):
+    return cell_cache.get(make_key("cell-comment", offer, context))
+
+
+def save_comment(offer: str, context, comment: str):
+    cell_cache.set(make_key("cell-comment", offer, context), comment)
+
+
+# ============================================================
+# 📊 عدّاد الخلايا المعاد استخدامها مقابل المحسوبة
+# ============================================================
+def record_cells(reused: int, computed: int):
+    with _counts_lock:
+        _counts["reused"] += reused
+        _counts["computed"] += computed
+
+
+def cell_stats() -> dict:
+    with _counts_lock:
+        out = dict(_counts)
+    total = out.get("reused", 0) + out.get("computed", 0)
+    out["reuse_rate"] = round(out.get("reused", 0) / total, 3) if total else 0.0
+    return out
+
+
+def reset_cell_stats():
+    with _counts_lock:
+        _counts.clear()
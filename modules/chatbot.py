@@ -1,33 +1,168 @@
-import streamlit as st
-from groq import Groq
+# modules/chatbot.py
+"""
+شاتبوت العروض (RAG): فهرس واحد لكل عروض المنافسة، مقاطع مسترجعة لكل سؤال، وإجابة مبثوثة
+بمراجع الصفحات.
+
+- الفهرس: مقاطع بأرقام صفحاتها من كل العروض (modules.retrieval.get_corpus_index)،
+  يُبنى مرة واحدة ويُخزَّن ببصمة محتوى العروض (ذاكرة + قرص).
+- الاسترجاع: BM25 + تشابه التضمينات لكل المقاطع بعملية مصفوفية واحدة، مع تقييد اختياري بعروض معيّنة.
+- الذاكرة محدودة: آخر CHAT_MEMORY_TURNS جولات وبحد CHAT_MEMORY_TOKENS توكن، والأقدم يُحذف.
+- المراجع: كل مقطع له معرّف [S1]..، والمعرّفات المذكورة في الإجابة تتحول إلى (العرض، الصفحة).
+- القياس: زمن بناء الفهرس ومصدره، زمن الاسترجاع، وتوكنات كل جولة (ثابت/ذاكرة/مقاطع/سؤال/إجابة).
+- بدون Streamlit: يعمل مع أي خلفية (fake للاختبار، محلية، أو Groq).
+"""
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-
-def show_chatbot_page():
-    st.title("💬 الشاتبوت الذكي لمناقشة العروض")
-
-    if "_offers" not in st.session_state:
-        st.warning("يرجى رفع العروض أولاً من الصفحة الرئيسية.")
-        return
-
-    st.markdown("🧠 يمكنك مناقشة نتائج التقييم أو الاستفسار عن محتوى أي عرض.")
-    user_input = st.text_input("🗨️ اكتب سؤالك هنا:")
-
-    if user_input:
-        with st.spinner("🤔 جاري التفكير..."):
-            try:
-                response = client.chat.completions.create(
-                    model="llama-3.1-8b-instant",
-                    messages=[
-                        {"role": "system", "content": "أنت مساعد ذكي متخصص في تحليل العروض ومقارنتها."},
-                        {"role": "user", "content": user_input}
-                    ],
-                    max_tokens=400,
-                    temperature=0.4
-                )
-                st.success(response.choices[0].message.content)
-            except Exception as e:
-                st.error(f"حدث خطأ أثناء المحادثة: {e}")
+import re
+import time
+from collections import deque
+
+import numpy as np
+
+from modules.chunking import estimate_tokens
+from modules.llm import chat_stream
+from modules.prompts import PromptTemplate, bullets
+from modules.retrieval import get_corpus_index
+
+CHAT_TOP_K = int(os.getenv("CHAT_TOP_K", "6"))
+CHAT_MEMORY_TURNS = int(os.getenv("CHAT_MEMORY_TURNS", "4"))
+CHAT_MEMORY_TOKENS = int(os.getenv("CHAT_MEMORY_TOKENS", "1500"))
+CHAT_MAX_TOKENS = int(os.getenv("CHAT_MAX_TOKENS", "600"))
+CHAT_TEMPERATURE = 0.3
+# سجل الجولات المعروض في الواجهة (منفصل عن ذاكرة النموذج، ومحدود أيضًا)
+CHAT_LOG_TURNS = 50
+
+CHAT_TEMPLATE = PromptTemplate("chat", "v1", static="""
+أنت مساعد متخصص في تحليل عروض منافسة ومقارنتها.
+أجب عن سؤال المستخدم اعتمادًا على المصادر المرفقة فقط؛ كل مصدر مقطع من عرض له معرّف مثل [S1]
+مع اسم العرض ورقم الصفحة.
+- اذكر بعد كل معلومة معرّف المصدر الذي تستند إليه بين قوسين مربعين، مثل [S2].
+- إذا لم تتضمن المصادر الإجابة فقل ذلك صراحة ولا تخمّن.
+- عند المقارنة بين العروض اذكر اسم كل عرض.
+- أجب بلغة السؤال وباختصار.
+
+العروض في هذه المنافسة:
+{offers}
+""", dynamic="""
+المصادر:
+{sources}
+
+السؤال: {question}
+""")
+
+_CITE_RE = re.compile(r"\[S(\d+)\]")
+
+
+class ChatSession:
+    """
+    جلسة محادثة على عروض منافسة واحدة.
+      docs: [(name, pages)] حيث pages = [{"page_num", "text"}]
+      for delta in session.stream(question): ... ثم session.turns[-1] (الإجابة، المراجع، القياسات)
+    """
+
+    def __init__(self, docs, backend=None, top_k: int = CHAT_TOP_K, memory_turns: int = CHAT_MEMORY_TURNS,
+                 memory_tokens: int = CHAT_MEMORY_TOKENS):
+        self.backend = backend
+        self.top_k = top_k
+        self.memory_tokens = memory_tokens
+        self.files = [name for name, _ in docs]
+        self.history = deque(maxlen=memory_turns)  # (سؤال، إجابة)
+        self.turns = deque(maxlen=CHAT_LOG_TURNS)
+
+        info = {}
+        t0 = time.perf_counter()
+        self.index = get_corpus_index(docs, info)
+        self._passage_files = np.array([p["file"] for p in self.index.passages], dtype=object)
+        self.index_stats = {
+            "offers": len(docs),
+            "passages": len(self.index.passages),
+            "index_s": round(time.perf_counter() - t0, 3),
+            "index_source": info.get("source"),
+        }
+
+    # ---------- الاسترجاع ----------
+    def retrieve(self, question: str, files=None) -> list:
+        """أفضل top_k مقاطع (مرقّمة S1..) للسؤال؛ سؤال المتابعة يُدمج مع السؤال السابق."""
+        if not self.index.passages:
+            return []
+        query = question if not self.history else f"{question} {self.history[-1][0]}"
+        scores = self.index.scores([query])[0]
+        if files:
+            scores = np.where(np.isin(self._passage_files, list(files)), scores, 0.0)
+        k = min(self.top_k, int((scores > 0).sum()))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {"id": f"S{n + 1}", **self.index.passages[j], "score": round(float(scores[j]), 4)}
+            for n, j in enumerate(top)
+        ]
+
+    # ---------- الذاكرة ----------
+    def _memory_messages(self) -> list:
+        """آخر الجولات بحد memory_tokens (الأحدث أولًا في الحساب، ثم بالترتيب الزمني)."""
+        kept, used = [], 0
+        for q, a in reversed(self.history):
+            cost = estimate_tokens(q) + estimate_tokens(a)
+            if kept and used + cost > self.memory_tokens:
+                break
+            kept.append((q, a))
+            used += cost
+        out = []
+        for q, a in reversed(kept):
+            out += [{"role": "user", "content": q}, {"role": "assistant", "content": a}]
+        return out
+
+    def _messages(self, question: str, sources: list) -> list:
+        blocks = "\n\n".join(f"[{s['id']}] ({s['file']} — ص {s['page_num']})\n{s['text']}" for s in sources)
+        system, user = CHAT_TEMPLATE.messages(
+            {"offers": bullets(self.files)},
+            sources=blocks or "(لا توجد مقاطع ذات صلة)", question=question,
+        )
+        return [system, *self._memory_messages(), user]
+
+    # ---------- السؤال ----------
+    def stream(self, question: str, files=None):
+        """يعيد أجزاء الإجابة فور وصولها، ويُسجَّل الدور كاملًا في turns بعد الانتهاء."""
+        t0 = time.perf_counter()
+        sources = self.retrieve(question, files)
+        retrieval_ms = (time.perf_counter() - t0) * 1000
+        messages = self._messages(question, sources)
+
+        call = chat_stream("chatbot", messages, temperature=CHAT_TEMPERATURE, max_tokens=CHAT_MAX_TOKENS,
+                           backend=self.backend)
+        yield from call
+        answer = call.text
+
+        by_id = {s["id"]: s for s in sources}
+        cited = [by_id[f"S{n}"] for n in dict.fromkeys(_CITE_RE.findall(answer)) if f"S{n}" in by_id]
+        memory = messages[1:-1]
+        self.history.append((question, answer))
+        self.turns.append({
+            "question": question,
+            "answer": answer,
+            "citations": [{"id": s["id"], "file": s["file"], "page": s["page_num"]} for s in cited],
+            "sources": sources,
+            "stats": {
+                "retrieval_ms": round(retrieval_ms, 2),
+                "ttft_s": round(call.ttft_s, 3) if call.ttft_s is not None else None,
+                "total_s": round(call.total_s, 3) if call.total_s is not None else None,
+                "static_tokens": estimate_tokens(messages[0]["content"]),
+                "memory_tokens": sum(estimate_tokens(m["content"]) for m in memory),
+                "memory_turns": len(memory) // 2,
+                "prompt_tokens": sum(estimate_tokens(m["content"]) for m in messages),
+                "completion_tokens": estimate_tokens(answer),
+            },
+        })
+
+    def ask(self, question: str, files=None) -> dict:
+        for _ in self.stream(question, files):
+            pass
+        return self.turns[-1]
+
+    def reset(self):
+        self.history.clear()
+        self.turns.clear()
+
+    def turn_stats(self) -> list:
+        return [{"question": t["question"][:60], **t["stats"]} for t in self.turns]
@@ -0,0 +1,137 @@
+# modules/chunking.py
+"""
+تقسيم المستند إلى أجزاء محدودة بعدد التوكنات مع الحفاظ على أرقام الصفحات،
+وتقدير التوكنات/التكلفة/الزمن قبل إرسال أي طلب للنموذج.
+"""
+import os
+import re
+
+# حجم الجزء الافتراضي (توكنات نص العرض فقط، بدون التعليمات)
+DEFAULT_CHUNK_TOKENS = int(os.getenv("EVAL_CHUNK_TOKENS", "6000"))
+# حجم "الصفحة" الافتراضية لملفات DOCX (لا تحتوي أرقام صفحات حقيقية)
+DOCX_PAGE_CHARS = 3000
+
+_AR_RE = re.compile(r"[\u0600-\u06FF\u0750-\u077F\uFB50-\uFDFF\uFE70-\uFEFF]")
+
+
+# ============================================================
+# 🔢 تقدير عدد التوكنات
+# ============================================================
+def estimate_tokens(text: str) -> int:
+    """
+    تقدير سريع بدون tokenizer: النص العربي يُقسَّم لتوكنات أكثر بكثير من الإنجليزي
+    في نماذج Llama (~2.5 حرف/توكن مقابل ~4).
+    """
+    if not text:
+        return 0
+    ar = len(_AR_RE.findall(text))
+    return int(ar / 2.5 + (len(text) - ar) / 4) + 1
+
+
+# ============================================================
+# 📄 الصفحات والأجزاء
+# ============================================================
+def pages_from_payload(payload) -> list:
+    """
+    ناتج extract_text_with_pages → قائمة صفحات [{"page_num", "text"}].
+    DOCX لا يحتوي صفحات، فيُقسَّم إلى صفحات تقريبية (~3000 حرف) على حدود الفقرات.
+    """
+    if isinstance(payload, dict) and payload.get("type") == "pdf":
+        return [p for p in payload.get("pages", []) if p.get("text", "").strip()]
+    if isinstance(payload, dict):
+        text = payload.get("text", "")
+    else:
+        text = str(payload or "")
+    return pages_from_text(text)
+
+
+def pages_from_text(text: str, page_chars: int = DOCX_PAGE_CHARS) -> list:
+    pages, buf, size = [], [], 0
+    for para in text.split("\n"):
+        buf.append(para)
+        size += len(para) + 1
+        if size >= page_chars:
+            pages.append({"page_num": len(pages) + 1, "text": "\n".join(buf)})
+            buf, size = [], 0
+    if "".join(buf).strip():
+        pages.append({"page_num": len(pages) + 1, "text": "\n".join(buf)})
+    return pages
+
+
+def _split_long_page(page: dict, max_tokens: int) -> list:
+    """صفحة واحدة أكبر من الميزانية تُقسَّم على حدود الأسطر."""
+    parts, buf, size = [], [], 0
+    for line in page["text"].split("\n"):
+        t = estimate_tokens(line)
+        if buf and size + t > max_tokens:
+            parts.append("\n".join(buf))
+            buf, size = [], 0
+        buf.append(line)
+        size += t
+    if buf:
+        parts.append("\n".join(buf))
+    return [{"page_num": page["page_num"], "text": p} for p in parts]
+
+
+def chunk_pages(pages, max_tokens: int = DEFAULT_CHUNK_TOKENS) -> list:
+    """
+    تجميع صفحات متتالية في أجزاء لا تتجاوز max_tokens.
+    كل جزء: {"chunk_id", "start_page", "end_page", "tokens", "text"}
+    والنص معلّم بـ [[PAGE:n]] حتى يستطيع النموذج ذكر الصفحات.
+    """
+    chunks, cur, cur_tokens = [], [], 0
+
+    def _flush():
+        if cur:
+            chunks.append({
+                "chunk_id": len(chunks),
+                "start_page": cur[0]["page_num"],
+                "end_page": cur[-1]["page_num"],
+                "tokens": cur_tokens,
+                "text": "\n\n".join(f"[[PAGE:{p['page_num']}]]\n{p['text']}" for p in cur),
+            })
+
+    for page in pages:
+        for piece in _split_long_page(page, max_tokens):
+            t = estimate_tokens(piece["text"]) + 6  # + علامة الصفحة
+            if cur and cur_tokens + t > max_tokens:
+                _flush()
+                cur, cur_tokens = [], 0
+            cur.append(piece)
+            cur_tokens += t
+    _flush()
+    return chunks
+
+
+# ============================================================
+# 💰 تقدير التكلفة والزمن لكل مستند
+# ============================================================
+# قيم افتراضية قابلة للضبط (Groq llama-3.1-8b-instant تقريبًا)
+PRICE_IN_PER_M = float(os.getenv("LLM_PRICE_IN_PER_M", "0.05"))
+PRICE_OUT_PER_M = float(os.getenv("LLM_PRICE_OUT_PER_M", "0.08"))
+OUTPUT_TOKENS_PER_SEC = float(os.getenv("LLM_OUTPUT_TPS", "500"))
+PROMPT_TOKENS_PER_SEC = float(os.getenv("LLM_PROMPT_TPS", "5000"))
+
+
+def estimate_document(pages, n_criteria: int, instructions_tokens: int = 400,
+                      out_tokens_per_criterion: int = 80, max_tokens: int = DEFAULT_CHUNK_TOKENS,
+                      parallel: int = 1) -> dict:
+    """عدد الأجزاء/الطلبات والتوكنات والتكلفة والزمن المتوقع لتقييم مستند واحد."""
+    chunks = chunk_pages(pages, max_tokens)
+    calls = len(chunks)
+    prompt = sum(c["tokens"] for c in chunks) + calls * (instructions_tokens + 15 * n_criteria)
+    completion = calls * (out_tokens_per_criterion * n_criteria + 60)
+    per_call = [
+        (c["tokens"] + instructions_tokens) / PROMPT_TOKENS_PER_SEC
+        + (out_tokens_per_criterion * n_criteria + 60) / OUTPUT_TOKENS_PER_SEC
+        for c in chunks
+    ]
+    waves = -(-calls // max(1, parallel)) if calls else 0
+    return {
+        "pages": len(pages),
+        "chunks": calls,
+        "prompt_tokens": prompt,
+        "completion_tokens": completion,
+        "cost_usd": round(prompt / 1e6 * PRICE_IN_PER_M + completion / 1e6 * PRICE_OUT_PER_M, 5),
+        "latency_s": round(max(per_call, default=0) * waves, 1),
+    }
@@ -0,0 +1,230 @@
+# modules/comparison.py
+"""
+مقارنة العروض قسمًا بقسم: عناوين أقسام كل العروض تُجمَّع في مواضيع موحّدة
+(المنهجية، فريق العمل، ...) ثم مصفوفة عروض × مواضيع بملخصات الأقسام وصفحاتها،
+فتعرض الواجهة موضوعًا واحدًا عبر كل العروض دفعة واحدة.
+
+التجميع بدون أي استدعاء للنموذج:
+1. المعجم: العنوان بعد التوحيد (modules.retrieval.tokenize) يحتوي كل كلمات مرادف لموضوع معروف
+   (عربي/إنجليزي) → ذلك الموضوع (الأطول مطابقة أولًا).
+2. التشابه: العناوين المتبقية (بلا تكرار) تُضمَّن دفعة واحدة (modules.retrieval.embed)،
+   وتشابهها مع كل المرادفات عملية مصفوفية واحدة ≥ COMPARE_TOPIC_THRESHOLD → الموضوع.
+3. الباقي يُجمَّع فيما بينه بمصفوفة تشابه واحدة (تجميع قائد ≥ COMPARE_CLUSTER_THRESHOLD)،
+   واسم الموضوع الجديد أكثر عناوينه تكرارًا.
+التكلفة خطية تقريبًا في عدد العناوين المختلفة (لا مقارنات أزواج عبر النموذج).
+"""
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from modules.retrieval import embed, tokenize
+from modules.segmentation import strip_numbering
+
+COMPARE_TOPIC_THRESHOLD = float(os.getenv("COMPARE_TOPIC_THRESHOLD", "0.55"))
+COMPARE_CLUSTER_THRESHOLD = float(os.getenv("COMPARE_CLUSTER_THRESHOLD", "0.6"))
+# المواضيع المكتشفة بالتجميع التي لا تظهر إلا في عرض واحد تُجمع تحت "أخرى" في المصفوفة
+OTHER_TOPIC = "أخرى"
+
+CANONICAL_TOPICS = {
+    "الملخص التنفيذي": ["الملخص التنفيذي", "ملخص تنفيذي", "executive summary", "summary", "overview", "نظرة عامة"],
+    "المقدمة": ["المقدمة", "مقدمة", "تمهيد", "introduction", "preface"],
+    "نبذة عن الشركة": ["نبذة عن الشركة", "عن الشركة", "نبذة عنا", "من نحن", "about us", "company profile",
+                       "company overview", "ملف الشركة"],
+    "فهم المشروع": ["فهم المشروع", "فهمنا للمشروع", "خلفية المشروع", "project understanding", "understanding",
+                    "background"],
+    "الأهداف": ["الأهداف", "أهداف المشروع", "objectives", "goals", "project objectives"],
+    "نطاق العمل": ["نطاق العمل", "نطاق المشروع", "scope", "scope of work", "المتطلبات", "requirements"],
+    "المنهجية": ["المنهجية", "منهجية العمل", "منهجية التنفيذ", "أسلوب التنفيذ", "methodology", "approach",
+                 "technical approach"],
+    "الحل المقترح": ["الحل المقترح", "الحل التقني", "الحل الفني", "المعمارية", "البنية التقنية", "proposed solution",
+                     "technical solution", "solution", "architecture", "solution architecture"],
+    "خطة التنفيذ": ["خطة التنفيذ", "خطة العمل", "مراحل المشروع", "مراحل التنفيذ", "work plan", "implementation plan",
+                    "project plan", "implementation"],
+    "الجدول الزمني": ["الجدول الزمني", "الإطار الزمني", "مدة التنفيذ", "timeline", "schedule", "time plan"],
+    "فريق العمل": ["فريق العمل", "فريق المشروع", "الفريق", "الهيكل التنظيمي", "الكوادر", "team", "project team",
+                   "organization", "staffing"],
+    "الخبرات السابقة": ["الخبرات السابقة", "الخبرات", "المشاريع السابقة", "experience", "references", "case studies",
+                        "past projects"],
+    "إدارة المشروع": ["إدارة المشروع", "حوكمة المشروع", "project management", "governance"],
+    "إدارة المخاطر": ["إدارة المخاطر", "المخاطر", "risk management", "risks"],
+    "ضمان الجودة": ["ضمان الجودة", "إدارة الجودة", "الجودة", "quality assurance", "quality"],
+    "المخرجات": ["المخرجات", "التسليمات", "النتائج المتوقعة", "النتائج", "deliverables", "outcomes", "results"],
+    "التدريب ونقل المعرفة": ["التدريب", "نقل المعرفة", "training", "knowledge transfer"],
+    "الدعم والصيانة": ["الدعم الفني", "الدعم", "الصيانة", "الضمان", "support", "maintenance", "warranty"],
+    "العرض المالي": ["العرض المالي", "التكلفة", "الأسعار", "financial proposal", "pricing", "cost"],
+    "الخاتمة": ["الخاتمة", "خاتمة", "conclusion", "closing"],
+    "الملاحق": ["الملاحق", "ملحق", "المرفقات", "appendix", "appendices", "annex"],
+}
+
+
+def title_key(title: str) -> str:
+    """العنوان الموحّد للمطابقة: بلا ترقيم ولا تشكيل ولا أدوات التعريف/الكلمات الشائعة."""
+    return " ".join(tokenize(strip_numbering(str(title or ""))))
+
+
+_ALIASES = sorted(
+    ((frozenset(title_key(a).split()), topic) for topic, aliases in CANONICAL_TOPICS.items() for a in aliases),
+    key=lambda x: -len(x[0]),
+)
+_alias_matrix = None
+
+
+def _lexicon_topic(key: str):
+    words = set(key.split())
+    for alias, topic in _ALIASES:
+        if alias and alias <= words:
+            return topic
+    return None
+
+
+def _aliases_embedded():
+    """(متجهات كل المرادفات، موضوع كل صف) — تُحسب مرة واحدة للعملية."""
+    global _alias_matrix
+    if _alias_matrix is None:
+        pairs = [(a, topic) for topic, aliases in CANONICAL_TOPICS.items() for a in [topic, *aliases]]
+        _alias_matrix = (embed([a for a, _ in pairs]), np.array([t for _, t in pairs], dtype=object))
+    return _alias_matrix
+
+
+def _leader_clusters(sim: np.ndarray, weights: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    تجميع قائد على مصفوفة تشابه جاهزة: الأكثر تكرارًا يصبح قائدًا أولًا،
+    وكل عنوان ينضم لأول قائد يشبهه ≥ threshold. يعيد رقم المجموعة لكل صف.
+    """
+    labels = np.full(len(sim), -1)
+    for i in np.argsort(-weights, kind="stable"):
+        if labels[i] >= 0:
+            continue
+        members = (labels < 0) & (sim[i] >= threshold)
+        labels[members] = i
+        labels[i] = i
+    return labels
+
+
+def assign_topics(titles) -> tuple:
+    """
+    titles: عناوين الأقسام (من كل العروض). يعيد (الموضوع لكل عنوان، طريقة الإسناد لكل عنوان)
+    حيث الطريقة: lexicon | similarity | cluster.
+    """
+    keys = [title_key(t) for t in titles]
+    counts = Counter(keys)
+    uniq = list(counts)
+    topic = {k: _lexicon_topic(k) for k in uniq}
+    method = {k: "lexicon" for k in uniq if topic[k]}
+
+    rest = [k for k in uniq if not topic[k] and k]
+    if rest:
+        display = {}
+        for t, k in zip(titles, keys):
+            display.setdefault(k, Counter())[strip_numbering(str(t))] += 1
+        vecs = embed([" ".join(display[k]) for k in rest])
+        alias_vecs, alias_topics = _aliases_embedded()
+        sim = vecs @ alias_vecs.T
+        best = sim.argmax(axis=1)
+        hit = sim[np.arange(len(rest)), best] >= COMPARE_TOPIC_THRESHOLD
+        for k, j, ok in zip(rest, best, hit):
+            if ok:
+                topic[k], method[k] = alias_topics[j], "similarity"
+
+        left = [i for i, k in enumerate(rest) if not topic[k]]
+        if left:
+            sub = vecs[left]
+            clusters = _leader_clusters(sub @ sub.T, np.array([counts[rest[i]] for i in left], dtype=float),
+                                        COMPARE_CLUSTER_THRESHOLD)
+            names = {}
+            for pos, c in enumerate(clusters):
+                names.setdefault(c, Counter()).update(display[rest[left[pos]]])
+            for pos, c in enumerate(clusters):
+                k = rest[left[pos]]
+                topic[k], method[k] = names[c].most_common(1)[0][0], "cluster"
+
+    return [topic.get(k) or OTHER_TOPIC for k in keys], [method.get(k, "none") for k in keys]
+
+
+# ============================================================
+# 🧮 مصفوفة العروض × المواضيع
+# ============================================================
+def _pages(start, end) -> str:
+    return f"{start}" if start == end else f"{start}–{end}"
+
+
+class TopicComparison:
+    """
+    topics_by_offer: {اسم العرض: [أقسام analyze_sections_with_pages]} (job_sections / session_state.topics)
+      .sections  DataFrame طويل: offer, section, topic, method, start_page, end_page, summary, content
+      .topics    المواضيع مرتبة بعدد العروض التي تغطيها ثم ترتيب ظهورها
+      .matrix(field)  عروض × مواضيع (ملخصات أو صفحات أو عدد الأقسام)
+      .row(topic)     موضوع واحد عبر كل العروض (للعرض جنبًا إلى جنب)
+    """
+
+    def __init__(self, topics_by_offer: dict):
+        self.offers = list(topics_by_offer)
+        rows = [
+            {"offer": offer, "order": n, **{k: sec.get(k) for k in
+                                            ("section", "heading", "summary", "start_page", "end_page", "content")}}
+            for offer, secs in topics_by_offer.items() for n, sec in enumerate(secs or [])
+        ]
+        df = pd.DataFrame(rows, columns=["offer", "order", "section", "heading", "summary", "start_page",
+                                         "end_page", "content"])
+        df["end_page"] = df["end_page"].fillna(df["start_page"])
+        if len(df):
+            # الاسم المعطى من النموذج أولًا، والعنوان الأصلي عند غيابه
+            titles = [s if isinstance(s, str) and s.strip() else (h or "") for s, h in zip(df["section"], df["heading"])]
+            df["topic"], df["method"] = assign_topics(titles)
+            if len(self.offers) > 1:
+                spread = df.groupby("topic")["offer"].transform("nunique")
+                df.loc[(df["method"] == "cluster") & (spread < 2), "topic"] = OTHER_TOPIC
+        else:
+            df["topic"], df["method"] = [], []
+        self.sections = df
+
+        coverage = df.groupby("topic")["offer"].nunique() if len(df) else pd.Series(dtype=int)
+        first_seen = df.groupby("topic")["order"].median() if len(df) else pd.Series(dtype=float)
+        self.topics = sorted(coverage.index, key=lambda t: (t == OTHER_TOPIC, -coverage[t], first_seen[t]))
+        self.coverage = coverage.reindex(self.topics)
+
+    def matrix(self, field: str = "summary") -> pd.DataFrame:
+        """
+        عروض × مواضيع. field: summary (الملخصات مدمجة) | pages (نطاقات الصفحات) | count (عدد الأقسام).
+        الخلية الفارغة = العرض لا يغطي الموضوع.
+        """
+        df = self.sections
+        if df.empty:
+            return pd.DataFrame(index=self.offers)
+        if field == "count":
+            out = df.pivot_table(index="offer", columns="topic", values="order", aggfunc="count", fill_value=0)
+        else:
+            value = df["summary"].fillna("") if field == "summary" else \
+                [_pages(a, b) for a, b in zip(df["start_page"], df["end_page"])]
+            out = df.assign(value=value).groupby(["offer", "topic"])["value"] \
+                .agg(lambda v: " | ".join(x for x in v if x)).unstack("topic").fillna("")
+        return out.reindex(index=self.offers, columns=self.topics, fill_value=0 if field == "count" else "")
+
+    def row(self, topic: str) -> list:
+        """موضوع واحد لكل عرض بترتيب الرفع: {offer, sections: [...], pages, summary, content} أو sections=[]."""
+        df = self.sections[self.sections["topic"] == topic].sort_values("order")
+        by_offer = dict(tuple(df.groupby("offer", sort=False)))
+        empty = df.iloc[:0]
+        out = []
+        for offer in self.offers:
+            part = by_offer.get(offer, empty)
+            out.append({
+                "offer": offer,
+                "sections": part["section"].tolist(),
+                "pages": ", ".join(_pages(a, b) for a, b in zip(part["start_page"], part["end_page"])),
+                "summary": "\n".join(s for s in part["summary"].fillna("") if s),
+                "content": "\n\n".join(part["content"].fillna("")),
+            })
+        return out
+
+    def stats(self) -> dict:
+        df = self.sections
+        return {
+            "offers": len(self.offers),
+            "sections": len(df),
+            "distinct_titles": int(df["section"].nunique()) if len(df) else 0,
+            "topics": len(self.topics),
+            **(df["method"].value_counts().to_dict() if len(df) else {}),
+        }
@@ -0,0 +1,429 @@
+# modules/criteria.py
+"""
+قراءة معايير التقييم من ملفات Excel الحكومية (كبيرة، متعددة الأوراق، بخلايا مدمجة).
+
+- القراءة متدفقة: openpyxl بوضع read-only، صفًا بعد صف، فلا تُحمَّل الورقة كاملة في الذاكرة.
+- اكتشاف المخطط مرة واحدة: الورقة، صف العناوين (قد تسبقه صفوف عنوان)، وأعمدة
+  المعيار/الوزن/المحور/الترقيم. المخطط والمعايير يُخزَّنان ببصمة محتوى الملف،
+  فرفع نفس الملف مرة أخرى (أو بعد إعادة تشغيل الخادم) لا يُعيد القراءة.
+- الخلايا المدمجة: قيمة الخلية الأولى تُنسخ لكل خلايا النطاق (من <mergeCell> في XML الورقة).
+- الهرمية: أعمدة (محور + معيار فرعي) أو صفوف مرقّمة (1، 1.1، 1.2 ...).
+- load_criteria(xfile) → CriteriaSet، و parse_criteria_from_excel(xfile) → DataFrame
+  (criterion, component, weight, component_weight) كما تتوقعه modules.scoring.
+"""
+import io
+import os
+import re
+import zipfile
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.utils import range_boundaries
+
+from modules.cache import DiskCache, make_key
+from modules.progress import get_reporter
+
+# يُرفع عند تغيير منطق الاكتشاف أو الهرمية (يُبطل المخططات المخزنة)
+PARSER_VERSION = "v1"
+# عدد الصفوف الأولى من كل ورقة التي يُبحث فيها عن صف العناوين
+HEADER_SCAN_ROWS = int(os.getenv("CRITERIA_HEADER_SCAN_ROWS", "25"))
+
+_CRITERIA_KEYS = ["criterion", "criteria", "المعيار", "Component", "Sub-criterion"]
+_WEIGHT_KEYS = ["weight", "الوزن", "وزن", "%", "نسبة", "marks", "points"]
+_COMPONENT_KEYS = ["component", "المحور", "المكون"]
+_SUB_KEYS = ["sub", "الفرعي"]
+_NUMBER_KEYS = {"م", "#", "no", "no.", "رقم", "الرقم", "ت", "s/n", "item", "البند"}
+_TOTAL_KEYS = ("المجموع", "الإجمالي", "total")
+_SHEET_HINTS = ["Project", "Evaluation", "التقييم", "المعايير", "Criteria"]
+
+DEFAULT_CRITERIA = [
+    "جودة الحل المقترح","المنهجية الفنية","الخبرة السابقة","خطة التنفيذ",
+    "فريق العمل","الابتكار في الحل","إدارة المشروع","الامتثال للمتطلبات",
+]
+
+criteria_cache = DiskCache("criteria")
+_memo = OrderedDict()  # بصمة الملف → CriteriaSet (داخل العملية)
+_MEMO_MAX = 32
+_memo_lock = threading.Lock()
+
+
+# ============================================================
+# 🧾 البنية المُعادة
+# ============================================================
+@dataclass(frozen=True)
+class Criterion:
+    name: str
+    component: Optional[str] = None
+    weight: float = float("nan")            # وزن المعيار (داخل محوره إن وُجد)
+    component_weight: float = float("nan")  # وزن المحور
+    row: Optional[int] = None               # رقم الصف في الورقة (للتتبّع)
+
+
+@dataclass
+class CriteriaSet:
+    items: list
+    sheet: Optional[str] = None
+    header_row: Optional[int] = None
+    schema: dict = field(default_factory=dict)
+    source: Optional[str] = None  # بصمة محتوى الملف
+    default: bool = False         # True = تعذّرت القراءة واستُخدمت القائمة الافتراضية
+
+    @property
+    def names(self) -> list:
+        return [c.name for c in self.items]
+
+    def to_frame(self) -> pd.DataFrame:
+        df = pd.DataFrame(
+            [(c.name, c.component, c.weight, c.component_weight) for c in self.items],
+            columns=["criterion", "component", "weight", "component_weight"],
+        )
+        df.attrs.update(sheet=self.sheet, header_row=self.header_row, source=self.source, default=self.default)
+        return df
+
+    def to_dict(self) -> dict:
+        """للتخزين: المعايير كصفوف قوائم (أصغر بكثير من قاموس لكل معيار)."""
+        return {**{f.name: getattr(self, f.name) for f in fields(self) if f.name != "items"},
+                "items": [[c.name, c.component, c.weight, c.component_weight, c.row] for c in self.items]}
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "CriteriaSet":
+        return cls(**{**d, "items": [Criterion(*c) for c in d["items"]]})
+
+
+def _default_set(source=None) -> CriteriaSet:
+    return CriteriaSet([Criterion(n) for n in DEFAULT_CRITERIA], source=source, default=True)
+
+
+# ============================================================
+# 🔧 أدوات القيم
+# ============================================================
+_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
+_OUTLINE_RE = re.compile(r"^\s*(\d+(?:\s*[.\-]\s*\d+)*)\s*[.)\-–:]?\s+(?=\S)")
+
+
+def _has(col, keys) -> bool:
+    return any(k.lower() in str(col).lower() for k in keys)
+
+
+def _clean(v) -> str:
+    v = "" if v is None or (isinstance(v, float) and np.isnan(v)) else str(v).strip()
+    return v if v and v.lower() not in {"nan", "none"} and len(v) > 1 else ""
+
+
+def _number(v) -> float:
+    """"20%" / "20" / 0.2 → رقم (النسب المئوية والكسور تُطبَّع لاحقًا في modules.scoring)."""
+    if v is None or isinstance(v, bool):
+        return float("nan")
+    if isinstance(v, (int, float)):
+        return float(v)
+    try:
+        return float(str(v).translate(_DIGITS).replace("%", "").replace(",", ".").strip())
+    except ValueError:
+        return float("nan")
+
+
+def _outline(v) -> Optional[str]:
+    """ترقيم هرمي من عمود الترقيم أو بداية النص: 1 / 1.2 / 1-2-3 → "1.2.3"."""
+    if v is None:
+        return None
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return str(int(v)) if float(v).is_integer() else repr(float(v))
+    m = re.fullmatch(r"\s*(\d+(?:\s*[.\-]\s*\d+)*)\s*[.)]?\s*", str(v).translate(_DIGITS))
+    return re.sub(r"\s*[.\-]\s*", ".", m.group(1)) if m else None
+
+
+def _is_total(name: str) -> bool:
+    return name.lower().startswith(_TOTAL_KEYS)
+
+
+# ============================================================
+# 📖 القراءة المتدفقة والخلايا المدمجة
+# ============================================================
+_MERGE_RE = re.compile(rb'<(?:\w+:)?mergeCell\s[^>]*?ref="([A-Z]+[0-9]+:[A-Z]+[0-9]+)"')
+
+
+def _merged_ranges(archive: zipfile.ZipFile, path: str) -> list:
+    """
+    نطاقات الدمج (min_col, min_row, max_col, max_row) بمسح نصي متدفق لـ XML الورقة
+    (openpyxl لا يعرضها بوضع read-only، وتحليل XML كامل ثانٍ أبطأ بكثير).
+    """
+    out, tail = [], b""
+    with archive.open(path) as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            buf = tail + block
+            cut = buf.rfind(b"<")  # لا تطابق يعبر آخر "<" — الباقي يُكمل مع الدفعة التالية
+            out += [range_boundaries(m.decode()) for m in _MERGE_RE.findall(buf, 0, max(cut, 0))]
+            tail = buf[cut:] if cut >= 0 else b""
+    out += [range_boundaries(m.decode()) for m in _MERGE_RE.findall(tail)]
+    return out
+
+
+def _filled_rows(rows, merged):
+    """(رقم الصف، القيم) مع نسخ قيمة أول خلية في كل نطاق دمج إلى بقية خلاياه."""
+    by_start = {}
+    for b in merged:
+        by_start.setdefault(b[1], []).append(b)
+    active = []  # [min_col, max_col, max_row, value]
+    for r, values in enumerate(rows, start=1):
+        starts = by_start.pop(r, ())
+        if not starts and not active:
+            yield r, values
+            continue
+        values = list(values)
+        for min_col, min_row, max_col, max_row in starts:
+            value = values[min_col - 1] if min_col <= len(values) else None
+            active.append([min_col, max_col, max_row, value])
+        for min_col, max_col, max_row, value in active:
+            if len(values) < max_col:
+                values += [None] * (max_col - len(values))
+            for c in range(min_col - 1, max_col):
+                if values[c] is None:
+                    values[c] = value
+        active = [a for a in active if a[2] > r]
+        yield r, values
+
+
+class _Book:
+    """مصدر الأوراق: xlsx متدفق عبر openpyxl، و xls القديم عبر pandas (صغير بطبيعته)."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.is_xlsx = data[:2] == b"PK"
+        if self.is_xlsx:
+            self.wb = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+            self.archive = zipfile.ZipFile(io.BytesIO(data))
+            self.sheet_names = self.wb.sheetnames
+        else:
+            self.frames = pd.read_excel(io.BytesIO(data), sheet_name=None, header=None)
+            self.sheet_names = list(self.frames)
+
+    def rows(self, sheet: str, merged: bool = True, limit: int = None):
+        if not self.is_xlsx:
+            values = self.frames[sheet].astype(object).where(self.frames[sheet].notna(), None)
+            it = enumerate(values.itertuples(index=False, name=None), start=1)
+            yield from (it if limit is None else (x for x in it if x[0] <= limit))
+            return
+        ws = self.wb[sheet]
+        ws.reset_dimensions()  # الأبعاد المكتوبة في بعض الملفات خاطئة وتقطع الأعمدة
+        ranges = _merged_ranges(self.archive, ws._worksheet_path) if merged else []
+        for r, values in _filled_rows(ws.iter_rows(max_row=limit, values_only=True), ranges):
+            yield r, values
+
+    def close(self):
+        if self.is_xlsx:
+            self.wb.close()
+            self.archive.close()
+
+
+# ============================================================
+# 🔎 اكتشاف المخطط
+# ============================================================
+def _detect_columns(header) -> dict:
+    """أعمدة (أرقام 0..) المعيار/الوزن/المحور/المعيار الفرعي/الترقيم من صف العناوين."""
+    cols = [(i, str(v).strip()) for i, v in enumerate(header) if v is not None and str(v).strip()]
+    names = dict(cols)
+    weights = [i for i, h in cols if _has(h, _WEIGHT_KEYS)]
+    comp = next((i for i, h in cols if _has(h, _COMPONENT_KEYS) and not _has(h, _SUB_KEYS) and i not in weights),
+                None)
+    crit = [i for i, h in cols if (_has(h, _CRITERIA_KEYS) or i == comp) and i not in weights]
+    sub = next((i for i in crit if _has(names[i], _SUB_KEYS)), None)
+    schema = {
+        "criteria": crit, "weights": weights, "component": comp, "sub": sub,
+        "number": next((i for i, h in cols if h.lower().strip(" :") in _NUMBER_KEYS), None),
+        "headers": {str(i): names[i] for i in crit + weights},
+    }
+    if comp is not None and sub is not None:
+        # عمود الوزن قبل عمود المعيار الفرعي (أو باسم المحور) = وزن المحور، وما بعده = وزن المعيار
+        schema["component_weight"] = next((i for i in weights if _has(names[i], _COMPONENT_KEYS) or i < sub), None)
+        schema["sub_weight"] = next((i for i in weights if i != schema["component_weight"] and i > sub), None)
+    return schema
+
+
+def detect_schema(book: _Book) -> dict:
+    """
+    أفضل (ورقة، صف عناوين) في أول HEADER_SCAN_ROWS صفًا من كل ورقة:
+    عدد أعمدة المعايير ×2 + أعمدة الوزن، والتعادل لصالح الأوراق ذات الأسماء المعروفة ثم الأولى.
+    """
+    best, best_score = None, (0, 0)
+    for order, sheet in enumerate(book.sheet_names):
+        hint = int(any(h.lower() in sheet.lower() for h in _SHEET_HINTS))
+        for r, values in book.rows(sheet, merged=False, limit=HEADER_SCAN_ROWS):
+            schema = _detect_columns(values)
+            if not schema["criteria"]:
+                continue
+            score = (2 * len(schema["criteria"]) + len(schema["weights"]), hint)
+            if score > best_score:
+                best, best_score = {**schema, "sheet": sheet, "header_row": r}, score
+    return best
+
+
+# ============================================================
+# 🌳 الصفوف → المعايير
+# ============================================================
+def _cell(values, i):
+    return values[i] if i is not None and i < len(values) else None
+
+
+def _hierarchical_columns(rows, s) -> list:
+    """محور + معيار فرعي في عمودين: المحور يُملأ للأسفل، ووزنه مكتوب مرة واحدة لكل محور."""
+    items, comp, comp_w, order = [], None, {}, []
+    for r, values in rows:
+        c = _clean(_cell(values, s["component"]))
+        if c and not _is_total(c):
+            comp = c
+            if comp not in comp_w:
+                comp_w[comp] = float("nan")
+                order.append((comp, r))
+        w = _number(_cell(values, s.get("component_weight")))
+        if comp and np.isnan(comp_w[comp]) and not np.isnan(w):
+            comp_w[comp] = w
+        sub = _clean(_cell(values, s["sub"]))
+        if sub and not _is_total(sub):
+            items.append((sub, comp, _number(_cell(values, s.get("sub_weight"))), r))
+    out = [Criterion(n, c, w, comp_w.get(c, float("nan")), r) for n, c, w, r in items]
+    # محور بلا معايير فرعية → المحور نفسه معيار
+    covered = {c.component for c in out}
+    out += [Criterion(c, c, float("nan"), comp_w[c], r) for c, r in order if c not in covered]
+    return out
+
+
+def _outline_rows(rows, s):
+    """صفوف مرقّمة (1، 1.1 ...) في عمود معيار واحد → [(رقم، اسم، وزن، صف)] أو None إن لم تكن هرمية."""
+    col, wcol = s["criteria"][0], (s["weights"] or [None])[0]
+    out = []
+    for r, values in rows:
+        raw = _cell(values, col)
+        name = _clean(raw)
+        if not name or _is_total(name):
+            continue
+        num = _outline(_cell(values, s["number"]))
+        if num is None:
+            m = _OUTLINE_RE.match(name.translate(_DIGITS))
+            if m:
+                num = re.sub(r"\s*[.\-]\s*", ".", m.group(1))
+                name = name[m.end():].strip()
+        out.append((num, name, _number(_cell(values, wcol)), r))
+    numbered = [o for o in out if o[0]]
+    nums = {o[0] for o in numbered}
+    nested = any("." in n and n.rsplit(".", 1)[0] in nums for n in nums)
+    return out if nested and len(numbered) * 2 >= len(out) else None
+
+
+def _hierarchical_outline(out) -> list:
+    """الأوراق (بلا أبناء) معايير، والمحور = الجد الأعلى ووزنه وزن المحور."""
+    nums = {n for n, _, _, _ in out if n}
+    top = {n: (name, w) for n, name, w, _ in out if n and "." not in n}
+    parents = {n.rsplit(".", 1)[0] for n in nums if "." in n}
+    items = []
+    for n, name, w, r in out:
+        if n in parents:
+            continue
+        root = n.split(".")[0] if n else None
+        comp, comp_w = top.get(root, (None, float("nan")))
+        if n and "." not in n:  # محور بلا أبناء → المعيار نفسه
+            comp, w, comp_w = name, float("nan"), w
+        items.append(Criterion(name, comp, w, comp_w, r))
+    return items
+
+
+def _flat(rows, s) -> list:
+    wcol = (s["weights"] or [None])[0]
+    rows = list(rows)
+    items = []
+    for col in s["criteria"]:
+        for r, values in rows:
+            name = _clean(_cell(values, col))
+            if name and not _is_total(name):
+                items.append(Criterion(name, None, _number(_cell(values, wcol)), float("nan"), r))
+    return items
+
+
+def _read_criteria(book: _Book, schema: dict) -> list:
+    rows = ((r, v) for r, v in book.rows(schema["sheet"]) if r > schema["header_row"])
+    if schema["component"] is not None and schema["sub"] is not None:
+        return _hierarchical_columns(rows, schema)
+    rows = list(rows)
+    outline = _outline_rows(rows, schema) if len(schema["criteria"]) == 1 else None
+    if outline:
+        return _hierarchical_outline(outline)
+    return _flat(rows, schema)
+
+
+# ============================================================
+# 📥 نقطة الدخول
+# ============================================================
+def _read_bytes(xfile) -> bytes:
+    if isinstance(xfile, (str, os.PathLike)):
+        with open(xfile, "rb") as f:
+            return f.read()
+    if isinstance(xfile, (bytes, bytearray)):
+        return bytes(xfile)
+    pos = xfile.tell()
+    xfile.seek(0)
+    data = xfile.read()
+    xfile.seek(pos)
+    return data
+
+
+def load_criteria(xfile) -> CriteriaSet:
+    """
+    xfile: مسار، bytes، أو كائن ملف (UploadedFile).
+    المخطط المكتشف والمعايير مخزّنة ببصمة المحتوى (في العملية وعلى القرص).
+    """
+    data = _read_bytes(xfile)
+    digest = hashlib.md5(data).hexdigest()
+    with _memo_lock:
+        if digest in _memo:
+            _memo.move_to_end(digest)
+            return _memo[digest]
+
+    key = make_key("criteria", digest, PARSER_VERSION)
+    stored = criteria_cache.get(key)
+    if stored is not None:
+        result = CriteriaSet.from_dict(stored)
+    else:
+        result = _parse(data, digest)
+        if not result.default:
+            criteria_cache.set(key, result.to_dict())
+
+    with _memo_lock:
+        _memo[digest] = result
+        if len(_memo) > _MEMO_MAX:
+            _memo.popitem(last=False)
+    return result
+
+
+def _parse(data: bytes, digest: str) -> CriteriaSet:
+    try:
+        book = _Book(data)
+        try:
+            schema = detect_schema(book)
+            items = _read_criteria(book, schema) if schema else []
+        finally:
+            book.close()
+    except Exception as e:
+        get_reporter().warning(f"⚠️ تعذر قراءة Excel ({e})، سيتم استخدام قائمة افتراضية.")
+        return _default_set(digest)
+    if not items:
+        return _default_set(digest)
+    seen, unique = set(), []
+    for c in items:
+        if c.name not in seen:
+            seen.add(c.name)
+            unique.append(c)
+    return CriteriaSet(unique, sheet=schema["sheet"], header_row=schema["header_row"], schema=schema, source=digest)
+
+
+def parse_criteria_from_excel(xfile) -> pd.DataFrame:
+    """
+    استخراج المعايير وأوزانها من ملف Excel.
+    يعيد DataFrame: criterion (نص المعيار)، component (المحور أو None)، weight، component_weight
+    (NaN إذا لم توجد أوزان — انظر modules.scoring.effective_weights).
+    """
+    return load_criteria(xfile).to_frame()
@@ -1,78 +1,252 @@
 # modules/evaluator.py
-import streamlit as st
+import numpy as np
 import pandas as pd
-import json, re, os
-from groq import Groq
-from dotenv import load_dotenv
+import json, os, logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from langdetect import detect
-from deep_translator import GoogleTranslator
-from modules.extractors import extract_text_with_pages  # التحديث هنا
-
-# تحميل مفتاح Groq من .env
-load_dotenv()
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+from modules.extractors import extract_text_with_pages, extraction_summary  # التحديث هنا
+from modules.llm import chat, get_backend, model_for
+from modules.cells import cell_cache, offer_hash, load_cells, save_cells, load_comment, save_comment, record_cells
+from modules.chunking import chunk_pages, pages_from_payload, pages_from_text, DEFAULT_CHUNK_TOKENS
+from modules.retrieval import get_index
+from modules import tracing
+from modules.progress import get_reporter, log
+from modules.translation import translate_many
+from modules.structured import request_scores, request_packed_scores, parse_metrics
+from modules.prompts import PromptTemplate, bullets
+from modules.scoring import score_matrix, rank_table
 
 # ===========================================================
 # 🔤 دالة اكتشاف اللغة وترجمة المعايير عند الحاجة
 # ===========================================================
-def translate_if_needed(criteria_list, text):
-    """إذا كان العرض باللغة الإنجليزية، تُترجم المعايير تلقائيًا للإنجليزية"""
+def translate_if_needed(criteria_list, text, run_state: dict = None):
+    """
+    إذا كان العرض باللغة الإنجليزية، تُترجم المعايير تلقائيًا للإنجليزية.
+    تعيد قائمة جديدة (القائمة الأصلية لا تتغير)، والترجمة مجمّعة في طلب واحد ومخزّنة
+    في الكاش، فالعروض الإنجليزية التالية بنفس المعايير لا تستدعي المترجم.
+    run_state: حالة تشغيل واحد (evaluate_offers أو مهمة خلفية)؛ عند فشل الترجمة يُسجَّل سببه فيها
+    فتُستخدم المعايير العربية لبقية عروض هذا التشغيل فقط دون إعادة طلب المترجم.
+    """
     try:
         sample = text[:1000]
-        lang = detect(sample)
-        if lang == "en":
-            st.info("🔤 تم اكتشاف أن العرض باللغة الإنجليزية، يتم الآن ترجمة المعايير تلقائيًا...")
-            translated = [
-                GoogleTranslator(source="ar", target="en").translate(c)
-                for c in criteria_list
-            ]
-            return translated, "en"
-        else:
-            return criteria_list, "ar"
+        with tracing.span("lang.detect", chars=len(sample)) as sp:
+            lang = detect(sample)
+            sp.set(lang=lang)
     except Exception as e:
-        st.warning(f"⚠️ لم يتم تحديد اللغة بدقة ({e})، سيتم استخدام المعايير كما هي.")
+        get_reporter().warning(f"⚠️ لم يتم تحديد اللغة بدقة ({e})، سيتم استخدام المعايير كما هي.")
+        return criteria_list, "ar"
+    if lang != "en":
         return criteria_list, "ar"
 
+    failure = (run_state or {}).get("translate_error")
+    if failure:
+        get_reporter().warning(f"⚠️ العرض باللغة الإنجليزية لكن ترجمة المعايير فشلت سابقًا في هذا التشغيل ({failure})، "
+                               "سيتم استخدام المعايير العربية.")
+        return criteria_list, "ar"
+    get_reporter().info("🔤 تم اكتشاف أن العرض باللغة الإنجليزية، يتم الآن ترجمة المعايير تلقائيًا...")
+    try:
+        translated = translate_many(criteria_list, source="ar", target="en")
+    except Exception as e:
+        if run_state is not None:
+            run_state["translate_error"] = str(e)
+        get_reporter().warning(f"⚠️ فشلت ترجمة المعايير ({e})، سيتم استخدام المعايير العربية لبقية هذا التشغيل.")
+        return criteria_list, "ar"
+    return translated, "en"
+
 
 # ===========================================================
-# 🧠 الدالة الأساسية لتقييم العروض بالذكاء الاصطناعي
+# 🧾 أدوات مساعدة: النص، التوجيه، وتقييم عرض واحد
 # ===========================================================
-@st.cache_data(show_spinner=False)
-def evaluate_offers(offers, criteria_list):
-    results, details = [], {}
+# عدد العروض التي تُرسل للنموذج في نفس الوقت (1 = تسلسلي كما كان سابقًا)
+DEFAULT_MAX_WORKERS = int(os.getenv("EVAL_MAX_WORKERS", "4"))
 
-    for f in offers:
-        with st.spinner(f"🔍 يتم تحليل العرض: {f.name}"):
-
-            # ✅ تحديث: التعامل مع extract_text_with_pages
-            data = extract_text_with_pages(f)
-            if isinstance(data, dict):
-                if data.get("type") == "pdf":
-                    text = "\n".join(p["text"] for p in data.get("pages", []))
-                elif data.get("type") == "docx":
-                    text = data.get("text", "")
-                else:
-                    text = ""
-            else:
-                text = str(data)
+EVAL_TEMPERATURE = 0.3
+# عدد أجزاء العرض الواحد التي تُقيَّم بالتوازي (map)
+EVAL_CHUNK_WORKERS = int(os.getenv("EVAL_CHUNK_WORKERS", "4"))
+# chunked = كل النص (map-reduce) | retrieval = أفضل k مقاطع لكل معيار
+EVAL_STRATEGIES = ("chunked", "retrieval")
+EVAL_STRATEGY = os.getenv("EVAL_STRATEGY", "chunked")
+EVAL_TOP_K = int(os.getenv("EVAL_TOP_K", "4"))
+# التجميع (pack): عدة عروض قصيرة في طلب واحد حتى هذه الميزانية من توكنات النص
+EVAL_PACK_TOKENS = int(os.getenv("EVAL_PACK_TOKENS", str(DEFAULT_CHUNK_TOKENS)))
+# العرض "قصير" إذا لم يتجاوز هذا الحد (افتراضيًا نصف الميزانية حتى يتسع الطلب لعرضين على الأقل)
+EVAL_PACK_SMALL_TOKENS = int(os.getenv("EVAL_PACK_SMALL_TOKENS", str(EVAL_PACK_TOKENS // 2)))
+# سقف توكنات الرد لطلب مجمّع واحد (كل عرض ≈ سطر JSON لكل معيار)
+EVAL_PACK_MAX_OUTPUT = int(os.getenv("EVAL_PACK_MAX_OUTPUT", "6000"))
+OUTPUT_TOKENS_PER_CRITERION = 90
+
+
+# القوالب: التعليمات والمخطط والمعايير أولًا (بادئة ثابتة لكل العروض)، ونص العرض في النهاية
+CHUNK_TEMPLATE = PromptTemplate("eval-chunk", "v4", static="""
+أنت خبير تقييم عروض فنية وتقنية.
+ستُرسل إليك أجزاء من عرض فني، وكل صفحة تبدأ بعلامة [[PAGE:n]].
+قيّم ما ورد في الجزء المرسل فقط بناءً على المعايير التالية:
+
+لكل معيار:
+- ضع درجة من 1 إلى 4 (1 = ضعيف، 4 = ممتاز)، أو 0 إذا لم يتناول هذا الجزء المعيار إطلاقًا
+- اكتب السؤال الذي طرحته على نفسك لتقييمه (ai_question)
+- اشرح السبب المنطقي للدرجة مستندًا إلى النص (reason)
+- اذكر أرقام الصفحات التي ورد فيها الدليل (pages)
+
+بعد الانتهاء من المعايير، أضف في النهاية مفتاحًا جديدًا باسم:
+"overall_comment": يحتوي على ملاحظات عامة مختصرة عن هذا الجزء.
+
+أعد النتيجة بصيغة JSON فقط كالتالي:
+{{
+  "scores": [
+    {{
+      "criterion": "اسم المعيار",
+      "score": رقم من 0 إلى 4,
+      "ai_question": "السؤال الذي طرحه المقيم",
+      "reason": "السبب المنطقي للتقييم",
+      "pages": [أرقام الصفحات]
+    }}
+  ],
+  "overall_comment": "ملاحظات عامة عن هذا الجزء"
+}}
+
+المعايير:
+{criteria}
+
+رجاءً أعد النتيجة بالعربية فقط.
+""", dynamic="""
+نص الجزء {part} من {n_parts} (الصفحات {start_page}–{end_page}):
+{text}
+""")
 
-            if not text.strip():
-                st.warning(f"⚠️ لم يتم استخراج نص من الملف: {f.name}")
+
+def _build_prompt(criteria_list, chunk: dict, n_chunks: int) -> list:
+    return CHUNK_TEMPLATE.messages(
+        {"criteria": bullets(criteria_list)},
+        part=chunk["chunk_id"] + 1, n_parts=n_chunks,
+        start_page=chunk["start_page"], end_page=chunk["end_page"], text=chunk["text"],
+    )
+
+
+def _norm(s) -> str:
+    return " ".join(str(s).split())
+
+
+def _reduce_chunks(criteria_list, chunks, chunk_data) -> dict:
+    """
+    دمج نتائج الأجزاء (reduce): لكل معيار تُؤخذ أعلى درجة حصل عليها في أي جزء
+    مع سببها، وتُجمع صفحات الأدلة من كل الأجزاء التي تناولته.
+    """
+    merged = []
+    for i, crit in enumerate(criteria_list):
+        found = []
+        for chunk, data in zip(chunks, chunk_data):
+            if not data:
                 continue
+            rows = data.get("scores", []) or []
+            row = next((r for r in rows if _norm(r.get("criterion", "")) == _norm(crit)), None)
+            if row is None and i < len(rows) and len(rows) == len(criteria_list):
+                row = rows[i]
+            if row is None:
+                continue
+            score = pd.to_numeric(row.get("score"), errors="coerce")
+            score = 0 if pd.isna(score) else float(score)
+            pages = [int(p) for p in (row.get("pages") or []) if str(p).isdigit()] or \
+                list(range(chunk["start_page"], chunk["end_page"] + 1))
+            found.append((score, row, pages))
+
+        addressed = [f for f in found if f[0] > 0]
+        if addressed:
+            best = max(addressed, key=lambda f: f[0])
+            pages = sorted({p for f in addressed for p in f[2]})
+            merged.append({
+                "criterion": crit,
+                "score": best[0],
+                "ai_question": best[1].get("ai_question", "—"),
+                "reason": best[1].get("reason", "—"),
+                "pages": ", ".join(str(p) for p in pages),
+            })
+        else:
+            merged.append({
+                "criterion": crit, "score": 1,
+                "ai_question": "—", "reason": "لم يرد ما يغطي هذا المعيار في أي جزء من العرض.",
+                "pages": "",
+            })
+
+    comments = [
+        f"(ص {c['start_page']}–{c['end_page']}) {d.get('overall_comment', '').strip()}"
+        for c, d in zip(chunks, chunk_data)
+        if d and str(d.get("overall_comment", "")).strip()
+    ]
+    if len(comments) > 6:
+        comments = comments[:6] + [f"… (+{len(comments) - 6} أجزاء أخرى)"]
+    return {"scores": merged, "overall_comment": "\n".join(comments) or "— لا توجد ملاحظات عامة —"}
 
-            # ترجمة المعايير إن لزم
-            criteria_list, lang_detected = translate_if_needed(criteria_list, text)
-            text_criteria = "\n".join([f"- {c}" for c in criteria_list])
 
-            # ===== بناء التوجيه للنموذج (Prompt) =====
-            prompt = f"""
+def _score_chunk(criteria_list, chunk: dict, n_chunks: int, backend=None, on_row=None):
+    """
+    مرحلة map لجزء واحد: يعيد (JSON الجزء أو None، المعايير الناقصة).
+    المعايير التي لم يُرجعها النموذج يُعاد السؤال عنها وحدها لنفس الجزء.
+    on_row: يستقبل درجات الجزء الأولية (قبل الدمج) فور وصولها.
+    """
+    pages = f"{chunk['start_page']}–{chunk['end_page']}"
+    with tracing.span("eval.chunk", pages=pages, tokens=chunk.get("tokens"), criteria=len(criteria_list)) as sp:
+        data, missing = request_scores(
+            "evaluator",
+            lambda crit: _build_prompt(crit, chunk, n_chunks),
+            criteria_list,
+            backend=backend,
+            on_row=(lambda row: on_row({**row, "chunk": pages})) if on_row else None,
+            temperature=EVAL_TEMPERATURE,
+            max_tokens=3500,
+        )
+        sp.set(rows=len(data["scores"]) if data else 0, missing=len(missing))
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("🧠 نتيجة الذكاء الاصطناعي (ص %s): %s", pages, json.dumps(data, ensure_ascii=False)[:1000])
+    return data, missing
+
+
+def _evaluate_chunked(name: str, pages, criteria_list, backend=None, on_row=None):
+    """
+    كل النص: أجزاء تُقيَّم بالتوازي ثم reduce. يعيد (data, incomplete, warning)
+    حيث incomplete = المعايير التي لا تُحفظ خلاياها (ناقصة في جزء ما، أو الكل إذا فشل جزء).
+    """
+    chunks = chunk_pages(pages)
+    chunk_data = [None] * len(chunks)
+    missing = set()
+    errors = []
+    with ThreadPoolExecutor(max_workers=max(1, min(EVAL_CHUNK_WORKERS, len(chunks)))) as pool:
+        futures = {
+            pool.submit(tracing.wrap(_score_chunk), criteria_list, c, len(chunks), backend, on_row): c["chunk_id"]
+            for c in chunks
+        }
+        for fut in as_completed(futures):
+            try:
+                chunk_data[futures[fut]], chunk_missing = fut.result()
+                missing.update(chunk_missing)
+            except Exception as e:
+                errors.append(e)
+
+    if not any(chunk_data):
+        if errors:
+            raise errors[0]
+        return None, set(criteria_list), None
+    data = _reduce_chunks(criteria_list, chunks, chunk_data)
+    failed = sum(1 for d in chunk_data if not d)
+    if failed:
+        return data, set(criteria_list), \
+            f"⚠️ تعذّر تقييم {failed} من {len(chunks)} أجزاء في الملف {name}؛ النتيجة جزئية."
+    if missing:
+        return data, set(missing), \
+            f"⚠️ لم يُرجع النموذج {len(missing)} معيار في بعض أجزاء الملف {name}؛ النتيجة جزئية."
+    return data, set(), None
+
+
+RETRIEVAL_TEMPLATE = PromptTemplate("eval-retrieval", "v4", static="""
 أنت خبير تقييم عروض فنية وتقنية.
-اقرأ النص التالي المأخوذ من عرض فني، ثم قيّم العرض بناءً على المعايير التالية:
+لكل معيار ستُرفق أكثر المقاطع صلة به من العرض الفني (كل مقطع يبدأ برقم صفحته [[PAGE:n]]).
+قيّم كل معيار اعتمادًا على مقاطعه فقط:
 
 لكل معيار:
-- ضع درجة من 1 إلى 4 (1 = ضعيف، 4 = ممتاز)
+- ضع درجة من 1 إلى 4 (1 = ضعيف، 4 = ممتاز)، و1 إذا لم تتضمن المقاطع ما يغطيه
 - اكتب السؤال الذي طرحته على نفسك لتقييمه (ai_question)
-- اشرح السبب المنطقي للدرجة (reason)
+- اشرح السبب المنطقي للدرجة مستندًا إلى المقاطع (reason)
+- اذكر أرقام الصفحات التي ورد فيها الدليل (pages)
 
 بعد الانتهاء من المعايير، أضف في النهاية مفتاحًا جديدًا باسم:
 "overall_comment": يحتوي على ملاحظات عامة وشاملة عن العرض.
@@ -84,62 +258,478 @@ def evaluate_offers(offers, criteria_list):
       "criterion": "اسم المعيار",
       "score": رقم من 1 إلى 4,
       "ai_question": "السؤال الذي طرحه المقيم",
-      "reason": "السبب المنطقي للتقييم"
+      "reason": "السبب المنطقي للتقييم",
+      "pages": [أرقام الصفحات]
     }}
   ],
   "overall_comment": "ملاحظات عامة عن العرض ككل"
 }}
 
 المعايير:
-{text_criteria}
+{criteria}
+
+رجاءً أعد النتيجة بالعربية فقط.
+""", dynamic="""
+المقاطع ذات الصلة لكل معيار:
+{blocks}
+""")
+
+
+def _build_retrieval_prompt(criteria_list, evidence) -> list:
+    blocks = []
+    for crit, hits in zip(criteria_list, evidence):
+        passages = "\n".join(f"[[PAGE:{h['page_num']}]] {h['text']}" for h in hits) or "(لا توجد مقاطع ذات صلة)"
+        blocks.append(f"### {crit}\n{passages}")
+    return RETRIEVAL_TEMPLATE.messages({"criteria": bullets(criteria_list)}, blocks="\n".join(blocks))
+
+
+def _evaluate_retrieval(name: str, pages, criteria_list, backend=None, on_row=None):
+    """أفضل k مقاطع لكل معيار من فهرس العرض ثم طلب واحد صغير. يعيد (data, incomplete, warning)."""
+    hits = get_index(pages).search_many(criteria_list, k=EVAL_TOP_K)
+    evidence = []
+    for row in hits:
+        seen, uniq = set(), []
+        for h in row:
+            if h["text"] not in seen:
+                seen.add(h["text"])
+                uniq.append(h)
+        evidence.append(uniq)
+
+    by_crit = dict(zip(criteria_list, evidence))
+    data, missing = request_scores(
+        "evaluator",
+        lambda crit: _build_retrieval_prompt(crit, [by_crit[c] for c in crit]),
+        criteria_list,
+        backend=backend,
+        min_score=1,
+        on_row=on_row,
+        temperature=EVAL_TEMPERATURE,
+        max_tokens=3500,
+    )
+    if data is None:
+        return None, set(criteria_list), None
+
+    # صفحات الأدلة: ما ذكره النموذج، وإلا صفحات المقاطع المسترجعة للمعيار
+    for row in data["scores"]:
+        pages_cited = row.get("pages") or sorted({h["page_num"] for h in by_crit[row["criterion"]]})
+        row["pages"] = ", ".join(str(p) for p in pages_cited)
+    if missing:
+        return data, set(missing), f"⚠️ لم يُرجع النموذج {len(missing)} معيار للملف {name}؛ النتيجة جزئية."
+    return data, set(), None
+
+
+def _eval_context(backend, strategy: str) -> list:
+    """سياق خلايا التقييم: كل ما يغيّر الدرجة عدا نص العرض ونص المعيار (modules.cells)."""
+    param = {"chunked": DEFAULT_CHUNK_TOKENS, "retrieval": EVAL_TOP_K, "packed": EVAL_PACK_TOKENS}[strategy]
+    # مفتاح القالب (الإصدار + بصمة النص): تعديل أي قالب يُبطل خلاياه فقط
+    template = {"chunked": CHUNK_TEMPLATE, "retrieval": RETRIEVAL_TEMPLATE, "packed": PACKED_TEMPLATE}[strategy]
+    return [(backend or get_backend()).name, model_for("evaluator"), template.key, EVAL_TEMPERATURE, strategy, param]
+
+
+def _new_outcome(name: str) -> dict:
+    return {"file": name, "result": None, "details": None, "level": None, "message": None, "cached": False,
+            "cells": None}
+
+
+def _fill_outcome(out: dict, data: dict):
+    """JSON الدرجات → result (النسبة الكلية) و details (DataFrame)."""
+    scores = data.get("scores", [])
+    comment = data.get("overall_comment", "— لا توجد ملاحظات عامة —")
+
+    df = pd.DataFrame(scores)
+    for col in ["criterion", "score", "reason", "ai_question", "pages"]:
+        if col not in df.columns:
+            df[col] = "—"
+
+    # تحويل القيم الرقمية وحساب النسبة (المعيار الذي لم يُرجعه النموذج NaN ولا يدخل في المتوسط)
+    df["score"] = pd.to_numeric(df["score"], errors="coerce")
+    overall = df["score"].mean() / 4 if df["score"].notna().any() else 0.0  # من 0 إلى 1
+
+    out["result"] = {"file": out["file"], "overall": overall, "comment": comment}
+    out["details"] = df
 
-النص الكامل للعرض الفني (بدون اختصار):
-{text[:20000]}
+
+def _assemble(out: dict, criteria_list, reused: dict, fresh: dict, comment):
+    """
+    صفوف المعايير بترتيبها من الخلايا المخزنة (reused) والمحسوبة الآن (fresh)،
+    مع عمود reused في details وعدّاد الخلايا في out["cells"]. المعيار بلا صف يبقى في مكانه
+    بدرجة NaN حتى تتطابق أعمدة مصفوفة الدرجات مع المعايير.
+    """
+    rows = []
+    for c in criteria_list:
+        row = fresh.get(c) if c in fresh else reused.get(c)
+        if row is None:
+            row = {"score": np.nan, "ai_question": "—", "reason": "لم يُرجع النموذج هذا المعيار.", "pages": ""}
+        rows.append({**row, "criterion": c, "reused": c in reused and c not in fresh})
+    n_reused = sum(r["reused"] for r in rows)
+    out["cells"] = {"reused": n_reused, "computed": len(fresh)}
+    out["cached"] = not fresh
+    record_cells(**out["cells"])
+    _fill_outcome(out, {"scores": rows, "overall_comment": comment or "— لا توجد ملاحظات عامة —"})
+
+
+def _offer_comment(offer: str, context, data, reused: dict, complete: bool):
+    """الملاحظة العامة: المخزنة تبقى ما دام جزء من الخلايا مُعادًا، وإلا ملاحظة التقييم الجديد."""
+    stored = load_comment(offer, context)
+    if data is None or (stored is not None and reused):
+        return stored
+    comment = data.get("overall_comment")
+    if complete and comment:
+        save_comment(offer, context, comment)
+    return comment
+
+
+def _evaluate_text(name: str, doc, criteria_list, backend=None, strategy: str = None, on_row=None) -> dict:
+    """
+    تقييم عرض واحد (بدون أي استدعاء لـ Streamlit حتى يعمل داخل الـ threads).
+    doc: نص كامل أو قائمة صفحات [{"page_num", "text"}].
+    strategy:
+      "chunked"   → كل العرض مقسّم لأجزاء تُقيَّم بالتوازي ثم تُدمج (map-reduce)
+      "retrieval" → أفضل k مقاطع لكل معيار فقط (توجيه أصغر بكثير)
+    on_row(row): صفوف الدرجات فور وصولها من الرد المبثوث (والخلايا المخزنة دفعة واحدة أولًا).
+    التقييم تزايدي: فقط المعايير التي لا خلية لها لهذا العرض تُرسل للنموذج (modules.cells).
+    يعيد: {"file", "result": {...} | None, "details": DataFrame | None, "level", "message",
+           "cells": {"reused", "computed"}}
+    """
+    strategy = strategy or EVAL_STRATEGY
+    with tracing.span("offer.evaluate", offer=name, strategy=strategy, criteria=len(criteria_list)) as sp:
+        out = _evaluate_offer(name, doc, criteria_list, backend, strategy, on_row)
+        sp.set(level=out["level"], **(out["cells"] or {}))
+    return out
+
+
+def _evaluate_offer(name: str, doc, criteria_list, backend, strategy: str, on_row) -> dict:
+    """جسم _evaluate_text داخل span العرض."""
+    out = _new_outcome(name)
+    pages = doc if isinstance(doc, list) else pages_from_text(doc)
+    context = _eval_context(backend, strategy)
+    offer = offer_hash(pages)
+
+    try:
+        reused, todo = load_cells(offer, criteria_list, context)
+        if on_row:
+            for c, row in reused.items():
+                on_row({**row, "criterion": c})
+        data, incomplete = None, set()
+        if todo:
+            run = _evaluate_retrieval if strategy == "retrieval" else _evaluate_chunked
+            data, incomplete, warning = run(name, pages, todo, backend, on_row)
+            if data is None:
+                out["level"], out["message"] = "warning", f"⚠️ النموذج لم يُرجع JSON صالح للملف: {name}"
+                return out
+            if warning:
+                out["level"], out["message"] = "warning", warning
+        fresh = {r["criterion"]: r for r in (data or {}).get("scores", [])}
+        save_cells(offer, [r for c, r in fresh.items() if c not in incomplete], context)
+        comment = _offer_comment(offer, context, data, reused, complete=not incomplete)
+        _assemble(out, criteria_list, reused, fresh, comment)
+
+    except Exception as e:
+        out["level"], out["message"] = "error", f"❌ حدث خطأ أثناء تقييم الملف {name}: {e}"
+
+    return out
+
+
+# ===========================================================
+# 📦 تجميع العروض القصيرة في طلب واحد (pack)
+# ===========================================================
+PACKED_TEMPLATE = PromptTemplate("eval-packed", "v1", static="""
+أنت خبير تقييم عروض فنية وتقنية.
+ستُرسل إليك عدة عروض فنية مستقلة، كل عرض محصور بين <<<OFFER id=...>>> و <<<END ...>>>،
+وكل صفحة تبدأ بعلامة [[PAGE:n]]. قيّم كل عرض وحده بناءً على المعايير التالية دون الخلط بين العروض:
+
+لكل عرض ولكل معيار:
+- ضع درجة من 1 إلى 4 (1 = ضعيف، 4 = ممتاز)، أو 0 إذا لم يتناول العرض المعيار إطلاقًا
+- اكتب السؤال الذي طرحته على نفسك لتقييمه (ai_question)
+- اشرح السبب المنطقي للدرجة مستندًا إلى نص العرض نفسه (reason)
+- اذكر أرقام الصفحات التي ورد فيها الدليل (pages)
+وأضف لكل عرض "overall_comment" بملاحظات عامة مختصرة.
+
+أعد النتيجة بصيغة JSON فقط، مفتاحها معرّف العرض كما هو:
+{{
+  "offers": {{
+    "O1": {{
+      "scores": [
+        {{
+          "criterion": "اسم المعيار",
+          "score": رقم من 0 إلى 4,
+          "ai_question": "السؤال الذي طرحه المقيم",
+          "reason": "السبب المنطقي للتقييم",
+          "pages": [أرقام الصفحات]
+        }}
+      ],
+      "overall_comment": "ملاحظات عامة عن العرض"
+    }}
+  }}
+}}
+
+المعايير:
+{criteria}
 
 رجاءً أعد النتيجة بالعربية فقط.
-"""
+""", dynamic="""
+العروض ({ids}):
+{offers}
+""")
 
-            try:
-                response = client.chat.completions.create(
-                    model="llama-3.1-8b-instant",
-                    temperature=0.3,
-                    max_tokens=3500,
-                    messages=[{"role": "user", "content": prompt}],
-                )
-                result_text = response.choices[0].message.content.strip()
-                print("🧠 نتيجة الذكاء الاصطناعي:\n", result_text[:1000])
-
-                # استخراج JSON من النتيجة
-                json_match = re.search(r"\{.*\}", result_text, re.S)
-                if json_match:
-                    data = json.loads(json_match.group(0))
-                    scores = data.get("scores", [])
-                    comment = data.get("overall_comment", "— لا توجد ملاحظات عامة —")
-
-                    df = pd.DataFrame(scores)
-                    for col in ["criterion", "score", "reason", "ai_question"]:
-                        if col not in df.columns:
-                            df[col] = "—"
-
-                    # تحويل القيم الرقمية وحساب النسبة
-                    df["score"] = pd.to_numeric(df["score"], errors="coerce").fillna(0)
-                    overall = df["score"].mean() / 4  # من 0 إلى 1
-
-                    results.append(
-                        {"file": f.name, "overall": overall, "comment": comment}
-                    )
-                    details[f.name] = df
-                else:
-                    st.warning(f"⚠️ النموذج لم يُرجع JSON صالح للملف: {f.name}")
 
-            except Exception as e:
-                st.error(f"❌ حدث خطأ أثناء تقييم الملف {f.name}: {e}")
+def _build_packed_prompt(criteria_list, packed) -> list:
+    """packed: [(offer_id, name, chunk)] — كل عرض بين فواصل صريحة بمعرّفه."""
+    offers = "\n\n".join(
+        f"<<<OFFER id={oid} name={name}>>>\n{chunk['text']}\n<<<END {oid}>>>"
+        for oid, name, chunk in packed
+    )
+    return PACKED_TEMPLATE.messages(
+        {"criteria": bullets(criteria_list)}, ids=", ".join(oid for oid, _, _ in packed), offers=offers,
+    )
 
-    # ===== تحويل النتائج إلى DataFrame =====
-    if results:
-        ranked = pd.DataFrame(results).sort_values("overall", ascending=False)
-        ranked.reset_index(drop=True, inplace=True)
-        return ranked, details
+
+def _pack_output_tokens(n_offers: int, n_criteria: int) -> int:
+    return n_offers * (n_criteria * OUTPUT_TOKENS_PER_CRITERION + 80) + 100
+
+
+def _plan_packs(named_texts, backend=None):
+    """
+    تقسيم العروض إلى: عروض تُقيَّم منفردة، وحزم من عروض قصيرة تنقصها نفس المعايير،
+    ونتائج جاهزة من الخلايا المخزنة. التجميع جشع بترتيب الرفع حتى ميزانية النص وسقف الرد.
+    (معيار جديد لكل العروض → حزم بهذا المعيار وحده؛ عرض متأخر → كل معاييره.)
+    يعيد (singles, packs, cached) حيث packs = [(todo, [(i, name, pages, chunk, criteria, reused), ...])].
+    """
+    singles, cached, groups = [], {}, {}
+    context = _eval_context(backend, "packed")
+    for i, (name, doc, crit) in enumerate(named_texts):
+        pages = doc if isinstance(doc, list) else pages_from_text(doc)
+        chunks = chunk_pages(pages, EVAL_PACK_SMALL_TOKENS) if pages else []
+        if len(chunks) != 1:
+            singles.append(i)
+            continue
+        offer = offer_hash(pages)
+        reused, todo = load_cells(offer, crit, context)
+        if not todo:
+            out = _new_outcome(name)
+            _assemble(out, crit, reused, {}, load_comment(offer, context))
+            cached[i] = out
+            continue
+        groups.setdefault(tuple(todo), []).append((i, name, pages, chunks[0], crit, reused))
+
+    packs = []
+    for todo, items in groups.items():
+        cur, cur_tokens = [], 0
+        for item in items:
+            t = item[3]["tokens"]
+            full = cur and (cur_tokens + t > EVAL_PACK_TOKENS or
+                            _pack_output_tokens(len(cur) + 1, len(todo)) > EVAL_PACK_MAX_OUTPUT)
+            if full:
+                packs.append((todo, cur))
+                cur, cur_tokens = [], 0
+            cur.append(item)
+            cur_tokens += t
+        if cur:
+            packs.append((todo, cur))
+    # حزمة من عرض واحد لا توفّر شيئًا → تقييم عادي
+    singles += [items[0][0] for _, items in packs if len(items) == 1]
+    return sorted(singles), [(list(todo), items) for todo, items in packs if len(items) > 1], cached
+
+
+def _evaluate_pack(pack, todo, backend=None):
+    """
+    تقييم حزمة عروض في طلب واحد (المعايير الناقصة todo فقط) ثم تقسيم الرد لكل عرض.
+    العرض المفقود أو الناقص في الرد يُقيَّم وحده (chunked) كاحتياط.
+    يعيد ([(i, outcome)], warning) — التحذير يُعرض في thread المستدعي (الـ reporter محلي لكل thread).
+    """
+    ids = [f"O{k + 1}" for k in range(len(pack))]
+    prompt = _build_packed_prompt(todo, [(oid, item[1], item[3]) for oid, item in zip(ids, pack)])
+    try:
+        with tracing.span("eval.pack", offers=len(pack), criteria=len(todo)):
+            replies = request_packed_scores(
+                "evaluator", prompt, ids, todo, backend=backend,
+                temperature=EVAL_TEMPERATURE, max_tokens=_pack_output_tokens(len(pack), len(todo)),
+            )
+    except Exception as e:
+        warning = f"⚠️ فشل الطلب المجمّع لـ {len(pack)} عروض ({e})؛ تقييم كل عرض منفردًا."
+        replies = {}
     else:
-        st.warning("⚠️ لم يتم تقييم أي من العروض.")
+        warning = None
+
+    context = _eval_context(backend, "packed")
+    results = []
+    for oid, (i, name, pages, chunk, crit, reused) in zip(ids, pack):
+        data, missing = replies.get(oid, (None, todo))
+        if data is None or missing:
+            results.append((i, _evaluate_text(name, pages, crit, backend, "chunked")))
+            continue
+        # نفس خطوة reduce لعرض من جزء واحد: درجة 0 → 1 مع سبب، والصفحات نصًا
+        data = _reduce_chunks(todo, [chunk], [data])
+        offer = offer_hash(pages)
+        save_cells(offer, data["scores"], context)
+        out = _new_outcome(name)
+        _assemble(out, crit, reused, {r["criterion"]: r for r in data["scores"]},
+                  _offer_comment(offer, context, data, reused, complete=True))
+        results.append((i, out))
+    return results, warning
+
+
+def evaluate_texts(named_texts, max_workers: int = DEFAULT_MAX_WORKERS, on_done=None, backend=None,
+                   strategy: str = None, pack: bool = False):
+    """
+    تشغيل _evaluate_text على عدة عروض عبر ThreadPool محدود.
+    named_texts: قائمة (name, text | pages, criteria_list) بترتيب الرفع.
+    on_done(done, total, outcome): يُستدعى من الـ thread الرئيسي بعد اكتمال كل عرض.
+    pack: تجميع العروض القصيرة (جزء واحد) في طلبات مشتركة حتى EVAL_PACK_TOKENS
+          (مع استراتيجية chunked فقط؛ retrieval يبقى لكل عرض على حدة).
+    يعيد النتائج بنفس ترتيب الإدخال بغض النظر عن ترتيب الاكتمال.
+    """
+    total = len(named_texts)
+    outcomes = [None] * total
+    if not total:
+        return outcomes
+
+    singles, packs, cached = list(range(total)), [], {}
+    if pack and (strategy or EVAL_STRATEGY) == "chunked":
+        singles, packs, cached = _plan_packs(named_texts, backend)
+
+    done = 0
+
+    def _finish(i, outcome):
+        nonlocal done
+        done += 1
+        outcomes[i] = outcome
+        if on_done:
+            on_done(done, total, outcome)
+
+    for i, outcome in cached.items():
+        _finish(i, outcome)
+
+    tasks = len(singles) + len(packs)
+    if not tasks:
+        return outcomes
+    workers = max(1, min(int(max_workers or 1), tasks))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(tracing.wrap(_evaluate_text), *named_texts[i], backend, strategy): i
+            for i in singles
+        }
+        futures.update({
+            pool.submit(tracing.wrap(_evaluate_pack), items, todo, backend): None
+            for todo, items in packs
+        })
+        for fut in as_completed(futures):
+            i = futures[fut]
+            if i is None:
+                results, warning = fut.result()
+                if warning:
+                    get_reporter().warning(warning)
+                for j, outcome in results:
+                    _finish(j, outcome)
+            else:
+                _finish(i, fut.result())
+    return outcomes
+
+
+def rank_outcomes(outcomes, weights=None, normalization: str = "absolute"):
+    """
+    بناء ranked/details بترتيب ثابت (الدرجة تنازليًا ثم ترتيب الرفع عند التعادل).
+    overall = المجموع الموزون من مصفوفة الدرجات (modules.scoring)؛ weights=None → أوزان متساوية.
+    normalization: absolute | minmax | zscore (modules.scoring.NORMALIZATIONS).
+    """
+    kept = [o for o in outcomes if o and o["result"] is not None]
+    if not kept:
         return pd.DataFrame(), {}
+    files = [o["file"] for o in kept]
+    details = {o["file"]: o["details"] for o in kept}
+    n = len(weights) if weights is not None else max(len(o["details"]) for o in kept)
+    w = np.full(n, 1.0 / n) if weights is None else np.asarray(weights, dtype=float)
+
+    with tracing.span("rank", offers=len(kept), criteria=n):
+        ranked = rank_table(files, score_matrix(details, files, n), w,
+                            comments=[o["result"].get("comment") for o in kept], normalization=normalization)
+    return ranked[["file", "overall", "comment"]], details
+
+
+def prepare_offer(f, criteria_list, run_state: dict = None):
+    """
+    استخراج نص عرض واحد وترجمة المعايير له إن لزم (لكل عرض على حدة دون تعديل القائمة الأصلية).
+    يعيد (name, pages, offer_criteria) أو None إذا لم يُستخرج نص.
+    run_state: قاموس مشترك بين عروض التشغيل نفسه (انظر translate_if_needed).
+    """
+    with tracing.span("offer.prepare", offer=f.name):
+        payload = extract_text_with_pages(f)
+        pages = pages_from_payload(payload)
+        # صفحات OCR تُذكر هنا (في سجل المهمة) بدل حسابها متزامنًا في واجهة التقدير
+        ocr = extraction_summary(payload)
+        if ocr["ocr_pages"]:
+            get_reporter().info(f"🖨️ {f.name}: {ocr['ocr_pages']} صفحة ممسوحة عبر OCR "
+                                f"({(ocr['render_ms'] + ocr['ocr_ms']) / 1000:.1f}s)")
+        if not pages:
+            get_reporter().warning(f"⚠️ لم يتم استخراج نص من الملف: {f.name}")
+            return None
+        offer_criteria, lang_detected = translate_if_needed(
+            criteria_list, "\n".join(p["text"] for p in pages[:3]), run_state
+        )
+    return f.name, pages, offer_criteria
+
+
+def evaluate_prepared(job, backend=None, strategy: str = None, on_row=None) -> dict:
+    """تقييم عرض جاهز من prepare_offer (يُستخدم من مهام الخلفية مع بث الصفوف)."""
+    name, pages, offer_criteria = job
+    return _evaluate_text(name, pages, offer_criteria, backend, strategy, on_row)
+
+
+# ===========================================================
+# 🧠 الدالة الأساسية لتقييم العروض بالذكاء الاصطناعي
+# ===========================================================
+def evaluate_offers(offers, criteria_list, max_workers: int = DEFAULT_MAX_WORKERS, strategy: str = EVAL_STRATEGY,
+                    pack: bool = False, weights=None, normalization: str = "absolute"):
+    """
+    offers: ملفات مرفوعة أو كائنات ملفات مفتوحة (أي كائن له name/read/seek).
+    pack: تجميع العروض القصيرة في طلبات مشتركة (انظر evaluate_texts).
+    weights: وزن لكل معيار (modules.scoring.effective_weights)؛ None → متساوية.
+    normalization: تطبيع الدرجات قبل الترتيب (rank_outcomes).
+    الرسائل والتقدّم تمر عبر get_reporter() (Streamlit أو logging).
+    """
+    rep = get_reporter()
+    jobs = []
+    run_state = {}
+
+    # ===== المرحلة 1: الاستخراج والترجمة (سريعة ومُخزّنة مؤقتًا) =====
+    for f in offers:
+        with rep.spinner(f"📄 يتم استخراج نص العرض: {f.name}"):
+            job = prepare_offer(f, criteria_list, run_state)
+            if job:
+                jobs.append(job)
+
+    # ===== المرحلة 2: استدعاءات النموذج بالتوازي مع شريط تقدّم =====
+    rep.progress(0, len(jobs), f"🔍 جاري تقييم {len(jobs)} عرض...")
+
+    def _on_done(done, total, outcome):
+        rep.progress(done, total, f"🔍 ({done}/{total}) اكتمل تقييم: {outcome['file']}")
+        if outcome["level"] == "warning":
+            rep.warning(outcome["message"])
+        elif outcome["level"] == "error":
+            rep.error(outcome["message"])
+
+    outcomes = evaluate_texts(jobs, max_workers=max_workers, on_done=_on_done, strategy=strategy, pack=pack)
+    rep.progress_done()
+
+    if outcomes:
+        cells = [o["cells"] for o in outcomes if o and o.get("cells")]
+        stats = cell_cache.stats()
+        rep.caption(
+            f"♻️ الخلايا (عرض × معيار): {sum(c['reused'] for c in cells)} مُعادة — "
+            f"{sum(c['computed'] for c in cells)} محسوبة الآن — "
+            f"{sum(1 for o in outcomes if o and o['cached'])}/{len(outcomes)} عرض بدون استدعاء النموذج "
+            f"(hit rate {stats['hit_rate']:.0%})"
+        )
+        pm = parse_metrics()
+        if pm.get("requests"):
+            rep.caption(
+                f"🧩 تحليل الردود: فشل أول محاولة {pm['parse_failure_rate']:.0%} — "
+                f"إعادة محاولة {pm['retry_rate']:.0%} (إصلاح={pm.get('repairs', 0)}، "
+                f"معايير أُعيد السؤال عنها={pm.get('reasked_criteria', 0)})"
+            )
+
+    # ===== تحويل النتائج إلى DataFrame =====
+    ranked, details = rank_outcomes(outcomes, weights, normalization)
+    if ranked.empty:
+        rep.warning("⚠️ لم يتم تقييم أي من العروض.")
+    return ranked, details
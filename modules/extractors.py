@@ -1,10 +1,23 @@
 # modules/extractors.py
 import io
+import os
+import json
+import mmap
+import shutil
 import hashlib
-import streamlit as st
+import tempfile
+import threading
+import multiprocessing as mp
+from collections.abc import Sequence
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import fitz  # PyMuPDF
 from docx import Document
-import pandas as pd
+from modules import tracing
+from modules.cache import CACHE_ROOT
+from modules.progress import get_reporter
+from modules.pdf_pages import iter_pdf_pages, iter_page_styles, extract_range, ocr_page, ocr_available
 
 # ============================================================
 # 🔧 أدوات مساعدة
@@ -20,105 +33,283 @@ def _file_bytes(file_obj) -> bytes:
 def _hash_bytes(b: bytes) -> str:
     return hashlib.md5(b).hexdigest()
 
+def _hash_file(file_obj, block: int = 1 << 20) -> str:
+    """بصمة الملف على دفعات (بدون نسخ المحتوى كاملًا في الذاكرة)"""
+    pos = file_obj.tell()
+    file_obj.seek(0)
+    h = hashlib.md5()
+    for chunk in iter(lambda: file_obj.read(block), b""):
+        h.update(chunk)
+    file_obj.seek(pos)
+    return h.hexdigest()
+
+# ============================================================
+# 🗃️ مخزن الصفحات المضغوط على القرص
+# ============================================================
+PAGES_DIR = os.path.join(CACHE_ROOT, "pages")
+# الملفات الأكبر من هذا العدد من الصفحات تُقسَّم على عدة عمليات
+PARALLEL_MIN_PAGES = int(os.getenv("EXTRACT_PARALLEL_MIN_PAGES", "64"))
+EXTRACT_PROCESSES = int(os.getenv("EXTRACT_PROCESSES", str(min(4, os.cpu_count() or 1))))
+
+class PageStore(Sequence):
+    """
+    نصوص كل الصفحات في ملف واحد (<fid>.txt) + مصفوفة إزاحات (<fid>.idx.npy).
+    تُقرأ الصفحة عند الطلب فقط عبر mmap، وتتصرف كقائمة [{"page_num", "text"}, ...].
+    """
+
+    def __init__(self, fid: str, root: str = None):
+        root = root or PAGES_DIR
+        self.fid = fid
+        self.text_path = os.path.join(root, f"{fid}.txt")
+        self.index_path = os.path.join(root, f"{fid}.idx.npy")
+        self.profile_path = os.path.join(root, f"{fid}.profile.json")
+        self.styles_path = os.path.join(root, f"{fid}.styles.json")
+        self._offsets = None
+        self._mm = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.index_path) and os.path.exists(self.text_path)
+
+    def write(self, texts, profile=None):
+        """
+        كتابة الصفحات تدريجيًا من أي iterable (لا تُحمَّل كلها في الذاكرة).
+        profile: سجل توقيت/طريقة استخراج كل صفحة (يُحفظ بجانب المخزن).
+        """
+        os.makedirs(os.path.dirname(self.text_path), exist_ok=True)
+        tmp_text = f"{self.text_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        tmp_index = f"{self.index_path[:-4]}.{os.getpid()}.{threading.get_ident()}.tmp.npy"
+        offsets = [0]
+        with open(tmp_text, "wb") as f:
+            for t in texts:
+                f.write((t or "").encode("utf-8", "ignore"))
+                offsets.append(f.tell())
+        np.save(tmp_index, np.asarray(offsets, dtype=np.int64))
+        if profile is not None:
+            with open(self.profile_path, "w", encoding="utf-8") as f:
+                json.dump(profile, f, ensure_ascii=False)
+        os.replace(tmp_text, self.text_path)
+        os.replace(tmp_index, self.index_path)
+        self._offsets = self._mm = None
+        return self
+
+    def profile(self) -> list:
+        """
+        لكل صفحة: method (text | ocr | ocr-cache | no-text) و native_ms / render_ms / ocr_ms.
+        """
+        if not os.path.exists(self.profile_path):
+            return []
+        with open(self.profile_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def has_styles(self) -> bool:
+        return os.path.exists(self.styles_path)
+
+    def write_styles(self, styles):
+        """حفظ تنسيق الأسطر لكل صفحة (يُحسب فقط عند تحليل الأقسام — modules.segmentation)."""
+        tmp = f"{self.styles_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(list(styles), f, ensure_ascii=False)
+        os.replace(tmp, self.styles_path)
+        return self
+
+    def styles(self) -> list:
+        """[{"page_num", "styles": {"body", "lines"}}] أو [] إن لم تُحسب بعد."""
+        if not self.has_styles():
+            return []
+        with open(self.styles_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _load(self):
+        if self._offsets is None:
+            self._offsets = np.load(self.index_path)
+            size = int(self._offsets[-1])
+            if size:
+                with open(self.text_path, "rb") as f:
+                    self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._offsets
+
+    def __len__(self):
+        return len(self._load()) - 1
+
+    def text(self, i: int) -> str:
+        off = self._load()
+        a, b = int(off[i]), int(off[i + 1])
+        return self._mm[a:b].decode("utf-8", "ignore") if self._mm is not None and b > a else ""
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return {"page_num": i + 1, "text": self.text(i)}
+
+    def __getstate__(self):
+        return {"fid": self.fid, "text_path": self.text_path, "index_path": self.index_path,
+                "profile_path": self.profile_path, "styles_path": self.styles_path}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _offsets=None, _mm=None)
+
 # ============================================================
 # 📄 استخراج PDF صفحة بصفحة (بدون تحريف)
 # ============================================================
-@st.cache_data(show_spinner=False)
-def extract_pdf_pages(name: str, data: bytes, fid: str):
+def _iter_pdf_records(path: str, n_pages: int):
+    """سجلات الصفحات بالترتيب؛ الملفات الكبيرة تُوزَّع نطاقاتها على عدة عمليات."""
+    if n_pages < PARALLEL_MIN_PAGES or EXTRACT_PROCESSES <= 1:
+        yield from iter_pdf_pages(path)
+        return
+    step = -(-n_pages // (EXTRACT_PROCESSES * 2))
+    ranges = [(s, min(s + step, n_pages)) for s in range(0, n_pages, step)]
+    # spawn بدل fork: خادم Streamlit متعدد الـ threads
+    with ProcessPoolExecutor(max_workers=EXTRACT_PROCESSES, mp_context=mp.get_context("spawn")) as pool:
+        # map يحافظ على الترتيب
+        for records in pool.map(extract_range, *zip(*((path, a, b) for a, b in ranges))):
+            yield from records
+
+def _apply_ocr(name: str, path: str, records: list):
+    """
+    مرحلة OCR للصفحات منخفضة النص فقط (المسار السريع للصفحات العادية لا يتأثر).
+    الصفحات تُرسم وتُميَّز في ProcessPool، والنتائج تُخزَّن حسب بصمة صورة الصفحة.
+    """
+    low = [r for r in records if r.pop("needs_ocr", False)]
+    if not low:
+        return
+    ok, why = ocr_available()
+    if not ok:
+        for r in low:
+            r["method"] = "no-text"
+        get_reporter().warning(f"⚠️ {len(low)} صفحة ممسوحة ضوئيًا في {name} بدون نص — OCR غير متاح: {why}")
+        return
+
+    indexes = [r["page_num"] - 1 for r in low]
+    if len(low) > 1 and EXTRACT_PROCESSES > 1:
+        with ProcessPoolExecutor(max_workers=min(EXTRACT_PROCESSES, len(low)),
+                                 mp_context=mp.get_context("spawn")) as pool:
+            results = list(pool.map(ocr_page, [path] * len(low), indexes))
+    else:
+        results = [ocr_page(path, i) for i in indexes]
+    for r, res in zip(low, results):
+        r.update(res)
+
+def _trace_pages(records: list):
+    """span لكل صفحة من أزمنة سجلها (تُقاس داخل عمليات الاستخراج، فتُسجَّل هنا بمدتها)."""
+    if not tracing.ENABLED:
+        return
+    for r in records:
+        ms = r.get("native_ms", 0.0) + r.get("render_ms", 0.0) + r.get("ocr_ms", 0.0)
+        tracing.record("extract.page", ms / 1000, page=r["page_num"], method=r.get("method"),
+                       chars=len(r.get("text") or ""))
+
+def _missed_ocr(store: PageStore) -> bool:
+    """صفحات حُفظت "no-text" لأن OCR لم يكن متاحًا وقتها — يُعاد استخراج الملف حين يصبح متاحًا."""
+    return ocr_available()[0] and any(r.get("method") == "no-text" for r in store.profile())
+
+@contextmanager
+def _pdf_path(source):
+    """مسار على القرص لمصدر PDF (مسار / bytes / كائن ملف)؛ النسخة المؤقتة تُحذف بعد الاستخدام."""
+    if isinstance(source, str):
+        yield source
+        return
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        if isinstance(source, (bytes, bytearray)):
+            tmp.write(source)
+        else:
+            pos = source.tell()
+            source.seek(0)
+            shutil.copyfileobj(source, tmp)
+            source.seek(pos)
+    try:
+        yield tmp.name
+    finally:
+        os.unlink(tmp.name)
+
+def extract_pdf_pages(name: str, source, fid: str, styles: bool = False) -> PageStore:
     """
-    يعيد قائمة صفحات:
-    [{"page_num": 1, "text": "..."} , ...]
-    باستخدام PyMuPDF لضمان الترتيب والدقة العالية.
+    يعيد مخزن الصفحات (يتصرف كقائمة [{"page_num": 1, "text": "..."} , ...])
+    باستخدام PyMuPDF لضمان الترتيب والدقة العالية. يُستخرج الملف مرة واحدة فقط
+    لكل بصمة fid ثم يُقرأ من القرص (إلا إن كانت فيه صفحات بلا نص وأصبح OCR متاحًا).
+    source: مسار ملف أو bytes أو كائن ملف.
+    styles: حساب تنسيق الأسطر أيضًا (تمريرة منفصلة لتحليل الأقسام فقط، تُحفظ بجانب المخزن).
     """
-    pages = []
+    store = PageStore(fid)
+    need_text = not store.exists() or _missed_ocr(store)
+    need_styles = styles and not store.has_styles()
+    if not (need_text or need_styles):
+        return store
     try:
-        doc = fitz.open(stream=data, filetype="pdf")
-        for i, page in enumerate(doc):
-            text = page.get_text("text") or ""
-            pages.append({"page_num": i + 1, "text": text})
-        doc.close()
+        with _pdf_path(source) as path:
+            if need_text:
+                with fitz.open(path) as doc:
+                    n_pages = doc.page_count
+                records = list(_iter_pdf_records(path, n_pages))
+                _apply_ocr(name, path, records)
+                _trace_pages(records)
+                store.write((r.pop("text") for r in records), profile=records)
+            if need_styles:
+                with tracing.span("styles", file=name):
+                    store.write_styles(iter_page_styles(path))
     except Exception as e:
-        st.error(f"❌ خطأ في قراءة PDF {name}: {e}")
-    return pages
+        get_reporter().error(f"❌ خطأ في قراءة PDF {name}: {e}")
+        return []
+    return store
+
+def extraction_summary(payload) -> dict:
+    """ملخص زمن الاستخراج لكل مرحلة (نص أصلي / رسم / OCR) من سجل الصفحات."""
+    pages = payload.get("pages") if isinstance(payload, dict) else None
+    profile = pages.profile() if isinstance(pages, PageStore) else []
+    out = {"ocr_pages": 0, "no_text_pages": 0, "native_ms": 0.0, "render_ms": 0.0, "ocr_ms": 0.0}
+    for r in profile:
+        out["ocr_pages"] += r.get("method", "").startswith("ocr")
+        out["no_text_pages"] += r.get("method") == "no-text"
+        for k in ("native_ms", "render_ms", "ocr_ms"):
+            out[k] += r.get(k, 0.0)
+    return {k: round(v, 1) if isinstance(v, float) else v for k, v in out.items()}
 
 # ============================================================
 # 📝 استخراج DOCX (ملف وورد)
 # ============================================================
-@st.cache_data(show_spinner=False)
-def extract_docx_text(name: str, data: bytes, fid: str):
-    """إرجاع نص DOCX كسلسلة نصية واحدة (سطر لكل فقرة)."""
+def extract_docx_text(name: str, source, fid: str):
+    """إرجاع نص DOCX كسلسلة نصية واحدة (سطر لكل فقرة) — يُخزَّن على القرص حسب fid."""
+    store = PageStore(fid)
+    if store.exists():
+        return store.text(0) if len(store) else ""
     try:
-        doc = Document(io.BytesIO(data))
-        return "\n".join(p.text for p in doc.paragraphs)
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        elif hasattr(source, "seek"):
+            source.seek(0)
+        doc = Document(source)
+        text = "\n".join(p.text for p in doc.paragraphs)
+        store.write([text])
+        return text
     except Exception as e:
-        st.error(f"❌ خطأ في قراءة DOCX {name}: {e}")
+        get_reporter().error(f"❌ خطأ في قراءة DOCX {name}: {e}")
         return ""
 
 # ============================================================
 # ⚡ الدالة الرئيسية الموحّدة للاستخدام في الواجهة
 # ============================================================
-def extract_text_with_pages(uploaded_file):
+def extract_text_with_pages(uploaded_file, styles: bool = False):
     """
     يكتشف نوع الملف ويعيد محتواه بشكل موحد:
-    PDF → {"type": "pdf", "pages": [{"page_num":1,"text":"..."}]}
-    DOCX → {"type": "docx", "text": "..."}
+    PDF → {"type": "pdf", "pages": PageStore([{"page_num":1,"text":"..."}]), "fid": "..."}
+    DOCX → {"type": "docx", "text": "...", "fid": "..."}
+    styles: لتحليل الأقسام — يحسب تنسيق أسطر PDF (PageStore.styles()).
     """
-    data = _file_bytes(uploaded_file)
-    fid = _hash_bytes(data)
-    name = uploaded_file.name.lower()
-
-    if name.endswith(".pdf"):
-        pages = extract_pdf_pages(name, data, fid)
-        return {"type": "pdf", "pages": pages}
-    elif name.endswith(".docx"):
-        text = extract_docx_text(name, data, fid)
-        return {"type": "docx", "text": text}
-    else:
-        st.warning("⚠️ نوع الملف غير مدعوم (يرجى رفع PDF أو DOCX فقط).")
-        return {"type": "unknown"}
+    with tracing.span("extract", file=uploaded_file.name) as sp:
+        fid = _hash_file(uploaded_file)
+        name = uploaded_file.name.lower()
 
-# ============================================================
-# 📊 استخراج المعايير من Excel
-# ============================================================
-@st.cache_data(show_spinner=False)
-def parse_criteria_from_excel(xfile) -> pd.DataFrame:
-    """محاولة استخراج عمود المعايير من ملف Excel"""
-    try:
-        xl = pd.ExcelFile(xfile)
-        target = next(
-            (s for s in xl.sheet_names if "Project" in s or "Evaluation" in s or "التقييم" in s),
-            xl.sheet_names[0],
-        )
-        df = pd.read_excel(xl, sheet_name=target, header=0)
-        possibles = [
-            c for c in df.columns
-            if any(k in str(c) for k in ["criterion","criteria","المعيار","Component","Sub-criterion"])
-        ]
-        rows = []
-        for c in possibles:
-            vals = df[c].dropna().astype(str).map(str.strip)
-            for v in vals:
-                if v and v.lower() not in {"nan","none"} and len(v) > 1:
-                    rows.append(v)
-
-        seen, out = set(), []
-        for r in rows:
-            if r not in seen:
-                seen.add(r)
-                out.append({"criterion": r})
-        if out:
-            return pd.DataFrame(out)
-
-        defaults = [
-            "جودة الحل المقترح","المنهجية الفنية","الخبرة السابقة","خطة التنفيذ",
-            "فريق العمل","الابتكار في الحل","إدارة المشروع","الامتثال للمتطلبات",
-        ]
-        return pd.DataFrame({"criterion": defaults})
-
-    except Exception as e:
-        st.warning(f"⚠️ تعذر قراءة Excel ({e})، سيتم استخدام قائمة افتراضية.")
-        defaults = [
-            "جودة الحل المقترح","المنهجية الفنية","الخبرة السابقة","خطة التنفيذ",
-            "فريق العمل","الابتكار في الحل","إدارة المشروع","الامتثال للمتطلبات",
-        ]
-        return pd.DataFrame({"criterion": defaults})
+        if name.endswith(".pdf"):
+            pages = extract_pdf_pages(name, uploaded_file, fid, styles=styles)
+            sp.set(type="pdf", pages=len(pages))
+            return {"type": "pdf", "pages": pages, "fid": fid}
+        elif name.endswith(".docx"):
+            text = extract_docx_text(name, uploaded_file, fid)
+            sp.set(type="docx", chars=len(text))
+            return {"type": "docx", "text": text, "fid": fid}
+        else:
+            get_reporter().warning("⚠️ نوع الملف غير مدعوم (يرجى رفع PDF أو DOCX فقط).")
+            return {"type": "unknown"}
@@ -0,0 +1,515 @@
+# modules/jobs.py
+"""
+مهام الخلفية: تقييم العروض أو تحليل أقسامها خارج تشغيل سكربت Streamlit.
+
+- submit_evaluation / submit_sections → رقم مهمة (job id) فورًا، والتنفيذ في ThreadPool على مستوى العملية.
+- الحالة محفوظة في SQLite (cache/jobs.sqlite3): المهمة + عنصر لكل عرض + سجل أحداث.
+  نتيجة كل عرض تُحفظ فور اكتماله، فتعرض الواجهة الترتيب الجزئي أثناء التشغيل.
+- الملفات المرفوعة تُنسخ إلى cache/jobs/<id>/ حتى تبقى المهمة بعد تحديث المتصفح.
+- الصفوف الأولية (درجة معيار أو قسم) تُحفظ في job_rows فور اكتمالها في الرد المبثوث،
+  فتظهر في الواجهة قبل انتهاء العرض نفسه.
+- تحليل الأقسام: خط واحد لكل العروض (analyzer.analyze_offers_sections) — استخراج متوازٍ،
+  ودفعات التسمية من كل العروض بحد تزامن مشترك، وكل عرض يُحفظ فور اكتمال أقسامه.
+- الإلغاء يُفحص قبل كل عرض، والاستئناف يتخطى العروض المكتملة.
+- pack=True: تُستخرج كل العروض أولًا ثم تُقيَّم عبر evaluate_texts(pack=True) فتشترك
+  العروض القصيرة في طلبات مجمّعة (بدون بث صفوف؛ النتيجة تُحفظ لكل عرض عند اكتمال حزمته).
+- كل عملية تحمل رمز تشغيل (BOOT_ID) وتحدّث نبض مهامها (heartbeat_at) دوريًا؛ مهمة من تشغيل آخر
+  توقف نبضها (إعادة تشغيل الخادم) تُعلَّم "interrupted" عند أول قراءة لها ويمكن استئنافها.
+
+JOB_WORKERS: عدد المهام المتزامنة في العملية (افتراضي 2).
+JOB_HEARTBEAT_S: فترة نبض المهام (افتراضي 10 ثوانٍ)؛ المهمة تُعد متوقفة بعد 3 فترات بلا نبض.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from modules import tracing
+from modules.cache import CACHE_ROOT
+from modules.extractors import _file_bytes
+from modules.evaluator import (
+    prepare_offer, evaluate_prepared, evaluate_texts, rank_outcomes, DEFAULT_MAX_WORKERS, EVAL_STRATEGY,
+)
+from modules.analyzer import analyze_offers_sections
+from modules.batch import LocalFile
+from modules.progress import CallbackReporter, use_reporter
+
+JOBS_DB = os.path.join(CACHE_ROOT, "jobs.sqlite3")
+JOBS_DIR = os.path.join(CACHE_ROOT, "jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_HEARTBEAT_S = float(os.getenv("JOB_HEARTBEAT_S", "10"))
+# رمز هذا التشغيل للعملية (رقم PID وحده يتكرر بعد إعادة التشغيل، مثلًا PID 1 في الحاويات)
+BOOT_ID = uuid.uuid4().hex
+
+KINDS = ("evaluate", "sections")
+FINAL = ("done", "failed", "cancelled", "interrupted")
+RESUMABLE = ("failed", "cancelled", "interrupted")
+
+_local = threading.local()
+_pool = None
+_pool_lock = threading.Lock()
+_last_recover = 0.0
+
+
+# ============================================================
+# 🗄️ التخزين
+# ============================================================
+def _conn() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(CACHE_ROOT, exist_ok=True)
+        conn = sqlite3.connect(JOBS_DB, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                error TEXT,
+                owner_pid INTEGER,
+                owner_boot TEXT,
+                heartbeat_at REAL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                result TEXT,
+                level TEXT,
+                message TEXT,
+                finished_at REAL,
+                PRIMARY KEY (job_id, idx)
+            );
+            CREATE TABLE IF NOT EXISTS job_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                ts REAL NOT NULL,
+                level TEXT NOT NULL,
+                message TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_events_job ON job_events(job_id, id);
+            CREATE TABLE IF NOT EXISTS job_rows (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                ts REAL NOT NULL,
+                row TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_rows_job ON job_rows(job_id, id);
+        """)
+        # قواعد أنشأتها نسخة أقدم بدون أعمدة المالك/النبض
+        cols = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+        for col, kind in (("owner_boot", "TEXT"), ("heartbeat_at", "REAL")):
+            if col not in cols:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {col} {kind}")
+        _local.conn = conn
+    return conn
+
+
+def _set_status(job_id: str, status: str, **fields):
+    cols = ", ".join(f"{k} = ?" for k in fields)
+    _conn().execute(
+        f"UPDATE jobs SET status = ?{', ' + cols if cols else ''} WHERE id = ?",
+        (status, *fields.values(), job_id),
+    )
+
+
+def _status(job_id: str) -> str:
+    row = _conn().execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return row["status"] if row else None
+
+
+def log_event(job_id: str, level: str, message: str):
+    _conn().execute(
+        "INSERT INTO job_events (job_id, ts, level, message) VALUES (?, ?, ?, ?)",
+        (job_id, time.time(), level, message),
+    )
+
+
+def _row_sink(job_id: str, idx: int, name: str):
+    def _store(row: dict):
+        _conn().execute(
+            "INSERT INTO job_rows (job_id, idx, name, ts, row) VALUES (?, ?, ?, ?, ?)",
+            (job_id, idx, name, time.time(), json.dumps(row, ensure_ascii=False, default=str)),
+        )
+    return _store
+
+
+# ============================================================
+# 📥 إنشاء المهام
+# ============================================================
+def _submit(kind: str, offers, params: dict) -> str:
+    """نسخ الملفات إلى القرص + إنشاء المهمة وعناصرها ثم جدولتها."""
+    job_id = uuid.uuid4().hex[:12]
+    conn = _conn()
+    items = []
+    for idx, f in enumerate(offers):
+        d = os.path.join(JOBS_DIR, job_id, str(idx))
+        os.makedirs(d, exist_ok=True)
+        path = os.path.join(d, os.path.basename(f.name))
+        with open(path, "wb") as out:
+            out.write(_file_bytes(f))
+        items.append((job_id, idx, f.name, path, "queued"))
+
+    conn.execute("BEGIN")
+    conn.execute(
+        "INSERT INTO jobs (id, kind, status, params, total, owner_boot, heartbeat_at, created_at) "
+        "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+        (job_id, kind, json.dumps(params, ensure_ascii=False), len(items), BOOT_ID, time.time(), time.time()),
+    )
+    conn.executemany("INSERT INTO job_items (job_id, idx, name, path, status) VALUES (?, ?, ?, ?, ?)", items)
+    conn.execute("COMMIT")
+    log_event(job_id, "info", f"📥 تمت جدولة {len(items)} عرض")
+    _dispatch(job_id)
+    return job_id
+
+
+def submit_evaluation(offers, criteria_list, max_workers: int = DEFAULT_MAX_WORKERS,
+                      strategy: str = EVAL_STRATEGY, pack: bool = False, weights=None) -> str:
+    return _submit("evaluate", offers, {
+        "criteria": list(criteria_list), "max_workers": int(max_workers), "strategy": strategy,
+        "pack": bool(pack), "weights": None if weights is None else [float(w) for w in weights],
+    })
+
+
+def submit_sections(offers, max_workers: int = DEFAULT_MAX_WORKERS) -> str:
+    return _submit("sections", offers, {"max_workers": int(max_workers)})
+
+
+def cancel_job(job_id: str):
+    """مهمة في الانتظار تُلغى فورًا، والجارية تتوقف قبل العرض التالي."""
+    _maybe_recover()
+    status = _status(job_id)
+    if status == "queued":
+        _set_status(job_id, "cancelled", finished_at=time.time())
+    elif status == "running":
+        _set_status(job_id, "cancelling")
+    log_event(job_id, "warning", "⏹️ طُلب إلغاء المهمة")
+
+
+def resume_job(job_id: str) -> bool:
+    """إعادة جدولة مهمة ملغاة/فاشلة/متوقفة؛ العروض المكتملة لا يُعاد تنفيذها."""
+    _maybe_recover()
+    if _status(job_id) not in RESUMABLE:
+        return False
+    _conn().execute("UPDATE job_items SET status = 'queued' WHERE job_id = ? AND status != 'done'", (job_id,))
+    _set_status(job_id, "queued", error=None, finished_at=None, owner_boot=BOOT_ID, heartbeat_at=time.time())
+    log_event(job_id, "info", "▶️ استئناف المهمة")
+    _dispatch(job_id)
+    return True
+
+
+# ============================================================
+# ⚙️ التنفيذ
+# ============================================================
+def recover_jobs() -> int:
+    """
+    المهام غير المنتهية من تشغيل آخر توقف نبضها (إعادة تشغيل الخادم) → interrupted.
+    مهام هذا التشغيل، أو تشغيل آخر ما زال ينبض (عملية خادم أخرى)، لا تُمس.
+    """
+    stale = time.time() - 3 * JOB_HEARTBEAT_S
+    rows = _conn().execute(
+        "SELECT id FROM jobs WHERE status IN ('running', 'cancelling', 'queued') "
+        "AND (owner_boot IS NULL OR owner_boot != ?) AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+        (BOOT_ID, stale),
+    ).fetchall()
+    for row in rows:
+        _set_status(row["id"], "interrupted")
+        log_event(row["id"], "warning", "⚠️ توقفت المهمة بسبب إعادة تشغيل الخادم — يمكن استئنافها")
+    return len(rows)
+
+
+def _maybe_recover():
+    """recover_jobs مرة كل فترة نبض على الأكثر (القراءة من الواجهة تتكرر كل ثانية)."""
+    global _last_recover
+    now = time.time()
+    if now - _last_recover >= JOB_HEARTBEAT_S:
+        _last_recover = now
+        recover_jobs()
+
+
+def _heartbeat():
+    """تحديث نبض كل مهام هذا التشغيل غير المنتهية، طوال عمر العملية."""
+    while True:
+        try:
+            _conn().execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE owner_boot = ? "
+                "AND status IN ('running', 'cancelling', 'queued')",
+                (time.time(), BOOT_ID),
+            )
+        except sqlite3.Error:
+            pass
+        time.sleep(JOB_HEARTBEAT_S)
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            recover_jobs()
+            _pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+            threading.Thread(target=_heartbeat, name="job-heartbeat", daemon=True).start()
+        return _pool
+
+
+def _dispatch(job_id: str):
+    _conn().execute("UPDATE jobs SET owner_pid = ?, owner_boot = ?, heartbeat_at = ? WHERE id = ?",
+                    (os.getpid(), BOOT_ID, time.time(), job_id))
+    _get_pool().submit(_run_job, job_id)
+
+
+def _evaluate_item(params: dict, name: str, path: str, on_row=None, run_state: dict = None):
+    with LocalFile(path) as f:
+        f.name = name
+        prepared = prepare_offer(f, params["criteria"], run_state)
+    if prepared is None:
+        return None, "warning", f"⚠️ لم يتم استخراج نص من الملف: {name}"
+    return _evaluation_result(evaluate_prepared(prepared, strategy=params.get("strategy"), on_row=on_row))
+
+
+def _evaluation_result(o: dict):
+    result = None
+    if o["result"] is not None:
+        result = {
+            "result": o["result"],
+            "details": o["details"].to_dict("records"),
+            "cached": o["cached"],
+            "cells": o.get("cells"),
+        }
+    return result, o["level"], o["message"]
+
+
+def _run_item(job_id: str, params: dict, item, run_state: dict = None):
+    """تقييم عرض واحد: يُتخطى إذا أُلغيت المهمة، ونتيجته تُحفظ فور انتهائه."""
+    if _status(job_id) != "running":
+        return
+    conn = _conn()
+    conn.execute("UPDATE job_items SET status = 'running' WHERE job_id = ? AND idx = ?", (job_id, item["idx"]))
+    rep = CallbackReporter(lambda level, msg, done, total: log_event(job_id, level, msg))
+    try:
+        with use_reporter(rep):
+            result, level, message = _evaluate_item(params, item["name"], item["path"],
+                                                    _row_sink(job_id, item["idx"], item["name"]), run_state)
+        status = "done"
+    except Exception as e:
+        result, level, message, status = None, "error", f"❌ {item['name']}: {e}", "failed"
+    _store_item(job_id, item, status, result, level, message)
+
+
+def _store_item(job_id: str, item, status: str, result, level, message):
+    _conn().execute(
+        "UPDATE job_items SET status = ?, result = ?, level = ?, message = ?, finished_at = ? "
+        "WHERE job_id = ? AND idx = ?",
+        (status, json.dumps(result, ensure_ascii=False, default=str), level, message, time.time(),
+         job_id, item["idx"]),
+    )
+    if message:
+        log_event(job_id, level or "info", message)
+    if status == "done":
+        log_event(job_id, "success", f"✅ اكتمل: {item['name']}")
+
+
+def _run_packed(job_id: str, params: dict, items):
+    """تقييم مجمّع: استخراج كل العروض ثم evaluate_texts(pack=True) وحفظ كل عرض عند اكتماله."""
+    conn = _conn()
+    rep = CallbackReporter(lambda level, msg, done, total: log_event(job_id, level, msg))
+    prepared, owners = [], []  # owners: عنصر المهمة لكل عرض مُستخرج
+    run_state = {}
+    with use_reporter(rep):
+        for item in items:
+            if _status(job_id) != "running":
+                return
+            conn.execute("UPDATE job_items SET status = 'running' WHERE job_id = ? AND idx = ?",
+                         (job_id, item["idx"]))
+            try:
+                with LocalFile(item["path"]) as f:
+                    f.name = item["name"]
+                    job = prepare_offer(f, params["criteria"], run_state)
+            except Exception as e:
+                _store_item(job_id, item, "failed", None, "error", f"❌ {item['name']}: {e}")
+                continue
+            if job is None:
+                _store_item(job_id, item, "done", None, "warning", f"⚠️ لم يتم استخراج نص من الملف: {item['name']}")
+                continue
+            prepared.append(job)
+            owners.append(item)
+
+        if prepared and _status(job_id) == "running":
+            by_name = {}
+            for item in owners:
+                by_name.setdefault(item["name"], []).append(item)
+            evaluate_texts(
+                prepared, max_workers=params.get("max_workers") or 1, strategy=params.get("strategy"), pack=True,
+                on_done=lambda done, total, o: _store_item(
+                    job_id, by_name[o["file"]].pop(0), "done", *_evaluation_result(o)),
+            )
+
+
+def _run_sections(job_id: str, params: dict, items):
+    """
+    تحليل الأقسام عبر خط واحد (analyze_offers_sections): استخراج متوازٍ + دفعات تسمية بحد تزامن
+    مشترك، وكل عرض يُحفظ فور اكتمال أقسامه.
+    """
+    conn = _conn()
+    rep = CallbackReporter(lambda level, msg, done, total: log_event(job_id, level, msg))
+    files = []
+    try:
+        for item in items:
+            conn.execute("UPDATE job_items SET status = 'running' WHERE job_id = ? AND idx = ?",
+                         (job_id, item["idx"]))
+            f = LocalFile(item["path"])
+            f.name = item["name"]
+            files.append(f)
+        sinks = [_row_sink(job_id, item["idx"], item["name"]) for item in items]
+
+        def on_offer(i, name, sections, level, message):
+            _store_item(job_id, items[i], "failed" if sections is None else "done", sections, level, message)
+
+        with use_reporter(rep):
+            analyze_offers_sections(
+                files, on_offer=on_offer, on_section=lambda i, name, sec: sinks[i](sec),
+                extract_workers=params.get("max_workers") or 1,
+                should_stop=lambda: _status(job_id) != "running",
+            )
+    finally:
+        for f in files:
+            f.close()
+
+
+def _run_job(job_id: str):
+    conn = _conn()
+    job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if job is None or job["status"] != "queued":
+        return
+    params = json.loads(job["params"])
+    _set_status(job_id, "running", owner_pid=os.getpid(), started_at=time.time())
+    items = conn.execute(
+        "SELECT idx, name, path FROM job_items WHERE job_id = ? AND status != 'done' ORDER BY idx", (job_id,)
+    ).fetchall()
+    try:
+        # المهمة = منافسة واحدة: كل spans التشغيل تحمل tender=job_id (ملخص التوكنات في الواجهة)
+        with tracing.span("job", tender=job_id, kind=job["kind"], offers=len(items)):
+            if job["kind"] == "sections":
+                _run_sections(job_id, params, items)
+            elif params.get("pack"):
+                _run_packed(job_id, params, items)
+            else:
+                workers = max(1, min(params.get("max_workers") or 1, len(items) or 1))
+                run_state = {}  # مشتركة بين عروض هذا التشغيل فقط (فشل الترجمة مثلًا)
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    list(pool.map(tracing.wrap(lambda it: _run_item(job_id, params, it, run_state)), items))
+    except Exception as e:
+        _set_status(job_id, "failed", error=str(e), finished_at=time.time())
+        log_event(job_id, "error", f"❌ فشلت المهمة: {e}")
+        return
+
+    if _status(job_id) == "cancelling":
+        _set_status(job_id, "cancelled", finished_at=time.time())
+        log_event(job_id, "warning", "⏹️ أُلغيت المهمة")
+        return
+    failed = conn.execute(
+        "SELECT COUNT(*) FROM job_items WHERE job_id = ? AND status = 'failed'", (job_id,)
+    ).fetchone()[0]
+    _set_status(job_id, "failed" if failed else "done", finished_at=time.time(),
+                error=f"{failed} عرض فشل" if failed else None)
+    log_event(job_id, "info", f"🏁 انتهت المهمة ({job['total'] - failed}/{job['total']})")
+
+
+# ============================================================
+# 📊 القراءة للواجهة
+# ============================================================
+def get_job(job_id: str) -> dict:
+    """الحالة + عدد العروض المكتملة (None إذا لم توجد المهمة)."""
+    _maybe_recover()
+    conn = _conn()
+    job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if job is None:
+        return None
+    counts = dict(conn.execute(
+        "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+    ).fetchall())
+    out = dict(job)
+    out["params"] = json.loads(job["params"])
+    out["done"] = counts.get("done", 0)
+    out["failed"] = counts.get("failed", 0)
+    out["items"] = counts
+    return out
+
+
+def job_events(job_id: str, limit: int = 50) -> list:
+    rows = _conn().execute(
+        "SELECT ts, level, message FROM job_events WHERE job_id = ? ORDER BY id DESC LIMIT ?", (job_id, limit)
+    ).fetchall()
+    return [dict(r) for r in reversed(rows)]
+
+
+def job_rows(job_id: str, limit: int = 200) -> list:
+    """آخر الصفوف الأولية المبثوثة: [{"file", "t", ...الصف}] حيث t ثوانٍ منذ بدء المهمة."""
+    conn = _conn()
+    started = conn.execute("SELECT started_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    t0 = started["started_at"] if started and started["started_at"] else 0
+    rows = conn.execute(
+        "SELECT name, ts, row FROM job_rows WHERE job_id = ? ORDER BY id DESC LIMIT ?", (job_id, limit)
+    ).fetchall()
+    return [{"file": r["name"], "t": round(r["ts"] - t0, 2), **json.loads(r["row"])} for r in reversed(rows)]
+
+
+def time_to_first_row(job_id: str):
+    """ثوانٍ من بدء تشغيل المهمة حتى أول صف مبثوث (None إن لم يصل شيء بعد)."""
+    row = _conn().execute(
+        "SELECT MIN(r.ts) - j.started_at FROM job_rows r JOIN jobs j ON j.id = r.job_id WHERE r.job_id = ?",
+        (job_id,),
+    ).fetchone()
+    return round(row[0], 2) if row and row[0] is not None else None
+
+
+def _done_items(job_id: str):
+    return _conn().execute(
+        "SELECT name, result FROM job_items WHERE job_id = ? AND status = 'done' ORDER BY idx", (job_id,)
+    ).fetchall()
+
+
+def job_ranking(job_id: str, weights=None):
+    """
+    ترتيب جزئي/نهائي من العروض المكتملة حتى الآن (نفس ranked/details في evaluate_offers).
+    weights=None → أوزان المهمة عند إرسالها.
+    """
+    outcomes = []
+    for row in _done_items(job_id):
+        data = json.loads(row["result"]) if row["result"] else None
+        if data:
+            outcomes.append({"file": row["name"], "result": data["result"],
+                             "details": pd.DataFrame(data["details"])})
+    if weights is None:
+        job = _conn().execute("SELECT params FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        weights = json.loads(job["params"]).get("weights") if job else None
+    return rank_outcomes(outcomes, weights)
+
+
+def job_sections(job_id: str) -> dict:
+    """{اسم العرض: [الأقسام]} للعروض المكتملة بترتيب الرفع."""
+    return {row["name"]: json.loads(row["result"] or "[]") for row in _done_items(job_id)}
+
+
+def job_profile(job_id: str):
+    """
+    (زمن كل مرحلة، التوكنات) لهذه المهمة من spans التتبع في ذاكرة هذه العملية
+    (modules.tracing)؛ قاموسان فارغان إذا كان التتبع معطلًا أو نُفذت المهمة في عملية أخرى.
+    """
+    rows = [r for r in tracing.spans() if r["attributes"].get("tender") == job_id]
+    return tracing.stage_summary(rows), tracing.token_summary(rows).get(job_id, {})
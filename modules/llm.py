@@ -0,0 +1,594 @@
+# modules/llm.py
+"""
+طبقة موحّدة لاستدعاء النماذج اللغوية.
+
+كل الاستدعاءات في التطبيق تمر عبر chat(site, messages, ...) حيث site هو اسم
+موضع الاستدعاء ("evaluator", "analyzer", "chatbot", ...) ويُحدَّد النموذج له
+من MODEL_ROUTES أو من متغير البيئة LLM_MODEL_<SITE>.
+
+الخلفية تُختار بمتغير البيئة LLM_BACKEND:
+  groq          → Groq السحابي (الافتراضي)
+  openai        → أي خادم متوافق مع OpenAI (vLLM / llama.cpp / modules.llm_server)
+  transformers  → تشغيل محلي داخل العملية (ALLaM-7B)
+  fake          → ردود حتمية بدون شبكة لاختبارات الحمل والقياس
+
+chat_stream(site, messages, ...) يعيد ChatStream يُمرّ عليه لتلقي التوكنات فور وصولها،
+ويسجّل زمن أول توكن والزمن الكلي لكل استدعاء (timing_summary()). LLM_STREAM=0 لتعطيل البث.
+ومع التتبع (modules.tracing) كل استدعاء span باسم llm.call: انتظار الطابور، أول توكن، والتوكنات.
+"""
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+
+from dotenv import load_dotenv
+
+from modules import scheduler, tracing
+
+load_dotenv()
+
+# ============================================================
+# 🧭 توجيه النماذج حسب موضع الاستدعاء
+# ============================================================
+MODEL_ROUTES = {
+    "evaluator": "llama-3.1-8b-instant",
+    "analyzer": "llama-3.3-70b-versatile",
+    "translator": "llama-3.3-70b-versatile",
+    "chatbot": "llama-3.1-8b-instant",
+}
+DEFAULT_MODEL = "llama-3.1-8b-instant"
+
+
+def model_for(site: str) -> str:
+    """اسم النموذج لموضع استدعاء معيّن (يمكن تجاوزه بـ LLM_MODEL_<SITE>)."""
+    return os.getenv(f"LLM_MODEL_{site.upper()}") or MODEL_ROUTES.get(site, DEFAULT_MODEL)
+
+
+@dataclass
+class LLMResult:
+    text: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    headers: dict = field(default_factory=dict)
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+# ============================================================
+# 🔌 عميل HTTP مشترك (اتصال واحد مُجمّع لكل العملية)
+# ============================================================
+_http_client = None
+_http_lock = threading.Lock()
+
+
+def shared_http_client():
+    """httpx.Client واحد يُعاد استخدامه بين كل الطلبات وكل الخلفيات."""
+    global _http_client
+    with _http_lock:
+        if _http_client is None:
+            import httpx
+            _http_client = httpx.Client(
+                timeout=httpx.Timeout(float(os.getenv("LLM_TIMEOUT", "120")), connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "32")),
+                    max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "16")),
+                ),
+            )
+        return _http_client
+
+
+# ============================================================
+# 🧱 الخلفيات
+# ============================================================
+class LLMBackend:
+    """الواجهة المشتركة: complete(messages, model, ...) → LLMResult"""
+
+    name = "base"
+    # يقبل response_format={"type": "json_object"} (انظر modules.structured)
+    supports_json_mode = False
+
+    def complete(self, messages, model, temperature=0.3, max_tokens=None, **kwargs) -> LLMResult:
+        raise NotImplementedError
+
+    def stream(self, messages, model, temperature=0.3, max_tokens=None, info=None, **kwargs):
+        """
+        يعيد أجزاء النص (deltas) فور وصولها؛ الافتراضي: الرد كاملًا دفعة واحدة.
+        info: قاموس يُملأ بما يتوفر من prompt_tokens / completion_tokens / headers (لتسوية المجدول).
+        """
+        res = self.complete(messages, model, temperature=temperature, max_tokens=max_tokens, **kwargs)
+        if info is not None:
+            info.update(prompt_tokens=res.prompt_tokens, completion_tokens=res.completion_tokens,
+                        headers=res.headers)
+        yield res.text
+
+
+class GroqBackend(LLMBackend):
+    name = "groq"
+    supports_json_mode = True
+
+    def __init__(self, api_key=None):
+        from groq import Groq
+        api_key = api_key or os.getenv("GROQ_API_KEY")
+        if not api_key:
+            raise RuntimeError("⚠️ GROQ_API_KEY غير مضبوط.")
+        self.client = Groq(api_key=api_key, http_client=shared_http_client())
+
+    def complete(self, messages, model, temperature=0.3, max_tokens=None, **kwargs) -> LLMResult:
+        # with_raw_response حتى تصل رؤوس x-ratelimit-* إلى المجدول
+        raw = self.client.chat.completions.with_raw_response.create(
+            model=model, messages=messages, temperature=temperature,
+            max_tokens=max_tokens, **kwargs,
+        )
+        resp = raw.parse()
+        usage = getattr(resp, "usage", None)
+        return LLMResult(
+            text=(resp.choices[0].message.content or "").strip(),
+            model=model,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+            headers=dict(raw.headers),
+        )
+
+    def stream(self, messages, model, temperature=0.3, max_tokens=None, info=None, **kwargs):
+        raw = self.client.chat.completions.with_raw_response.create(
+            model=model, messages=messages, temperature=temperature,
+            max_tokens=max_tokens, stream=True, **kwargs,
+        )
+        if info is not None:
+            info["headers"] = dict(raw.headers)
+        for chunk in raw.parse():
+            # آخر جزء يحمل usage (x_groq.usage في Groq)
+            usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or getattr(chunk, "usage", None)
+            if usage is not None and info is not None:
+                info.update(prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+                            completion_tokens=getattr(usage, "completion_tokens", 0) or 0)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class OpenAICompatBackend(LLMBackend):
+    """
+    أي خادم يطبّق POST {base_url}/chat/completions (vLLM, llama.cpp, llm_server).
+    LLM_CACHE_PROMPT=1 يرسل cache_prompt=true (llama.cpp) لإعادة استخدام KV للبادئة الثابتة؛
+    vLLM يفعل ذلك من جهته مع --enable-prefix-caching.
+    """
+
+    name = "openai"
+    supports_json_mode = True
+
+    def __init__(self, base_url=None, api_key=None, cache_prompt=None):
+        self.base_url = (base_url or os.getenv("LLM_BASE_URL", "http://127.0.0.1:8001/v1")).rstrip("/")
+        self.api_key = api_key or os.getenv("LLM_API_KEY", "local")
+        self.cache_prompt = os.getenv("LLM_CACHE_PROMPT", "0") == "1" if cache_prompt is None else cache_prompt
+
+    def _body(self, messages, model, temperature, max_tokens, **kwargs) -> dict:
+        body = {"model": model, "messages": messages, "temperature": temperature, **kwargs}
+        if max_tokens:
+            body["max_tokens"] = max_tokens
+        if self.cache_prompt:
+            body["cache_prompt"] = True
+        return body
+
+    def complete(self, messages, model, temperature=0.3, max_tokens=None, **kwargs) -> LLMResult:
+        body = self._body(messages, model, temperature, max_tokens, **kwargs)
+        r = shared_http_client().post(
+            f"{self.base_url}/chat/completions",
+            json=body,
+            headers={"Authorization": f"Bearer {self.api_key}"},
+        )
+        r.raise_for_status()
+        data = r.json()
+        usage = data.get("usage") or {}
+        return LLMResult(
+            text=(data["choices"][0]["message"]["content"] or "").strip(),
+            model=data.get("model", model),
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            headers=dict(r.headers),
+        )
+
+    def stream(self, messages, model, temperature=0.3, max_tokens=None, info=None, **kwargs):
+        """Server-Sent Events: أسطر "data: {...}" حتى "data: [DONE]"."""
+        body = self._body(messages, model, temperature, max_tokens, stream=True, **kwargs)
+        with shared_http_client().stream(
+            "POST", f"{self.base_url}/chat/completions",
+            json=body, headers={"Authorization": f"Bearer {self.api_key}"},
+        ) as r:
+            r.raise_for_status()
+            if info is not None:
+                info["headers"] = dict(r.headers)
+            for line in r.iter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                event = json.loads(data)
+                usage = event.get("usage")
+                if usage and info is not None:
+                    info.update(prompt_tokens=usage.get("prompt_tokens", 0),
+                                completion_tokens=usage.get("completion_tokens", 0))
+                choices = event.get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    yield delta
+
+
+def render_chat(tok, messages, generation_prompt=True) -> str:
+    """قالب المحادثة الخاص بالنموذج (أو ضم الرسائل إن لم يوجد قالب)."""
+    if getattr(tok, "chat_template", None):
+        try:
+            return tok.apply_chat_template(messages, tokenize=False, add_generation_prompt=generation_prompt)
+        except Exception:
+            # قوالب لا تقبل دور system → دمجه في أول رسالة user
+            if messages and messages[0]["role"] == "system" and len(messages) > 1:
+                merged = [{"role": "user", "content": messages[0]["content"] + "\n" + messages[1]["content"]}]
+                return render_chat(tok, merged + list(messages[2:]), generation_prompt)
+            raise
+    return "\n\n".join(m["content"] for m in messages)
+
+
+class TransformersBackend(LLMBackend):
+    """
+    تشغيل ALLaM (أو أي نموذج محلي) داخل العملية — يُحمّل عند أول استدعاء.
+    كاش البادئة: KV لرسالة system (التعليمات والمعايير الثابتة من modules.prompts) يُحسب مرة
+    ويُنسخ لكل طلب بنفس البادئة، فيُحسب نص العرض فقط (LLM_PREFIX_CACHE=0 للتعطيل).
+    """
+
+    name = "transformers"
+
+    def __init__(self, model_path=None, prefix_cache_size=None):
+        self.model_path = model_path or os.getenv("LLM_LOCAL_MODEL", "humain-ai/ALLAM-7B-Instruct-preview")
+        self._lock = threading.Lock()
+        self._tok = self._model = None
+        size = os.getenv("LLM_PREFIX_CACHE", "4") if prefix_cache_size is None else prefix_cache_size
+        self.prefix_cache_size = int(size)
+        self._prefixes = OrderedDict()  # ids البادئة (tuple) → KV cache
+        self.prefix_hits = 0
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                import torch
+                from transformers import AutoTokenizer, AutoModelForCausalLM
+                self._tok = AutoTokenizer.from_pretrained(self.model_path)
+                self._model = AutoModelForCausalLM.from_pretrained(
+                    self.model_path,
+                    torch_dtype=torch.bfloat16 if torch.cuda.is_available() else torch.float32,
+                    device_map="auto",
+                )
+        return self._tok, self._model
+
+    def _prefix_len(self, tok, messages, ids) -> int:
+        """عدد توكنات البادئة الثابتة = الجزء المشترك بين التوجيه كاملًا ورسالة system وحدها."""
+        if not self.prefix_cache_size or not messages or messages[0]["role"] != "system":
+            return 0
+        head = tok(render_chat(tok, messages[:1], generation_prompt=False))["input_ids"]
+        n = 0
+        for a, b in zip(head, ids):
+            if a != b:
+                break
+            n += 1
+        return min(n, len(ids) - 1)  # توكن واحد على الأقل يُحسب في generate
+
+    def _generate_kwargs(self, mdl, inputs, prefix_len: int) -> dict:
+        """past_key_values منسوخ من كاش البادئة (يُحسب ويُخزَّن عند أول ظهور لها)."""
+        if prefix_len < 16:
+            return {}
+        import copy
+        import torch
+        from transformers import DynamicCache
+
+        key = tuple(inputs["input_ids"][0, :prefix_len].tolist())
+        cache = self._prefixes.get(key)
+        if cache is None:
+            with torch.no_grad():
+                cache = mdl(input_ids=inputs["input_ids"][:, :prefix_len], past_key_values=DynamicCache()).past_key_values
+            self._prefixes[key] = cache
+            while len(self._prefixes) > self.prefix_cache_size:
+                self._prefixes.popitem(last=False)
+        else:
+            self.prefix_hits += 1
+            self._prefixes.move_to_end(key)
+        return {"past_key_values": copy.deepcopy(cache)}
+
+    def _inputs(self, messages):
+        tok, mdl = self._load()
+        inputs = tok(render_chat(tok, messages), return_tensors="pt").to(mdl.device)
+        return tok, mdl, inputs, self._prefix_len(tok, messages, inputs["input_ids"][0].tolist())
+
+    def complete(self, messages, model=None, temperature=0.3, max_tokens=None, **kwargs) -> LLMResult:
+        tok, mdl, inputs, prefix_len = self._inputs(messages)
+        with self._lock:  # generate ليست آمنة للتوازي على نفس النموذج
+            out = mdl.generate(
+                **inputs, max_new_tokens=max_tokens or 512,
+                do_sample=temperature > 0, temperature=max(temperature, 1e-5),
+                **self._generate_kwargs(mdl, inputs, prefix_len),
+            )
+        n_in = inputs["input_ids"].shape[1]
+        return LLMResult(
+            text=tok.decode(out[0][n_in:], skip_special_tokens=True).strip(),
+            model=self.model_path,
+            prompt_tokens=int(n_in),
+            completion_tokens=int(out.shape[1] - n_in),
+        )
+
+    def stream(self, messages, model=None, temperature=0.3, max_tokens=None, info=None, **kwargs):
+        from transformers import TextIteratorStreamer
+        tok, mdl, inputs, prefix_len = self._inputs(messages)
+        streamer = TextIteratorStreamer(tok, skip_prompt=True, skip_special_tokens=True)
+
+        def _generate():
+            with self._lock:
+                mdl.generate(
+                    **inputs, streamer=streamer, max_new_tokens=max_tokens or 512,
+                    do_sample=temperature > 0, temperature=max(temperature, 1e-5),
+                    **self._generate_kwargs(mdl, inputs, prefix_len),
+                )
+
+        threading.Thread(target=_generate, daemon=True).start()
+        for piece in streamer:
+            if piece:
+                yield piece
+
+
+class FakeBackend(LLMBackend):
+    """
+    خلفية حتمية بدون شبكة: نفس الطلب → نفس الرد دائمًا.
+    تفهم شكل توجيهات التقييم وتحليل الأقسام فتُرجع JSON صالحًا بنفس المخطط (وإجابات الشاتبوت بمراجع [S..])،
+    مع تأخير مُحقن (latency + jitter) لمحاكاة زمن النموذج الحقيقي.
+    """
+
+    name = "fake"
+    supports_json_mode = True  # يتجاهل response_format لكن ردوده JSON صالح أصلًا
+
+    def __init__(self, latency=None, jitter=None, responder=None):
+        self.latency = float(os.getenv("LLM_FAKE_LATENCY", "0") if latency is None else latency)
+        self.jitter = float(os.getenv("LLM_FAKE_JITTER", "0") if jitter is None else jitter)
+        self.responder = responder or fake_reply
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def _count(self, prompt: str, text: str):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += _approx_tokens(prompt)
+            self.completion_tokens += _approx_tokens(text)
+
+    def complete(self, messages, model, temperature=0.3, max_tokens=None, **kwargs) -> LLMResult:
+        prompt = "\n".join(m["content"] for m in messages)
+        seed = int(hashlib.md5(prompt.encode("utf-8", "ignore")).hexdigest()[:8], 16)
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.Random(seed).uniform(0, self.jitter))
+        text = self.responder(prompt, seed)
+        self._count(prompt, text)
+        return LLMResult(
+            text=text, model=model,
+            prompt_tokens=_approx_tokens(prompt), completion_tokens=_approx_tokens(text),
+        )
+
+    def stream(self, messages, model, temperature=0.3, max_tokens=None, info=None, **kwargs):
+        """نفس رد complete مقسّمًا لأجزاء: 20% من التأخير قبل أول جزء والباقي موزّع عليها."""
+        prompt = "\n".join(m["content"] for m in messages)
+        seed = int(hashlib.md5(prompt.encode("utf-8", "ignore")).hexdigest()[:8], 16)
+        delay = self.latency + random.Random(seed).uniform(0, self.jitter) if (self.latency or self.jitter) else 0
+        text = self.responder(prompt, seed)
+        self._count(prompt, text)
+        if info is not None:
+            info.update(prompt_tokens=_approx_tokens(prompt), completion_tokens=_approx_tokens(text))
+        pieces = [text[i:i + 16] for i in range(0, len(text), 16)] or [""]
+        if delay:
+            time.sleep(delay * 0.2)
+        for piece in pieces:
+            yield piece
+            if delay:
+                time.sleep(delay * 0.8 / len(pieces))
+
+
+def _bullets_after(prompt: str, header: str):
+    """قراءة قائمة "- عنصر" التي تلي عنوانًا معيّنًا في التوجيه."""
+    if header not in prompt:
+        return []
+    items = []
+    for line in prompt.split(header, 1)[1].splitlines()[1:]:
+        if line.startswith("- "):
+            items.append(line[2:].strip())
+        elif items and not line.strip():
+            break
+    return items
+
+
+def fake_reply(prompt: str, seed: int) -> str:
+    """الرد الافتراضي لـ FakeBackend حسب نوع التوجيه."""
+    rnd = random.Random(seed)
+
+    def _scores(crit):
+        return {
+            "scores": [
+                {"criterion": c, "score": rnd.randint(1, 4),
+                 "ai_question": f"هل يغطي العرض {c}؟", "reason": "رد تجريبي حتمي"}
+                for c in crit
+            ],
+            "overall_comment": "تقييم تجريبي من الخلفية الوهمية",
+        }
+
+    if '"offers"' in prompt:
+        crit = _bullets_after(prompt, "المعايير:")
+        ids = re.findall(r"<<<OFFER id=(\w+)", prompt)
+        return json.dumps({"offers": {oid: _scores(crit) for oid in ids}}, ensure_ascii=False)
+    if '"scores"' in prompt:
+        return json.dumps(_scores(_bullets_after(prompt, "المعايير:")), ensure_ascii=False)
+    if '"section"' in prompt:
+        blocks = re.findall(r"<<<SECTION id=(\w+)[^\n]*\nالعنوان: ([^\n]*)", prompt)
+        return json.dumps({"sections": [
+            {"id": sid, "section": re.sub(r"^[\d.\s]+", "", heading).strip(" —") or f"قسم {sid}",
+             "summary": f"ملخص تجريبي للقسم {sid}"}
+            for sid, heading in blocks
+        ]}, ensure_ascii=False)
+    if "المصادر:" in prompt:
+        ids = list(dict.fromkeys(re.findall(r"^\[(S\d+)\]", prompt.rsplit("المصادر:", 1)[1], re.M)))[:2]
+        if not ids:
+            return "لا تتضمن المصادر المرفقة إجابة عن هذا السؤال."
+        return f"إجابة تجريبية ({seed % 1000}) من المصادر المرفقة " + " ".join(f"[{i}]" for i in ids)
+    return f"رد تجريبي ({seed % 1000}) على: {prompt[-200:]}"
+
+
+# ============================================================
+# 🎛️ اختيار الخلفية (نسخة واحدة مشتركة للعملية)
+# ============================================================
+BACKENDS = {
+    "groq": GroqBackend,
+    "openai": OpenAICompatBackend,
+    "transformers": TransformersBackend,
+    "fake": FakeBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> LLMBackend:
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            kind = os.getenv("LLM_BACKEND", "groq").lower()
+            if kind not in BACKENDS:
+                raise ValueError(f"LLM_BACKEND غير معروف: {kind} (المتاح: {', '.join(BACKENDS)})")
+            _backend = BACKENDS[kind]()
+        return _backend
+
+
+def set_backend(backend: LLMBackend):
+    """استبدال الخلفية (للاختبارات والقياس)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def chat(site: str, messages, temperature=0.3, max_tokens=None, backend=None, **kwargs) -> LLMResult:
+    """نقطة الدخول الوحيدة لكل استدعاءات النموذج في التطبيق."""
+    backend = backend or get_backend()
+    model = model_for(site)
+    t0 = time.perf_counter()
+    with tracing.span("llm.call", site=site, model=model, backend=getattr(backend, "name", "?"), streamed=False) as sp:
+        # المجدول: حصة RPM/TPM لكل نموذج + أولوية الشاتبوت + إعادة المحاولة عند 429
+        res = scheduler.run(
+            site, backend, model, messages, max_tokens,
+            lambda: backend.complete(messages, model=model, temperature=temperature, max_tokens=max_tokens, **kwargs),
+        )
+        elapsed = time.perf_counter() - t0
+        sp.set(ttft_s=round(elapsed, 4), prompt_tokens=res.prompt_tokens, completion_tokens=res.completion_tokens)
+    record_timing(site=site, streamed=False, ttft_s=elapsed, total_s=elapsed)
+    return res
+
+
+# ============================================================
+# 📡 البث وقياس زمن أول توكن
+# ============================================================
+STREAM_ENABLED = os.getenv("LLM_STREAM", "1") != "0"
+
+_timings = deque(maxlen=2000)
+_timings_lock = threading.Lock()
+
+
+def record_timing(**row):
+    """تسجيل أزمنة استدعاء واحد: site, streamed, ttft_s, total_s، و ttfr_s (أول صف محلَّل) إن وُجد."""
+    row["ts"] = time.time()
+    with _timings_lock:
+        _timings.append(row)
+
+
+def timing_summary() -> dict:
+    """لكل موضع استدعاء: العدد و p50/p95 لزمن أول توكن وأول صف والزمن الكلي (بالثواني)."""
+    with _timings_lock:
+        rows = list(_timings)
+    out = {}
+    for site in sorted({r["site"] for r in rows}):
+        mine = [r for r in rows if r["site"] == site]
+        entry = {"calls": len(mine), "streamed": sum(1 for r in mine if r.get("streamed"))}
+        for key in ("ttft_s", "ttfr_s", "total_s"):
+            vals = sorted(r[key] for r in mine if r.get(key) is not None)
+            if vals:
+                entry[f"{key[:-2]}_p50"] = round(vals[len(vals) // 2], 3)
+                entry[f"{key[:-2]}_p95"] = round(vals[min(len(vals) - 1, int(len(vals) * 0.95))], 3)
+        out[site] = entry
+    return out
+
+
+class ChatStream:
+    """
+    استدعاء مبثوث: for delta in ChatStream(...) يعيد أجزاء النص فور وصولها.
+    بعد الانتهاء: .text النص الكامل، .ttft_s زمن أول توكن، .total_s الزمن الكلي،
+    ويُستدعى mark_row() من المحلل عند اكتمال أول صف لتسجيل ttfr_s.
+    """
+
+    def __init__(self, site, messages, temperature=0.3, max_tokens=None, backend=None, **kwargs):
+        self.site = site
+        self.backend = backend or get_backend()
+        self.args = (messages, model_for(site))
+        self.kwargs = dict(temperature=temperature, max_tokens=max_tokens, **kwargs)
+        self.text = ""
+        self.ttft_s = self.ttfr_s = self.total_s = None
+        self._t0 = None
+
+    def mark_row(self):
+        if self.ttfr_s is None and self._t0 is not None:
+            self.ttfr_s = time.perf_counter() - self._t0
+
+    @staticmethod
+    def _usage(info: dict, messages, parts) -> int:
+        """التوكنات الفعلية من usage الخلفية إن أرسلتها، وإلا تقدير من طول النص."""
+        if info.get("completion_tokens"):
+            return (info.get("prompt_tokens") or 0) + info["completion_tokens"]
+        return sum(_approx_tokens(m.get("content", "")) for m in messages) + _approx_tokens("".join(parts))
+
+    def __iter__(self):
+        self._t0 = time.perf_counter()
+        parts = []
+        messages, model = self.args
+        with tracing.span("llm.call", site=self.site, model=model, backend=getattr(self.backend, "name", "?"),
+                         streamed=True) as sp:
+            info = {}
+            for attempt in range(scheduler.MAX_RETRIES + 1):
+                try:
+                    slot = scheduler.Slot(self.site, self.backend, model, messages, self.kwargs.get("max_tokens"))
+                    with slot:
+                        for delta in self.backend.stream(*self.args, info=info, **self.kwargs):
+                            if self.ttft_s is None:
+                                self.ttft_s = time.perf_counter() - self._t0
+                            parts.append(delta)
+                            yield delta
+                        slot.done(self._usage(info, messages, parts), info.get("headers"))
+                    break
+                except Exception as e:
+                    # إعادة المحاولة فقط إذا لم يصل أي جزء بعد (وإلا تتكرر الصفوف المبثوثة)
+                    if parts or not scheduler.ENABLED or not scheduler.is_retryable(e) \
+                            or attempt == scheduler.MAX_RETRIES:
+                        raise
+                    sp.add(retries=1)
+                    time.sleep(scheduler.backoff(
+                        attempt, scheduler.parse_duration(scheduler.headers_of(e).get("retry-after"))))
+            self.text = "".join(parts).strip()
+            self.total_s = time.perf_counter() - self._t0
+            # usage من الخلفية إن أرسلته مع البث، وإلا تقدير من طول النص
+            measured = bool(info.get("completion_tokens"))
+            prompt_tokens = (info.get("prompt_tokens") or 0) if measured else \
+                sum(_approx_tokens(m.get("content", "")) for m in messages)
+            completion_tokens = info["completion_tokens"] if measured else _approx_tokens(self.text)
+            sp.set(ttft_s=self.ttft_s and round(self.ttft_s, 4), ttfr_s=self.ttfr_s and round(self.ttfr_s, 4),
+                   prompt_tokens=prompt_tokens, completion_tokens=completion_tokens, tokens_estimated=not measured)
+        record_timing(site=self.site, streamed=True, ttft_s=self.ttft_s, ttfr_s=self.ttfr_s, total_s=self.total_s)
+
+
+def chat_stream(site: str, messages, temperature=0.3, max_tokens=None, backend=None, **kwargs) -> ChatStream:
+    return ChatStream(site, messages, temperature, max_tokens, backend, **kwargs)
@@ -0,0 +1,218 @@
+# modules/llm_server.py
+"""
+خادم محلي متوافق مع OpenAI يغلّف أي خلفية من modules.llm.
+يُستخدم كبديل للنموذج السحابي في اختبارات الحمل: التطبيق يشير إليه عبر
+LLM_BACKEND=openai و LLM_BASE_URL=http://127.0.0.1:8001/v1
+
+python -m modules.llm_server --backend fake --port 8001 --latency 0.3
+
+--backend local: ALLaM محليًا بتجميع مستمر (modules.local_llm)، مع --model/--quantize/--max-batch
+(--model fake لمحرّك محاكاة بدون torch). GET /v1/stats يعيد إحصاءات الدفعات.
+
+--rpm / --tpm تحاكي حصص Groq: رؤوس x-ratelimit-* في كل رد، و 429 مع retry-after عند التجاوز
+(لاختبار modules.scheduler محليًا).
+"""
+import json
+import time
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from modules.llm import BACKENDS, FakeBackend, LLMBackend, _approx_tokens
+
+
+class ServerLimits:
+    """نافذة منزلقة 60 ثانية للطلبات والتوكنات (prompt + max_tokens كما تحتسبها Groq)."""
+
+    def __init__(self, rpm: int = None, tpm: int = None, window: float = 60.0):
+        self.rpm, self.tpm, self.window = rpm, tpm, window
+        self.log = deque()  # (ts, tokens)
+        self.lock = threading.Lock()
+        self.rejected = 0
+
+    def check(self, tokens: int):
+        """(مسموح؟، رؤوس x-ratelimit-*، retry_after)"""
+        with self.lock:
+            now = time.time()
+            while self.log and now - self.log[0][0] >= self.window:
+                self.log.popleft()
+            used_r = len(self.log)
+            used_t = sum(t for _, t in self.log)
+            ok = (not self.rpm or used_r + 1 <= self.rpm) and (not self.tpm or used_t + tokens <= self.tpm)
+            if ok:
+                self.log.append((now, tokens))
+                used_r, used_t = used_r + 1, used_t + tokens
+            else:
+                self.rejected += 1
+            reset = self.window - (now - self.log[0][0]) if self.log else 0.0
+            headers = {}
+            if self.rpm:
+                headers.update({
+                    "x-ratelimit-limit-requests": self.rpm,
+                    "x-ratelimit-remaining-requests": max(0, self.rpm - used_r),
+                    "x-ratelimit-reset-requests": f"{reset:.2f}s",
+                })
+            if self.tpm:
+                headers.update({
+                    "x-ratelimit-limit-tokens": self.tpm,
+                    "x-ratelimit-remaining-tokens": max(0, self.tpm - used_t),
+                    "x-ratelimit-reset-tokens": f"{reset:.2f}s",
+                })
+            retry_after = None
+            if not ok:
+                # أقرب وقت يتحرر فيه ما يكفي
+                need_t, freed, retry_after = used_t + tokens - (self.tpm or 10 ** 12), 0, reset
+                for ts, t in self.log:
+                    freed += t
+                    retry_after = self.window - (now - ts)
+                    if freed >= need_t and (not self.rpm or used_r - 1 < self.rpm):
+                        break
+                headers["retry-after"] = f"{max(retry_after, 0.05):.2f}"
+            return ok, headers, retry_after
+
+
+def make_handler(backend: LLMBackend, limits: ServerLimits = None):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive حتى يُعاد استخدام الاتصال المُجمّع
+        disable_nagle_algorithm = True  # الرأس والجسم يُرسلان منفصلين؛ بدونه تأخير ~40ms لكل طلب
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code: int, payload: dict, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, str(v))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_stream(self, req: dict, headers=None):
+            """"stream": true → Server-Sent Events بصيغة OpenAI (chunked) حتى data: [DONE]."""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            for k, v in (headers or {}).items():
+                self.send_header(k, str(v))
+            self.end_headers()
+
+            def _event(payload):
+                data = f"data: {payload}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            cid = f"chatcmpl-{time.time_ns()}"
+            model = req.get("model", backend.name)
+            for delta in backend.stream(
+                req.get("messages", []), model=model,
+                temperature=req.get("temperature", 0.3), max_tokens=req.get("max_tokens"),
+            ):
+                _event(json.dumps({
+                    "id": cid, "object": "chat.completion.chunk", "model": model,
+                    "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}],
+                }, ensure_ascii=False))
+            _event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._send(200, {"object": "list", "data": [{"id": backend.name, "object": "model"}]})
+            elif self.path.rstrip("/").endswith("/stats") and hasattr(backend, "batcher"):
+                self._send(200, backend.batcher.stats())
+            else:
+                self._send(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                return self._send(404, {"error": {"message": "not found"}})
+            req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            headers = {}
+            if limits is not None:
+                prompt = "\n".join(m.get("content", "") for m in req.get("messages", []))
+                ok, headers, _ = limits.check(_approx_tokens(prompt) + (req.get("max_tokens") or 0))
+                if not ok:
+                    return self._send(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                                      headers)
+            if req.get("stream"):
+                return self._send_stream(req, headers)
+            try:
+                res = backend.complete(
+                    req.get("messages", []),
+                    model=req.get("model", backend.name),
+                    temperature=req.get("temperature", 0.3),
+                    max_tokens=req.get("max_tokens"),
+                )
+            except Exception as e:
+                return self._send(500, {"error": {"message": str(e)}})
+            self._send(200, {
+                "id": f"chatcmpl-{time.time_ns()}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": res.model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": res.text},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": res.prompt_tokens,
+                    "completion_tokens": res.completion_tokens,
+                    "total_tokens": res.prompt_tokens + res.completion_tokens,
+                },
+            }, headers)
+
+    return Handler
+
+
+def serve(backend: LLMBackend, host="127.0.0.1", port=8001, background=False, rpm=None, tpm=None,
+          window: float = 60.0):
+    """
+    تشغيل الخادم؛ background=True يعيده يعمل في thread جانبي (للقياس). server.limits للإحصاءات.
+    window: طول نافذة الحصة بالثواني (أقصر من 60 لتسريع القياس).
+    """
+    limits = ServerLimits(rpm, tpm, window) if (rpm or tpm) else None
+    server = ThreadingHTTPServer((host, port), make_handler(backend, limits))
+    server.limits = limits
+    server.daemon_threads = True
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    print(f"🚀 خادم النموذج المحلي ({backend.name}) على http://{host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser(description="OpenAI-compatible local LLM stand-in")
+    ap.add_argument("--backend", default="fake", choices=[k for k in BACKENDS if k != "openai"] + ["local"])
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8001)
+    ap.add_argument("--latency", type=float, default=0.0, help="fake backend: ثوانٍ لكل طلب")
+    ap.add_argument("--jitter", type=float, default=0.0)
+    ap.add_argument("--rpm", type=int, default=None, help="حد الطلبات في الدقيقة (429 عند التجاوز)")
+    ap.add_argument("--tpm", type=int, default=None, help="حد التوكنات في الدقيقة")
+    ap.add_argument("--model", default=None, help="local: مسار/اسم النموذج (fake = محاكاة بدون torch)")
+    ap.add_argument("--quantize", default=None, help="local: none | int8 (CPU) | bf16")
+    ap.add_argument("--max-batch", type=int, default=None, help="local: أقصى عدد طلبات في الدفعة")
+    args = ap.parse_args()
+
+    if args.backend == "local":
+        from modules.local_llm import LocalBackend, QUANTIZE, MAX_BATCH
+        backend = LocalBackend(args.model, quantize=args.quantize or QUANTIZE, max_batch=args.max_batch or MAX_BATCH)
+    elif args.backend == "fake":
+        backend = FakeBackend(latency=args.latency, jitter=args.jitter)
+    else:
+        backend = BACKENDS[args.backend]()
+    serve(backend, args.host, args.port, rpm=args.rpm, tpm=args.tpm)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+# modules/local_llm.py
+"""
+استدلال محلي لـ ALLaM (للمنافسات السرية بدون أي اتصال خارجي) مع تجميع مستمر للطلبات.
+
+- ContinuousBatcher: thread واحد يملك النموذج؛ الطلبات المتزامنة (من تقييم العروض وتحليل
+  الأقسام عبر الخادم) تنضم للدفعة الجارية فور وصولها بعد prefill خاص بها، وكل خطوة decode
+  تولّد توكنًا واحدًا لكل الطلبات النشطة معًا، والطلب المنتهي يخرج دون انتظار البقية.
+- TorchEngine: transformers على CPU أو GPU؛ KV الدفعة محشو من اليسار مع attention mask
+  وposition_ids لكل صف. LOCAL_LLM_QUANTIZE=int8 → تكميم ديناميكي لطبقات Linear على CPU،
+  bf16 → أوزان bfloat16.
+- FakeEngine: بديل بدون torch بتكلفة محاكاة (prefill لكل توكن + خطوة decode لكل دفعة)
+  وردود modules.llm.fake_reply، لاختبار الخادم والقياس على أي جهاز.
+- LocalBackend: خلفية LLMBackend فوق المجمّع؛ تُقدَّم عبر modules.llm_server بواجهة OpenAI:
+
+  python -m modules.llm_server --backend local --model humain-ai/ALLAM-7B-Instruct-preview --quantize int8
+  ثم في التطبيق: LLM_BACKEND=openai LLM_BASE_URL=http://127.0.0.1:8001/v1
+
+LOCAL_LLM_MAX_BATCH (افتراضي 8)، LOCAL_LLM_DEVICE (auto|cpu|cuda)، LOCAL_LLM_THREADS.
+"""
+import os
+import time
+import queue
+import random
+import threading
+from collections import deque
+
+from modules.llm import LLMBackend, LLMResult, fake_reply, render_chat
+
+LOCAL_MODEL = os.getenv("LLM_LOCAL_MODEL", "humain-ai/ALLAM-7B-Instruct-preview")
+QUANTIZE = os.getenv("LOCAL_LLM_QUANTIZE", "none")
+QUANTIZE_MODES = ("none", "int8", "bf16")
+MAX_BATCH = int(os.getenv("LOCAL_LLM_MAX_BATCH", "8"))
+DEVICE = os.getenv("LOCAL_LLM_DEVICE", "auto")
+THREADS = int(os.getenv("LOCAL_LLM_THREADS", "0"))
+DEFAULT_MAX_NEW_TOKENS = 512
+
+
+# ============================================================
+# 🧮 المحرّكات: prefill لطلب جديد + خطوة decode للدفعة كاملة
+# ============================================================
+class TorchEngine:
+    """
+    واجهة المحرّك (join/step/drop من thread المجمّع فقط؛ encode من threads الطلبات):
+      encode(messages) → ids | detok(ids) → نص | eos_ids
+      join(ids, temperature) → أول توكن (ويُضاف الطلب كصف جديد في الدفعة)
+      step(tokens, temperatures) → توكن تالٍ لكل صف | drop(rows) → حذف صفوف منتهية
+      reset() → تفريغ الدفعة (بعد خطأ)
+    """
+
+    def __init__(self, model_path: str = None, quantize: str = QUANTIZE, device: str = DEVICE,
+                 threads: int = THREADS):
+        import torch
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+
+        if quantize not in QUANTIZE_MODES:
+            raise ValueError(f"LOCAL_LLM_QUANTIZE غير معروف: {quantize} (المتاح: {', '.join(QUANTIZE_MODES)})")
+        self.torch = torch
+        self.model_path = model_path or LOCAL_MODEL
+        if device == "auto":
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        if threads:
+            torch.set_num_threads(threads)
+        dtype = torch.bfloat16 if (quantize == "bf16" or device == "cuda") else torch.float32
+        self.tok = AutoTokenizer.from_pretrained(self.model_path)
+        model = AutoModelForCausalLM.from_pretrained(self.model_path, torch_dtype=dtype).to(device).eval()
+        if quantize == "int8":
+            if device != "cpu":
+                raise ValueError("التكميم int8 الديناميكي متاح على CPU فقط")
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model, self.device = model, device
+        eos = self.tok.eos_token_id
+        self.eos_ids = set(eos if isinstance(eos, list) else [eos]) - {None}
+        self._tok_lock = threading.Lock()  # encode يُستدعى من threads الطلبات
+        self.kv = None    # [(k, v)] لكل طبقة، الشكل (B, heads, L, dim)
+        self.mask = None  # (B, L): 1 = توكن حقيقي، 0 = حشو يسار
+
+    def encode(self, messages) -> list:
+        with self._tok_lock:
+            return self.tok(render_chat(self.tok, messages))["input_ids"]
+
+    def detok(self, ids) -> str:
+        with self._tok_lock:
+            return self.tok.decode(ids, skip_special_tokens=True)
+
+    def reset(self):
+        self.kv = self.mask = None
+
+    # ---------- KV ----------
+    def _as_cache(self, kv):
+        from transformers import DynamicCache
+        cache = DynamicCache()
+        for i, (k, v) in enumerate(kv):
+            cache.update(k, v, i)
+        return cache
+
+    @staticmethod
+    def _as_tensors(cache):
+        if hasattr(cache, "to_legacy_cache"):
+            return list(cache.to_legacy_cache())
+        if hasattr(cache, "layers"):
+            return [(layer.keys, layer.values) for layer in cache.layers]
+        return list(cache)
+
+    def _pad_left(self, kv, mask, length):
+        torch = self.torch
+        pad = length - mask.shape[1]
+        if pad <= 0:
+            return kv, mask
+        kv = [(torch.nn.functional.pad(k, (0, 0, pad, 0)), torch.nn.functional.pad(v, (0, 0, pad, 0)))
+              for k, v in kv]
+        return kv, torch.nn.functional.pad(mask, (pad, 0))
+
+    def _sample(self, logits, temperature: float) -> int:
+        torch = self.torch
+        if temperature <= 1e-5:
+            return int(torch.argmax(logits))
+        probs = torch.softmax(logits.float() / temperature, dim=-1)
+        return int(torch.multinomial(probs, 1))
+
+    # ---------- الدفعة ----------
+    def join(self, ids, temperature: float) -> int:
+        torch = self.torch
+        with torch.inference_mode():
+            x = torch.tensor([ids], device=self.device)
+            out = self.model(input_ids=x, use_cache=True)
+            kv = self._as_tensors(out.past_key_values)
+            mask = torch.ones(1, len(ids), dtype=torch.long, device=self.device)
+            if self.kv is None:
+                self.kv, self.mask = kv, mask
+            else:
+                length = max(self.mask.shape[1], mask.shape[1])
+                old_kv, old_mask = self._pad_left(self.kv, self.mask, length)
+                kv, mask = self._pad_left(kv, mask, length)
+                self.kv = [(torch.cat([ok, k]), torch.cat([ov, v])) for (ok, ov), (k, v) in zip(old_kv, kv)]
+                self.mask = torch.cat([old_mask, mask])
+            return self._sample(out.logits[0, -1], temperature)
+
+    def step(self, tokens, temperatures) -> list:
+        torch = self.torch
+        with torch.inference_mode():
+            x = torch.tensor(tokens, device=self.device).unsqueeze(1)
+            positions = self.mask.sum(dim=1, keepdim=True)
+            mask = torch.cat([self.mask, torch.ones_like(positions)], dim=1)
+            out = self.model(
+                input_ids=x, attention_mask=mask, position_ids=positions,
+                past_key_values=self._as_cache(self.kv), use_cache=True,
+            )
+            self.kv, self.mask = self._as_tensors(out.past_key_values), mask
+            return [self._sample(out.logits[i, -1], t) for i, t in enumerate(temperatures)]
+
+    def drop(self, rows):
+        torch = self.torch
+        keep = [i for i in range(self.mask.shape[0]) if i not in set(rows)]
+        if not keep:
+            self.kv = self.mask = None
+            return
+        idx = torch.tensor(keep, device=self.device)
+        mask = self.mask.index_select(0, idx)
+        # أعمدة حشو لم تعد تخص أي صف متبقٍ
+        start = int((mask.sum(dim=0) > 0).nonzero()[0])
+        self.mask = mask[:, start:]
+        self.kv = [(k.index_select(0, idx)[:, :, start:], v.index_select(0, idx)[:, :, start:]) for k, v in self.kv]
+
+
+class FakeEngine:
+    """
+    محرّك محاكاة بدون torch: تكلفة prefill_s لكل توكن إدخال، وخطوة decode تكلّف
+    step_s + row_s × حجم الدفعة (الجزء الثابت هو ما يوفّره التجميع). الرد من fake_reply
+    مقسّمًا إلى توكنات من 4 أحرف.
+    """
+
+    def __init__(self, prefill_s: float = 0.00005, step_s: float = 0.01, row_s: float = 0.001):
+        self.prefill_s, self.step_s, self.row_s = prefill_s, step_s, row_s
+        self.vocab = {}
+        self.pieces = []
+        self.rows = []  # لكل صف: توكنات الرد المتبقية
+        self.eos_ids = {0}
+        self._lock = threading.Lock()
+        self._id("")  # 0 = نهاية الرد
+
+    def _id(self, piece: str) -> int:
+        with self._lock:
+            if piece not in self.vocab:
+                self.vocab[piece] = len(self.pieces)
+                self.pieces.append(piece)
+            return self.vocab[piece]
+
+    def encode(self, messages) -> list:
+        prompt = "\n".join(m["content"] for m in messages)
+        return [self._id(prompt[i:i + 4]) for i in range(0, len(prompt), 4)]
+
+    def detok(self, ids) -> str:
+        return "".join(self.pieces[i] for i in ids)
+
+    def join(self, ids, temperature: float) -> int:
+        prompt = self.detok(ids)
+        time.sleep(self.prefill_s * len(ids))
+        reply = fake_reply(prompt, random.Random(prompt).randrange(1 << 30))
+        self.rows.append(deque([self._id(reply[i:i + 4]) for i in range(0, len(reply), 4)] + [0]))
+        return self.rows[-1].popleft()
+
+    def step(self, tokens, temperatures) -> list:
+        time.sleep(self.step_s + self.row_s * len(tokens))
+        return [row.popleft() if row else 0 for row in self.rows]
+
+    def drop(self, rows):
+        self.rows = [r for i, r in enumerate(self.rows) if i not in set(rows)]
+
+    def reset(self):
+        self.rows = []
+
+
+# ============================================================
+# 🔄 التجميع المستمر
+# ============================================================
+class _Request:
+    def __init__(self, ids, max_new_tokens, temperature):
+        self.ids = ids
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.generated = []
+        self.text = ""
+        self.out = queue.Queue()  # أجزاء النص، ثم None عند الانتهاء (أو Exception)
+        self.t_submit = time.perf_counter()
+
+
+class ContinuousBatcher:
+    """
+    حلقة واحدة: إدخال الطلبات المنتظرة حتى max_batch (prefill لكل طلب) ← خطوة decode
+    للدفعة كاملة ← إخراج الطلبات المنتهية (EOS أو max_new_tokens) فورًا.
+    """
+
+    def __init__(self, engine, max_batch: int = MAX_BATCH):
+        self.engine = engine
+        self.max_batch = max(1, int(max_batch))
+        self._waiting = deque()
+        self._active = []
+        self._cv = threading.Condition()
+        self._stats = {"requests": 0, "prompt_tokens": 0, "generated_tokens": 0, "steps": 0, "batch_rows": 0}
+        self._started = time.perf_counter()
+        threading.Thread(target=self._loop, daemon=True, name="local-llm").start()
+
+    def submit(self, messages, max_new_tokens=None, temperature=0.3) -> _Request:
+        req = _Request(self.engine.encode(messages), max_new_tokens or DEFAULT_MAX_NEW_TOKENS, temperature)
+        with self._cv:
+            self._waiting.append(req)
+            self._cv.notify()
+        return req
+
+    def _emit(self, req: _Request, token: int) -> bool:
+        """يضيف التوكن ويرسل النص الجديد؛ True إذا انتهى الطلب."""
+        done = token in self.engine.eos_ids
+        if not done:
+            req.generated.append(token)
+            text = self.engine.detok(req.generated)
+            # حرف غير مكتمل (UTF-8 مقطوع) يُؤجَّل للتوكن التالي
+            if not text.endswith("�") and len(text) > len(req.text):
+                req.out.put(text[len(req.text):])
+                req.text = text
+            done = len(req.generated) >= req.max_new_tokens
+        if done:
+            req.out.put(None)
+        return done
+
+    def _loop(self):
+        while True:
+            with self._cv:
+                while not self._waiting and not self._active:
+                    self._cv.wait()
+                admit = []
+                while self._waiting and len(self._active) + len(admit) < self.max_batch:
+                    admit.append(self._waiting.popleft())
+            finished = []
+            try:
+                for req in admit:
+                    self._stats["requests"] += 1
+                    self._stats["prompt_tokens"] += len(req.ids)
+                    self._active.append(req)
+                    self._stats["generated_tokens"] += 1
+                    if self._emit(req, self.engine.join(req.ids, req.temperature)):
+                        finished.append(len(self._active) - 1)
+                self._retire(finished)
+
+                if self._active:
+                    tokens = [r.generated[-1] if r.generated else 0 for r in self._active]
+                    nxt = self.engine.step(tokens, [r.temperature for r in self._active])
+                    self._stats["steps"] += 1
+                    self._stats["batch_rows"] += len(self._active)
+                    self._stats["generated_tokens"] += len(nxt)
+                    self._retire([i for i, (r, t) in enumerate(zip(self._active, nxt)) if self._emit(r, t)])
+            except Exception as e:
+                # خطأ في النموذج: كل الطلبات النشطة تفشل، والحالة تُصفَّر للطلبات التالية
+                for req in self._active:
+                    req.out.put(e)
+                self._active = []
+                self.engine.reset()
+
+    def _retire(self, rows):
+        if rows:
+            self.engine.drop(rows)
+            self._active = [r for i, r in enumerate(self._active) if i not in set(rows)]
+
+    def stats(self) -> dict:
+        s = dict(self._stats)
+        elapsed = time.perf_counter() - self._started
+        s["avg_batch"] = round(s["batch_rows"] / s["steps"], 2) if s["steps"] else 0.0
+        s["tokens_per_s"] = round(s["generated_tokens"] / elapsed, 1) if elapsed else 0.0
+        s["queued"] = len(self._waiting)
+        s["active"] = len(self._active)
+        return s
+
+
+# ============================================================
+# 🔌 الخلفية
+# ============================================================
+class LocalBackend(LLMBackend):
+    """خلفية LLMBackend فوق ContinuousBatcher (model="fake" → FakeEngine بدون torch)."""
+
+    name = "local"
+
+    def __init__(self, model_path=None, quantize=QUANTIZE, max_batch=MAX_BATCH, device=DEVICE, engine=None):
+        self.model_path = model_path or LOCAL_MODEL
+        if engine is None:
+            engine = FakeEngine() if self.model_path == "fake" else TorchEngine(self.model_path, quantize, device)
+        self.batcher = ContinuousBatcher(engine, max_batch)
+
+    def stream(self, messages, model=None, temperature=0.3, max_tokens=None, **kwargs):
+        req = self.batcher.submit(messages, max_tokens, temperature)
+        while True:
+            piece = req.out.get()
+            if piece is None:
+                return
+            if isinstance(piece, Exception):
+                raise piece
+            yield piece
+
+    def complete(self, messages, model=None, temperature=0.3, max_tokens=None, **kwargs) -> LLMResult:
+        req = self.batcher.submit(messages, max_tokens, temperature)
+        while True:
+            piece = req.out.get()
+            if piece is None:
+                break
+            if isinstance(piece, Exception):
+                raise piece
+        return LLMResult(
+            text=req.text.strip(), model=self.model_path,
+            prompt_tokens=len(req.ids), completion_tokens=len(req.generated),
+        )
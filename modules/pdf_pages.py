@@ -0,0 +1,138 @@
+# modules/pdf_pages.py
+"""
+قراءة صفحات PDF بشكل كسول + مرحلة OCR للصفحات الممسوحة ضوئيًا. وحدة خفيفة
+(PyMuPDF فقط، بدون Streamlit) لأن عمليات ProcessPool تستوردها عند التشغيل بطريقة spawn.
+
+OCR اختياري: يتطلب pytesseract + tesseract مع حزمتي ara و eng.
+OCR_ENABLED=0 لتعطيله، OCR_LANG / OCR_DPI / OCR_MIN_CHARS للضبط.
+"""
+import os
+import time
+import hashlib
+
+import fitz  # PyMuPDF
+
+OCR_ENABLED = os.getenv("OCR_ENABLED", "1") != "0"
+OCR_LANG = os.getenv("OCR_LANG", "ara+eng")
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+# صفحة نصها الأصلي أقل من هذا وتحتوي صورة → تُرسل إلى OCR
+OCR_MIN_CHARS = int(os.getenv("OCR_MIN_CHARS", "20"))
+OCR_ENGINE_VERSION = "tesseract-v1"
+# أسطر أطول من هذا لا تُعد عناوين، فلا يُحفظ تنسيقها
+STYLE_MAX_CHARS = 120
+
+_ocr_status = None
+
+
+def ocr_available():
+    """(متاح؟، سبب عدم التوفر) — يُفحص مرة واحدة لكل عملية."""
+    global _ocr_status
+    if _ocr_status is None:
+        if not OCR_ENABLED:
+            _ocr_status = (False, "OCR_ENABLED=0")
+        else:
+            try:
+                import pytesseract
+                langs = set(pytesseract.get_languages(config=""))
+                missing = [l for l in OCR_LANG.split("+") if l not in langs]
+                _ocr_status = (False, f"حزم لغة tesseract غير مثبتة: {', '.join(missing)}") if missing \
+                    else (True, "")
+            except Exception as e:
+                _ocr_status = (False, f"pytesseract/tesseract غير متوفر ({e})")
+    return _ocr_status
+
+
+def _ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 2)
+
+
+def _page_styles(page) -> dict:
+    """
+    تنسيق الأسطر من مخرجات dict لـ PyMuPDF لاكتشاف العناوين (modules.segmentation):
+    body = حجم خط المتن (الأكثر تكرارًا بعدد الأحرف)، lines = الأسطر القصيرة الأكبر من المتن
+    أو العريضة بالكامل فقط [[النص، الحجم، عريض؟], ...].
+    """
+    sizes, lines = {}, []
+    for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+        for line in block.get("lines", []):
+            spans = [s for s in line["spans"] if s["text"].strip()]
+            if not spans:
+                continue
+            text = "".join(s["text"] for s in line["spans"]).strip()
+            span_sizes = [round(s["size"] * 2) / 2 for s in spans]
+            for s, k in zip(spans, span_sizes):
+                sizes[k] = sizes.get(k, 0) + len(s["text"])
+            size = max(span_sizes)
+            bold = all(s["flags"] & fitz.TEXT_FONT_BOLD or "bold" in s["font"].lower() for s in spans)
+            if len(text) <= STYLE_MAX_CHARS:
+                lines.append([text, size, bool(bold)])
+    body = max(sizes, key=sizes.get) if sizes else 0.0
+    return {"body": body, "lines": [l for l in lines if l[1] > body or l[2]]}
+
+
+def _page_record(page, i: int) -> dict:
+    """المسار السريع: النص الأصلي فقط، مع تحديد الحاجة لـ OCR دون أي rendering."""
+    t0 = time.perf_counter()
+    text = page.get_text("text") or ""
+    native_ms = _ms(t0)
+    needs_ocr = len(text.strip()) < OCR_MIN_CHARS and bool(page.get_images(full=False))
+    return {"page_num": i + 1, "text": text, "method": "text", "native_ms": native_ms, "needs_ocr": needs_ocr}
+
+
+def iter_pdf_pages(source, start: int = 0, stop: int = None):
+    """
+    يعيد الصفحات بشكل كسول (generator) من مسار أو bytes:
+    {"page_num": 1, "text": "...", "method", "native_ms", "needs_ocr"} صفحة تلو الأخرى دون تحميل الباقي.
+    """
+    doc = fitz.open(source) if isinstance(source, str) else fitz.open(stream=source, filetype="pdf")
+    try:
+        stop = doc.page_count if stop is None else min(stop, doc.page_count)
+        for i in range(start, stop):
+            yield _page_record(doc.load_page(i), i)
+    finally:
+        doc.close()
+
+
+def iter_page_styles(path: str):
+    """
+    تمريرة منفصلة للتنسيق فقط (تحليل الأقسام وحده يحتاجها، فلا يدفع التقييم كلفة dict):
+    {"page_num": 1, "styles": {"body", "lines"}} لكل صفحة.
+    """
+    with fitz.open(path) as doc:
+        for i in range(doc.page_count):
+            yield {"page_num": i + 1, "styles": _page_styles(doc.load_page(i))}
+
+
+def extract_range(path: str, start: int, stop: int) -> list:
+    """عامل في ProcessPool: سجلات مدى من الصفحات."""
+    return list(iter_pdf_pages(path, start, stop))
+
+
+def ocr_page(path: str, index: int) -> dict:
+    """
+    عامل في ProcessPool: رسم صفحة واحدة كصورة ثم OCR، مع كاش حسب بصمة الصورة
+    (نفس الصفحة الممسوحة في ملف آخر أو رفع جديد لا يُعاد تمييزها).
+    """
+    from modules.cache import DiskCache, make_key
+
+    t0 = time.perf_counter()
+    with fitz.open(path) as doc:
+        pix = doc.load_page(index).get_pixmap(dpi=OCR_DPI, colorspace=fitz.csGRAY)
+    png = pix.tobytes("png")
+    render_ms = _ms(t0)
+
+    cache = DiskCache("ocr")
+    key = make_key("ocr", hashlib.md5(png).hexdigest(), OCR_LANG, OCR_DPI, OCR_ENGINE_VERSION)
+    text = cache.get(key)
+    if text is not None:
+        return {"text": text, "method": "ocr-cache", "render_ms": render_ms, "ocr_ms": 0.0}
+
+    import io
+    import pytesseract
+    from PIL import Image
+
+    t1 = time.perf_counter()
+    text = pytesseract.image_to_string(Image.open(io.BytesIO(png)), lang=OCR_LANG)
+    ocr_ms = _ms(t1)
+    cache.set(key, text)
+    return {"text": text, "method": "ocr", "render_ms": render_ms, "ocr_ms": ocr_ms}
@@ -0,0 +1,129 @@
+# modules/progress.py
+"""
+واجهة موحّدة للرسائل والتقدّم حتى تعمل الوحدات الأساسية داخل Streamlit وخارجه.
+
+الوحدات الأساسية (evaluator / analyzer / extractors) تستدعي get_reporter() بدل st.*:
+  - داخل `streamlit run` → StreamlitReporter (st.info / st.progress / st.spinner ...)
+  - خارجه (CLI، مهام الخلفية، القياس) → LogReporter عبر logging
+"""
+import logging
+import threading
+from contextlib import contextmanager
+
+log = logging.getLogger("ai_tender")
+
+
+class Reporter:
+    """الواجهة الأساسية: كل الدوال اختيارية ولا تفعل شيئًا افتراضيًا."""
+
+    def info(self, msg: str): pass
+    def success(self, msg: str): pass
+    def warning(self, msg: str): pass
+    def error(self, msg: str): pass
+    def caption(self, msg: str): pass
+
+    def progress(self, done: int, total: int, text: str = ""):
+        pass
+
+    def progress_done(self):
+        pass
+
+    @contextmanager
+    def spinner(self, text: str):
+        yield
+
+
+class LogReporter(Reporter):
+    def info(self, msg): log.info(msg)
+    def success(self, msg): log.info(msg)
+    def warning(self, msg): log.warning(msg)
+    def error(self, msg): log.error(msg)
+    def caption(self, msg): log.info(msg)
+
+    def progress(self, done, total, text=""):
+        log.info(f"[{done}/{total}] {text}")
+
+    @contextmanager
+    def spinner(self, text):
+        log.info(text)
+        yield
+
+
+class StreamlitReporter(Reporter):
+    def __init__(self):
+        import streamlit as st
+        self.st = st
+        self._bar = None
+
+    def info(self, msg): self.st.info(msg)
+    def success(self, msg): self.st.success(msg)
+    def warning(self, msg): self.st.warning(msg)
+    def error(self, msg): self.st.error(msg)
+    def caption(self, msg): self.st.caption(msg)
+
+    def progress(self, done, total, text=""):
+        value = done / total if total else 1.0
+        if self._bar is None:
+            self._bar = self.st.progress(value, text=text)
+        else:
+            self._bar.progress(value, text=text)
+
+    def progress_done(self):
+        if self._bar is not None:
+            self._bar.empty()
+            self._bar = None
+
+    @contextmanager
+    def spinner(self, text):
+        with self.st.spinner(text):
+            yield
+
+
+class CallbackReporter(LogReporter):
+    """يسجّل في logging ويمرّر كل حدث إلى دالة (level, message, done, total)."""
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def _emit(self, level, msg, done=None, total=None):
+        getattr(super(), level if level != "progress" else "info")(msg)
+        self.callback(level, msg, done, total)
+
+    def info(self, msg): self._emit("info", msg)
+    def success(self, msg): self._emit("success", msg)
+    def warning(self, msg): self._emit("warning", msg)
+    def error(self, msg): self._emit("error", msg)
+    def caption(self, msg): self._emit("caption", msg)
+
+    def progress(self, done, total, text=""):
+        self._emit("progress", text, done, total)
+
+
+_local = threading.local()
+
+
+def _in_streamlit() -> bool:
+    try:
+        from streamlit.runtime import exists
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        return exists() and get_script_run_ctx() is not None
+    except Exception:
+        return False
+
+
+def get_reporter() -> Reporter:
+    rep = getattr(_local, "reporter", None)
+    if rep is None:
+        return StreamlitReporter() if _in_streamlit() else LogReporter()
+    return rep
+
+
+@contextmanager
+def use_reporter(reporter: Reporter):
+    """تفعيل reporter معيّن للـ thread الحالي داخل كتلة with."""
+    prev = getattr(_local, "reporter", None)
+    _local.reporter = reporter
+    try:
+        yield reporter
+    finally:
+        _local.reporter = prev
@@ -0,0 +1,107 @@
+# modules/prompts.py
+"""
+قوالب التوجيه: بادئة ثابتة قابلة لإعادة الاستخدام + جزء متغيّر لكل استدعاء.
+
+- static: التعليمات والمخطط والمعايير (ثابتة لكل منافسة) → رسالة system، وتأتي أولًا دائمًا
+  حتى تعيد الخوادم ذات كاش البادئة (vLLM --enable-prefix-caching، llama.cpp cache_prompt،
+  TransformersBackend) استخدام حسابها بين العروض والأجزاء.
+- dynamic: نص العرض/الجزء/المقاطع فقط → رسالة user.
+- التجميع (compile): البادئة تُبنى وتُعدّ توكناتها مرة واحدة لكل (قالب، قيم ثابتة).
+- الإصدار: template.key = الاسم + الإصدار + بصمة نص القالب، فأي تعديل على النص يغيّر
+  مفاتيح الكاش تلقائيًا حتى لو نُسي رفع الإصدار.
+- القياس: prompt_stats() لكل قالب — توكنات الجزء الثابت مقابل المتغيّر ونسبة تكرار البادئة.
+"""
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+from modules import tracing
+from modules.chunking import estimate_tokens
+
+TEMPLATES = {}
+
+
+def bullets(items) -> str:
+    return "\n".join(f"- {i}" for i in items)
+
+
+# ============================================================
+# 🧩 القالب
+# ============================================================
+class PromptTemplate:
+    def __init__(self, name: str, version: str, static: str, dynamic: str):
+        self.name = name
+        self.version = version
+        self.static = static.strip("\n") + "\n"
+        self.dynamic = dynamic.strip("\n") + "\n"
+        digest = hashlib.md5(f"{self.static}\x00{self.dynamic}".encode("utf-8")).hexdigest()[:8]
+        self.key = f"{name}:{version}:{digest}"
+        TEMPLATES[name] = self
+
+    def compile(self, **static_vars) -> str:
+        """البادئة الثابتة لهذه القيم (مخزّنة؛ لا تُبنى مرة أخرى لنفس المعايير)."""
+        return _compile(self, tuple(sorted(static_vars.items())))[0]
+
+    def messages(self, static: dict = None, **dynamic) -> list:
+        """رسالتان: system = البادئة الثابتة، user = الجزء المتغيّر؛ ويُسجَّل حجم كل منهما."""
+        with tracing.span("prompt.build", template=self.name) as sp:
+            prefix, prefix_tokens, digest = _compile(self, tuple(sorted((static or {}).items())))
+            body = self.dynamic.format(**dynamic)
+            body_tokens = estimate_tokens(body)
+            sp.set(static_tokens=prefix_tokens, dynamic_tokens=body_tokens)
+        _record(self.name, digest, prefix_tokens, body_tokens)
+        return [{"role": "system", "content": prefix}, {"role": "user", "content": body}]
+
+
+@lru_cache(maxsize=256)
+def _compile(template: PromptTemplate, static_items):
+    prefix = template.static.format(**dict(static_items))
+    digest = hashlib.md5(prefix.encode("utf-8")).hexdigest()
+    return prefix, estimate_tokens(prefix), digest
+
+
+# ============================================================
+# 📊 التوكنات الثابتة مقابل المتغيّرة
+# ============================================================
+_stats = {}
+_seen = OrderedDict()  # بصمات البادئات المرسلة مؤخرًا (تقدير لإصابات كاش البادئة في الخادم)
+_SEEN_MAX = 1024
+_stats_lock = threading.Lock()
+
+
+def _record(name: str, digest: str, static_tokens: int, dynamic_tokens: int):
+    with _stats_lock:
+        s = _stats.setdefault(name, Counter())
+        s["calls"] += 1
+        s["static_tokens"] += static_tokens
+        s["dynamic_tokens"] += dynamic_tokens
+        if digest in _seen:
+            s["prefix_reuse"] += 1
+            s["reused_tokens"] += static_tokens
+            _seen.move_to_end(digest)
+        else:
+            _seen[digest] = True
+            if len(_seen) > _SEEN_MAX:
+                _seen.popitem(last=False)
+
+
+def prompt_stats() -> dict:
+    """
+    لكل قالب: calls، static/dynamic_tokens (مجموع)، static_share (نسبة الثابت من التوجيه)،
+    prefix_reuse_rate (استدعاءات بادئتها أُرسلت سابقًا) و reused_tokens (توكنات قابلة لإعادة الاستخدام).
+    """
+    with _stats_lock:
+        stats = {k: dict(v) for k, v in _stats.items()}
+    for name, s in stats.items():
+        total = s["static_tokens"] + s["dynamic_tokens"]
+        s["version"] = TEMPLATES[name].key
+        s["static_share"] = round(s["static_tokens"] / total, 3) if total else 0.0
+        s["prefix_reuse_rate"] = round(s.get("prefix_reuse", 0) / s["calls"], 3)
+    return stats
+
+
+def reset_prompt_stats():
+    with _stats_lock:
+        _stats.clear()
+        _seen.clear()
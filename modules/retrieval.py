@@ -0,0 +1,245 @@
+# modules/retrieval.py
+"""
+فهرس مقاطع لكل عرض (BM25 مع توحيد عربي + تضمينات محلية اختيارية) يُبنى مرة واحدة
+من الصفحات المستخرجة ويُخزَّن حسب بصمة المستند، ليستخدمه المُقيِّم (أفضل k مقاطع لكل
+معيار)، وفهرس واحد لكل عروض المنافسة للشاتبوت (get_corpus_index).
+
+RETRIEVAL_EMBEDDINGS:
+  hash (افتراضي)  → تضمين n-gram حرفي بخدعة التجزئة (NumPy فقط، بدون نماذج)
+  st:<model>      → sentence-transformers محليًا (مثلاً st:intfloat/multilingual-e5-small)
+  off             → BM25 فقط
+"""
+import os
+import re
+import pickle
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from modules.cache import CACHE_ROOT
+
+INDEX_DIR = os.path.join(CACHE_ROOT, "retrieval")
+INDEX_VERSION = "idx-v1"
+PASSAGE_WORDS = int(os.getenv("RETRIEVAL_PASSAGE_WORDS", "120"))
+PASSAGE_OVERLAP = 30
+EMBEDDINGS = os.getenv("RETRIEVAL_EMBEDDINGS", "hash")
+HASH_DIM = 1024
+
+# ============================================================
+# 🔤 توحيد النص العربي والتقطيع
+# ============================================================
+_TASHKEEL_RE = re.compile(r"[\u064B-\u065F\u0670\u0640]")  # التشكيل + التطويل
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_AR_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+_PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال")
+_STOPWORDS = {
+    "في", "من", "علي", "الي", "عن", "مع", "هذا", "هذه", "ذلك", "التي", "الذي", "او", "ان",
+    "كان", "ما", "لا", "و", "ثم", "قد", "كل", "the", "and", "of", "to", "in", "a", "for",
+    "is", "on", "with", "by", "be", "as", "are", "or", "an", "this", "that",
+}
+
+
+def normalize_ar(text: str) -> str:
+    """إزالة التشكيل وتوحيد الألف والياء والتاء المربوطة والأرقام."""
+    text = _TASHKEEL_RE.sub("", text or "").translate(_AR_DIGITS).lower()
+    text = re.sub("[إأآٱ]", "ا", text)
+    return text.replace("ى", "ي").replace("ة", "ه").replace("ؤ", "و").replace("ئ", "ي")
+
+
+def tokenize(text: str) -> list:
+    out = []
+    for tok in _TOKEN_RE.findall(normalize_ar(text)):
+        for p in _PREFIXES:
+            if tok.startswith(p) and len(tok) - len(p) >= 3:
+                tok = tok[len(p):]
+                break
+        if tok not in _STOPWORDS and len(tok) > 1:
+            out.append(tok)
+    return out
+
+
+# ============================================================
+# 📐 التضمينات المحلية
+# ============================================================
+def _hash_embed(texts) -> np.ndarray:
+    """n-gram حرفي (3) بخدعة التجزئة → متجهات L2 مطبّعة."""
+    mat = np.zeros((len(texts), HASH_DIM), dtype=np.float32)
+    for i, t in enumerate(texts):
+        s = f" {' '.join(tokenize(t))} "
+        grams = Counter(s[j:j + 3] for j in range(len(s) - 2))
+        for g, c in grams.items():
+            h = int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=4).digest(), "little")
+            mat[i, h % HASH_DIM] += (1.0 if h & 0x80000000 else -1.0) * (1 + np.log(c))
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    return mat / np.maximum(norms, 1e-9)
+
+
+_st_model = None
+_st_lock = threading.Lock()
+
+
+def embed(texts) -> np.ndarray:
+    global _st_model
+    if EMBEDDINGS.startswith("st:"):
+        with _st_lock:
+            if _st_model is None:
+                from sentence_transformers import SentenceTransformer
+                _st_model = SentenceTransformer(EMBEDDINGS[3:], device="cpu")
+        return _st_model.encode(list(texts), normalize_embeddings=True).astype(np.float32)
+    return _hash_embed(texts)
+
+
+# ============================================================
+# 📚 الفهرس
+# ============================================================
+def split_passages(pages, words: int = PASSAGE_WORDS, overlap: int = PASSAGE_OVERLAP) -> list:
+    """مقاطع متداخلة بطول ~words كلمة، كل مقطع يحتفظ برقم صفحته."""
+    out = []
+    step = max(1, words - overlap)
+    for p in pages:
+        toks = p["text"].split()
+        for start in range(0, max(len(toks) - overlap, 1), step):
+            piece = " ".join(toks[start:start + words]).strip()
+            if piece:
+                out.append({"page_num": p["page_num"], "text": piece})
+    return out
+
+
+class PassageIndex:
+    """BM25 بقوائم مرتبطة (postings) في مصفوفات NumPy + مصفوفة تضمينات اختيارية."""
+
+    k1, b = 1.5, 0.75
+
+    def __init__(self, passages):
+        self.passages = passages
+        docs = [Counter(tokenize(p["text"])) for p in passages]
+        self.doc_len = np.array([sum(d.values()) for d in docs], dtype=np.float32)
+        self.avgdl = float(self.doc_len.mean()) if len(docs) else 0.0
+
+        postings = {}
+        for i, d in enumerate(docs):
+            for term, tf in d.items():
+                postings.setdefault(term, ([], []))
+                postings[term][0].append(i)
+                postings[term][1].append(tf)
+        n = max(len(docs), 1)
+        self.postings = {
+            t: (np.array(ids, dtype=np.int32), np.array(tfs, dtype=np.float32),
+                float(np.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))))
+            for t, (ids, tfs) in postings.items()
+        }
+        self.vectors = embed([p["text"] for p in passages]) \
+            if EMBEDDINGS != "off" and passages else None
+
+    def bm25(self, query: str) -> np.ndarray:
+        scores = np.zeros(len(self.passages), dtype=np.float32)
+        if not self.passages:
+            return scores
+        norm = self.k1 * (1 - self.b + self.b * self.doc_len / max(self.avgdl, 1e-9))
+        for term in set(tokenize(query)):
+            hit = self.postings.get(term)
+            if hit is None:
+                continue
+            ids, tf, idf = hit
+            scores[ids] += idf * tf * (self.k1 + 1) / (tf + norm[ids])
+        return scores
+
+    def scores(self, queries, alpha: float = 0.5) -> np.ndarray:
+        """مصفوفة (استعلامات × مقاطع): BM25 مطبّع + alpha × تشابه جيب التمام (ضرب مصفوفات واحد)."""
+        lex = np.vstack([self.bm25(q) for q in queries]) if queries else np.zeros((0, len(self.passages)))
+        lex = lex / np.maximum(lex.max(axis=1, keepdims=True), 1e-9)
+        if self.vectors is None or not len(queries):
+            return lex
+        sem = embed(queries) @ self.vectors.T
+        return (1 - alpha) * lex + alpha * np.clip(sem, 0, None)
+
+    def search(self, query: str, k: int = 5) -> list:
+        return self.search_many([query], k)[0]
+
+    def search_many(self, queries, k: int = 5) -> list:
+        """أفضل k مقاطع لكل استعلام: [[{"page_num","text","score"}, ...], ...]"""
+        if not self.passages or k <= 0:
+            return [[] for _ in queries]
+        mat = self.scores(list(queries))
+        k = min(k, mat.shape[1])
+        top = np.argpartition(-mat, k - 1, axis=1)[:, :k]
+        out = []
+        for qi, row in enumerate(top):
+            row = row[np.argsort(-mat[qi, row])]
+            out.append([{**self.passages[j], "score": float(mat[qi, j])} for j in row if mat[qi, j] > 0])
+        return out
+
+
+# ============================================================
+# 🗄️ كاش الفهارس حسب بصمة المستند (ذاكرة + قرص)
+# ============================================================
+_memory = OrderedDict()
+_memory_lock = threading.Lock()
+_MEMORY_SLOTS = 64
+
+
+def doc_hash(pages) -> str:
+    h = hashlib.md5()
+    for p in pages:
+        h.update(f"{p['page_num']}\x00{p['text']}\x01".encode("utf-8", "ignore"))
+    return h.hexdigest()
+
+
+def _cached_index(key: str, build, info: dict = None) -> PassageIndex:
+    """ذاكرة ← قرص ← بناء؛ info["source"] = memory | disk | built (للقياس)."""
+    with _memory_lock:
+        if key in _memory:
+            _memory.move_to_end(key)
+            if info is not None:
+                info["source"] = "memory"
+            return _memory[key]
+
+    path = os.path.join(INDEX_DIR, f"{key}.pkl")
+    index, source = None, "disk"
+    if os.path.exists(path):
+        try:
+            with open(path, "rb") as f:
+                index = pickle.load(f)
+        except Exception:
+            index = None
+    if index is None:
+        index, source = build(), "built"
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    with _memory_lock:
+        _memory[key] = index
+        while len(_memory) > _MEMORY_SLOTS:
+            _memory.popitem(last=False)
+    if info is not None:
+        info["source"] = source
+    return index
+
+
+def _key_prefix() -> str:
+    return f"{INDEX_VERSION}-{EMBEDDINGS.replace('/', '_').replace(':', '_')}"
+
+
+def get_index(pages, fid: str = None) -> PassageIndex:
+    """يبني الفهرس مرة واحدة لكل مستند ويعيد استخدامه بين المقيّم والمحلل."""
+    return _cached_index(f"{_key_prefix()}-{fid or doc_hash(pages)}", lambda: PassageIndex(split_passages(pages)))
+
+
+def get_corpus_index(docs, info: dict = None) -> PassageIndex:
+    """
+    فهرس واحد لكل عروض المنافسة (للشاتبوت): docs = [(name, pages)]، وكل مقطع يحمل file و page_num.
+    مفتاحه بصمات العروض وأسماؤها، فنفس مجموعة العروض لا يُعاد بناء فهرسها.
+    """
+    h = hashlib.md5()
+    for name, pages in docs:
+        h.update(f"{name}\x00{doc_hash(pages)}\x01".encode("utf-8", "ignore"))
+    return _cached_index(
+        f"{_key_prefix()}-corpus-{h.hexdigest()}",
+        lambda: PassageIndex([{**p, "file": name} for name, pages in docs for p in split_passages(pages)]),
+        info,
+    )
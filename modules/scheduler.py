@@ -0,0 +1,327 @@
+# modules/scheduler.py
+"""
+مُجدول أمام كل استدعاءات النموذج (evaluator / analyzer / translator / chatbot) يحترم حدود المزوّد.
+
+- تقدير توكنات كل طلب (التوجيه + max_tokens) قبل إرساله، ثم تسوية الفرق بعد الرد حسب usage.
+- دلو توكنات لكل نموذج للطلبات/الدقيقة (RPM) والتوكنات/الدقيقة (TPM)، تُحدَّث سعتها ومتبقيها
+  من رؤوس الرد x-ratelimit-* فيتكيف مع الحصة الفعلية للحساب.
+- تزامن متكيّف (AIMD): يُنصَّف عند 429 ويزيد تدريجيًا مع النجاح.
+- إعادة محاولة بتأخير أسّي عشوائي (full jitter) مع احترام retry-after، لأخطاء 429 و 5xx والمهلة.
+- أولوية: طلبات الشاتبوت التفاعلية تسبق التقييم والتحليل بالجملة في الدور.
+
+LLM_SCHEDULER=0 لتعطيله. الحدود: LLM_RPM / LLM_TPM (أو LLM_RPM_<MODEL> / LLM_TPM_<MODEL>)؛
+الافتراضي لـ groq حصة الفئة المجانية، وبقية الخلفيات بلا حد حتى تصل رؤوس من الخادم.
+LLM_MAX_CONCURRENCY (افتراضي 8) و LLM_MAX_RETRIES (افتراضي 5).
+"""
+import os
+import re
+import time
+import heapq
+import random
+import itertools
+import threading
+
+from modules import tracing
+from modules.chunking import estimate_tokens
+
+ENABLED = os.getenv("LLM_SCHEDULER", "1") != "0"
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+DEFAULT_MAX_TOKENS = 512
+
+# الأقل = أعلى أولوية
+PRIORITIES = {"chatbot": 0}
+BULK = 1
+
+# حصص Groq الافتراضية (الفئة المجانية تقريبًا) — تُصحَّح من رؤوس الرد
+GROQ_DEFAULTS = {"rpm": 30, "tpm": 6000}
+
+_RETRYABLE = {408, 409, 429, 500, 502, 503, 504}
+
+
+def _env_limit(kind: str, model: str):
+    key = re.sub(r"\W", "_", model).upper()
+    raw = os.getenv(f"LLM_{kind}_{key}") or os.getenv(f"LLM_{kind}")
+    return float(raw) if raw else None
+
+
+def parse_duration(value) -> float:
+    """"1m2.5s" / "250ms" / "7.66s" / "3" → ثوانٍ."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total, found = 0.0, False
+    for num, unit in re.findall(r"([\d.]+)(ms|h|m|s)", value):
+        found = True
+        total += float(num) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total if found else None
+
+
+class RateLimitError(RuntimeError):
+    """تجاوز الحصة بعد استنفاد كل المحاولات."""
+
+
+def _status_of(exc):
+    for obj in (exc, getattr(exc, "response", None)):
+        code = getattr(obj, "status_code", None)
+        if isinstance(code, int):
+            return code
+    return None
+
+
+def headers_of(exc) -> dict:
+    """رؤوس رد HTTP المرفق بالاستثناء (x-ratelimit-* / retry-after) أو {}."""
+    resp = getattr(exc, "response", None)
+    try:
+        return {k.lower(): v for k, v in dict(getattr(resp, "headers", None) or {}).items()}
+    except Exception:
+        return {}
+
+
+def is_retryable(exc) -> bool:
+    code = _status_of(exc)
+    if code is not None:
+        return code in _RETRYABLE
+    name = type(exc).__name__.lower()
+    return "timeout" in name or "connection" in name
+
+
+# ============================================================
+# 🪣 دلو التوكنات
+# ============================================================
+class Bucket:
+    """سعة capacity تمتلئ خطيًا خلال period ثانية. capacity=None → بلا حد."""
+
+    def __init__(self, capacity=None, period: float = 60.0):
+        self.capacity = capacity
+        self.period = period
+        self.level = capacity or 0.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / self.period)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)  # طلب أكبر من السعة كلها يمر عند امتلاء الدلو
+        return 0.0 if self.level >= amount else (amount - self.level) * self.period / self.capacity
+
+    def take(self, amount: float):
+        if self.capacity:
+            self.level -= amount
+
+    def sync(self, limit=None, remaining=None, reset=None, now=None):
+        """تصحيح السعة والمتبقي من رؤوس المزوّد."""
+        if limit:
+            if not self.capacity:
+                self.level = float(limit)  # أول مرة نعرف فيها الحصة
+            self.capacity = float(limit)
+        if remaining is not None and self.capacity:
+            self.level = min(self.level, float(remaining))
+            if reset:
+                # المتبقي يمتلئ حتى السعة عند reset — نضبط period ليطابق ذلك تقريبًا
+                self.period = max(1.0, reset * self.capacity / max(self.capacity - float(remaining), 1.0))
+        self.updated = now or time.monotonic()
+
+
+# ============================================================
+# 🚦 حالة كل نموذج
+# ============================================================
+class ModelLimiter:
+    def __init__(self, model: str, defaults: dict = None):
+        defaults = defaults or {}
+        self.model = model
+        self.requests = Bucket(_env_limit("RPM", model) or defaults.get("rpm"))
+        self.tokens = Bucket(_env_limit("TPM", model) or defaults.get("tpm"))
+        self.limit = float(MAX_CONCURRENCY)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.cond = threading.Condition()
+        self.waiters = []  # heap: (priority, seq)
+        self.seq = itertools.count()
+        self.stats = {"calls": 0, "rate_limited": 0, "retries": 0, "failures": 0, "waited_s": 0.0}
+
+    # ---------- الحجز والتحرير ----------
+    def acquire(self, tokens: int, priority: int) -> float:
+        """انتظار الدور والحصة؛ يعيد زمن الانتظار بالثواني."""
+        ticket = (priority, next(self.seq))
+        t0 = time.monotonic()
+        with self.cond:
+            heapq.heappush(self.waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self.waiters[0] != ticket or self.in_flight >= int(self.limit):
+                        wait = None  # ننتظر إشعارًا من release أو دخول طلب أعلى أولوية
+                    else:
+                        wait = max(0.0, self.blocked_until - now,
+                                   self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+                    if wait == 0.0:
+                        break
+                    self.cond.wait(timeout=wait if wait is not None else 1.0)
+                heapq.heappop(self.waiters)
+                self.requests.take(1)
+                self.tokens.take(tokens)
+                self.in_flight += 1
+                self.stats["calls"] += 1
+                waited = time.monotonic() - t0
+                self.stats["waited_s"] += waited
+            finally:
+                if ticket in self.waiters:
+                    self.waiters.remove(ticket)
+                    heapq.heapify(self.waiters)
+                self.cond.notify_all()
+        return waited
+
+    def release(self, estimated: int, actual: int = None, headers: dict = None, throttled: bool = False,
+                retry_after: float = None):
+        with self.cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if actual is not None and self.tokens.capacity:
+                self.tokens.level += estimated - actual  # تسوية التقدير بالاستهلاك الفعلي
+            if headers:
+                self._sync(headers, now)
+            if throttled:
+                self.stats["rate_limited"] += 1
+                self.limit = max(1.0, self.limit / 2)  # تخفيض مضاعف
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, now + retry_after)
+            else:
+                self.limit = min(float(MAX_CONCURRENCY), self.limit + 1.0 / max(self.limit, 1.0))  # زيادة جمعية
+            self.cond.notify_all()
+
+    def _sync(self, headers: dict, now: float):
+        h = {k.lower(): v for k, v in headers.items()}
+        if "x-ratelimit-limit-requests" in h or "x-ratelimit-remaining-requests" in h:
+            self.requests.sync(h.get("x-ratelimit-limit-requests"), h.get("x-ratelimit-remaining-requests"),
+                               parse_duration(h.get("x-ratelimit-reset-requests")), now)
+        if "x-ratelimit-limit-tokens" in h or "x-ratelimit-remaining-tokens" in h:
+            self.tokens.sync(h.get("x-ratelimit-limit-tokens"), h.get("x-ratelimit-remaining-tokens"),
+                             parse_duration(h.get("x-ratelimit-reset-tokens")), now)
+
+    def snapshot(self) -> dict:
+        with self.cond:
+            return {
+                **self.stats,
+                "waited_s": round(self.stats["waited_s"], 2),
+                "concurrency_limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "rpm": self.requests.capacity,
+                "tpm": self.tokens.capacity,
+                "queued": len(self.waiters),
+            }
+
+
+# ============================================================
+# 🧭 المجدول
+# ============================================================
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(backend, model: str) -> ModelLimiter:
+    key = (getattr(backend, "name", "?"), model)
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = ModelLimiter(model, GROQ_DEFAULTS if key[0] == "groq" else None)
+        return _limiters[key]
+
+
+def reset():
+    """حذف حالة كل النماذج (للقياس)."""
+    with _limiters_lock:
+        _limiters.clear()
+
+
+def scheduler_stats() -> dict:
+    with _limiters_lock:
+        items = list(_limiters.items())
+    return {f"{b}:{m}": lim.snapshot() for (b, m), lim in items}
+
+
+def estimate_request(messages, max_tokens=None) -> int:
+    return sum(estimate_tokens(m.get("content", "")) + 4 for m in messages) + (max_tokens or DEFAULT_MAX_TOKENS)
+
+
+def backoff(attempt: int, retry_after: float = None) -> float:
+    """full jitter: عشوائي بين 0 و min(max, base·2^n)، ولا يقل عن retry-after إن وُجد."""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+    return max(delay, retry_after or 0.0)
+
+
+def run(site: str, backend, model: str, messages, max_tokens, call):
+    """
+    تنفيذ call() عبر المجدول: انتظار الدور والحصة ← الاستدعاء ← تسوية/تكيّف ← إعادة المحاولة.
+    call() يعيد LLMResult (usage + headers إن توفرت).
+    """
+    if not ENABLED:
+        return call()
+    lim = limiter_for(backend, model)
+    priority = PRIORITIES.get(site, BULK)
+    estimated = estimate_request(messages, max_tokens)
+    for attempt in range(MAX_RETRIES + 1):
+        tracing.current().add(queue_s=lim.acquire(estimated, priority))
+        try:
+            res = call()
+        except Exception as e:
+            code, headers = _status_of(e), headers_of(e)
+            retry_after = parse_duration(headers.get("retry-after"))
+            lim.release(estimated, 0, headers, throttled=code == 429, retry_after=retry_after)
+            if not is_retryable(e) or attempt == MAX_RETRIES:
+                with lim.cond:
+                    lim.stats["failures"] += 1
+                if code == 429:
+                    raise RateLimitError(f"⚠️ تجاوز حد الطلبات للنموذج {model} بعد {attempt + 1} محاولات") from e
+                raise
+            with lim.cond:
+                lim.stats["retries"] += 1
+            tracing.current().add(retries=1)
+            time.sleep(backoff(attempt, retry_after))
+            continue
+        actual = (res.prompt_tokens + res.completion_tokens) or None
+        lim.release(estimated, actual, res.headers)
+        return res
+
+
+class Slot:
+    """
+    حجز لاستدعاء مبثوث: with Slot(...) as slot: ... ثم slot.done(actual, headers) عند نهاية البث
+    (تسوية التقدير بالاستهلاك الفعلي ومزامنة الحصة من الرؤوس كما في run)، أو استثناء.
+    """
+
+    def __init__(self, site: str, backend, model: str, messages, max_tokens):
+        self.enabled = ENABLED
+        self.actual = self.headers = None
+        if self.enabled:
+            self.lim = limiter_for(backend, model)
+            self.priority = PRIORITIES.get(site, BULK)
+            self.estimated = estimate_request(messages, max_tokens)
+
+    def done(self, actual: int = None, headers: dict = None):
+        self.actual, self.headers = actual, headers
+
+    def __enter__(self):
+        if self.enabled:
+            tracing.current().add(queue_s=self.lim.acquire(self.estimated, self.priority))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.enabled:
+            if exc:
+                headers = headers_of(exc)
+                self.lim.release(self.estimated, 0, headers, throttled=_status_of(exc) == 429,
+                                 retry_after=parse_duration(headers.get("retry-after")))
+            else:
+                self.lim.release(self.estimated, self.actual, self.headers)
+        return False
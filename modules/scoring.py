@@ -0,0 +1,190 @@
+# modules/scoring.py
+"""
+محرّك الترتيب الموزون: كل الدرجات في مصفوفة NumPy واحدة (عروض × معايير) وكل الحسابات
+عمليات مصفوفية — فإعادة الترتيب بعد تعديل الأوزان في الواجهة فورية وبدون أي استدعاء للنموذج.
+
+- effective_weights(criteria_df): الوزن الفعلي لكل معيار من الهرم (محور ← معيار فرعي)،
+  مجموعها 1. بدون أوزان في الملف → أوزان متساوية (= المتوسط البسيط السابق).
+- score_matrix(details, files, n): المصفوفة من تفاصيل التقييم (NaN للمعيار الناقص).
+- weighted_totals / normalize_scores / rank_positions: المجموع الموزون والتطبيع والترتيب.
+- sensitivity(S, w, normalization): ثبات الترتيب تحت اضطراب عشوائي للأوزان (Monte Carlo)،
+  وأصغر تغيير في وزن كل معيار يغيّر العرض الأول — بنفس تطبيع الترتيب المعروض.
+"""
+import numpy as np
+import pandas as pd
+
+MAX_SCORE = 4.0
+NORMALIZATIONS = ("absolute", "minmax", "zscore")
+
+
+# ============================================================
+# ⚖️ الأوزان
+# ============================================================
+def normalize_weights(values) -> np.ndarray:
+    """أوزان خام → حصص مجموعها 1 (المفقود = متوسط المعروف، والكل مفقود = متساوٍ)."""
+    v = np.asarray(values, dtype=float)
+    if v.size == 0:
+        return v
+    known = ~np.isnan(v)
+    if not known.any() or v[known].sum() <= 0:
+        return np.full(v.size, 1.0 / v.size)
+    v = np.where(known, v, v[known].mean())
+    v = np.clip(v, 0, None)
+    return v / v.sum()
+
+
+def effective_weights(criteria_df: pd.DataFrame) -> np.ndarray:
+    """
+    وزن كل صف من criteria_df (بنفس الترتيب):
+      component_weight موجود → حصة المحور × حصة المعيار داخل محوره
+      weight فقط → الأوزان كما هي بعد التطبيع
+      لا شيء → متساوية
+    """
+    n = len(criteria_df)
+    if n == 0:
+        return np.zeros(0)
+    sub = criteria_df["weight"].to_numpy(dtype=float) if "weight" in criteria_df else np.full(n, np.nan)
+    comp_w = (criteria_df["component_weight"].to_numpy(dtype=float)
+              if "component_weight" in criteria_df else np.full(n, np.nan))
+    if "component" not in criteria_df or np.isnan(comp_w).all():
+        return normalize_weights(sub)
+
+    comps = criteria_df["component"].fillna("").to_numpy()
+    names, idx = np.unique(comps, return_inverse=True)
+    per_comp = np.array([np.nanmax(comp_w[idx == k]) if (~np.isnan(comp_w[idx == k])).any() else np.nan
+                         for k in range(len(names))])
+    comp_share = normalize_weights(per_comp)
+    w = np.zeros(n)
+    for k in range(len(names)):
+        rows = idx == k
+        w[rows] = comp_share[k] * normalize_weights(sub[rows])
+    return w / w.sum()
+
+
+# ============================================================
+# 🧮 المصفوفة والمجاميع
+# ============================================================
+def score_matrix(details: dict, files, n_criteria: int) -> np.ndarray:
+    """
+    details: {file: DataFrame(criterion, score, ...)} بترتيب المعايير (كما يعيده التقييم،
+    حتى لو تُرجمت أسماء المعايير لعرض إنجليزي). الصفوف الناقصة → NaN.
+    """
+    S = np.full((len(files), n_criteria), np.nan)
+    for i, f in enumerate(files):
+        df = details.get(f)
+        if df is None or df.empty:
+            continue
+        scores = pd.to_numeric(df["score"], errors="coerce").to_numpy(dtype=float)[:n_criteria]
+        S[i, :len(scores)] = scores
+    return S
+
+
+def weighted_totals(S: np.ndarray, w: np.ndarray, max_score: float = MAX_SCORE) -> np.ndarray:
+    """المجموع الموزون 0..1 لكل عرض؛ المعيار الناقص يُستبعد ويُعاد توزيع وزنه على الباقي."""
+    present = ~np.isnan(S)
+    num = np.where(present, S, 0.0) @ w
+    den = present @ w
+    return np.divide(num, den * max_score, out=np.zeros(len(S)), where=den > 0)
+
+
+def normalize_scores(S: np.ndarray, method: str = "absolute", max_score: float = MAX_SCORE) -> np.ndarray:
+    """
+    absolute → الدرجة / الحد الأعلى | minmax → نسبة بين أضعف وأقوى عرض في كل معيار
+    zscore   → انحرافات معيارية عن متوسط العروض في كل معيار
+    """
+    if method == "absolute":
+        return S / max_score
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if method == "minmax":
+            lo, hi = np.nanmin(S, axis=0), np.nanmax(S, axis=0)
+            return np.where(hi > lo, (S - lo) / (hi - lo), 1.0)
+        if method == "zscore":
+            mu, sd = np.nanmean(S, axis=0), np.nanstd(S, axis=0)
+            return np.where(sd > 0, (S - mu) / sd, 0.0)
+    raise ValueError(f"تطبيع غير معروف: {method} (المتاح: {', '.join(NORMALIZATIONS)})")
+
+
+def rank_positions(totals: np.ndarray) -> np.ndarray:
+    """
+    الترتيب 1 = الأفضل؛ يعمل على متجه (عروض) أو مصفوفة (عينات × عروض).
+    التعادل يُحسم بترتيب الرفع (مثل rank_outcomes).
+    """
+    order = np.argsort(-totals, axis=-1, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(1, totals.shape[-1] + 1) * np.ones_like(order), axis=-1)
+    return ranks
+
+
+def rank_table(files, S: np.ndarray, w: np.ndarray, comments=None, normalization: str = "absolute") -> pd.DataFrame:
+    """ranked DataFrame (file, overall, rank[, comment]) مرتّبًا تنازليًا."""
+    if normalization == "absolute":
+        totals = weighted_totals(S, w)
+    else:
+        totals = weighted_totals(normalize_scores(S, normalization), w, max_score=1.0)
+    df = pd.DataFrame({"file": list(files), "overall": totals, "rank": rank_positions(totals)})
+    if comments is not None:
+        df["comment"] = list(comments)
+    return df.sort_values("rank", kind="mergesort").reset_index(drop=True)
+
+
+# ============================================================
+# 🎯 تحليل الحساسية
+# ============================================================
+def sensitivity(S: np.ndarray, w: np.ndarray, spread: float = 0.2, samples: int = 2000, seed: int = 0,
+                factors=None, normalization: str = "absolute") -> dict:
+    """
+    Monte Carlo: كل وزن × U(1-spread, 1+spread) ثم إعادة التطبيع، و samples ترتيبًا دفعة واحدة.
+    normalization: نفس تطبيع rank_table حتى يصف الثبات الترتيب المعروض نفسه.
+      offers: لكل عرض الترتيب الأساسي، احتمال المركز الأول، متوسط/أفضل/أسوأ ترتيب
+      stability: نسبة العينات بنفس الترتيب الكامل | top_stability: بنفس العرض الأول
+    وتحليل معيار واحد في كل مرة: وزن المعيار × factor (بقية الأوزان ثابتة نسبيًا)،
+      criteria: أقرب معامل لـ 1 (أعلى/أدنى) يغيّر العرض الأول (NaN = لا يتغيّر ضمن المدى).
+    """
+    n_off, n_crit = S.shape
+    max_score = MAX_SCORE
+    if normalization != "absolute":
+        S, max_score = normalize_scores(S, normalization), 1.0
+    base = rank_positions(weighted_totals(S, w, max_score))
+    rng = np.random.default_rng(seed)
+
+    W = w * rng.uniform(1 - spread, 1 + spread, size=(samples, n_crit))
+    W /= W.sum(axis=1, keepdims=True)
+    present = ~np.isnan(S)
+    num = W @ np.where(present, S, 0.0).T                 # عينات × عروض
+    den = W @ present.T.astype(float)
+    T = np.divide(num, den * max_score, out=np.zeros_like(num), where=den > 0)
+    R = rank_positions(T)
+
+    top = int(np.argmin(base))
+    offers = pd.DataFrame({
+        "base_rank": base,
+        "p_top": (R == 1).mean(axis=0),
+        "mean_rank": R.mean(axis=0),
+        "best_rank": R.min(axis=0),
+        "worst_rank": R.max(axis=0),
+    })
+
+    factors = np.linspace(0.0, 3.0, 61) if factors is None else np.asarray(factors, dtype=float)
+    # (معيار، معامل، معيار): نسخة من w لكل معيار ومعامل مع ضرب وزن ذلك المعيار فقط
+    Wf = np.broadcast_to(w, (n_crit, len(factors), n_crit)).copy()
+    diag = np.arange(n_crit)
+    Wf[diag, :, diag] = w[:, None] * factors[None, :]
+    Wf /= np.clip(Wf.sum(axis=2, keepdims=True), 1e-12, None)
+    num = Wf @ np.where(present, S, 0.0).T                # معيار × معامل × عروض
+    den = Wf @ present.T.astype(float)
+    Tf = np.divide(num, den * max_score, out=np.zeros_like(num), where=den > 0)
+    changed = rank_positions(Tf)[..., top] != 1           # معيار × معامل
+
+    up = np.where(changed & (factors > 1), factors, np.inf).min(axis=1)
+    down = np.where(changed & (factors < 1), factors, -np.inf).max(axis=1)
+    criteria = pd.DataFrame({
+        "weight": w,
+        "flip_up_factor": np.where(np.isinf(up), np.nan, up),
+        "flip_down_factor": np.where(np.isinf(down), np.nan, down),
+    })
+    return {
+        "offers": offers,
+        "criteria": criteria,
+        "stability": float((R == base).all(axis=1).mean()),
+        "top_stability": float((R[:, top] == 1).mean()),
+    }
@@ -0,0 +1,232 @@
+# modules/segmentation.py
+"""
+تقسيم المستند إلى أقسام محليًا (بدون نموذج) قبل أي استدعاء:
+اكتشاف العناوين ثم قص الأقسام بإزاحات الأحرف من نص الصفحات المستخرج، فيبقى المحتوى
+حرفيًا كما هو مع صفحة بداية ونهاية دقيقتين. النموذج يُسأل بعدها عن اسم قصير وملخص فقط.
+
+اكتشاف العناوين (نقاط لكل سطر قصير، والعنوان ما بلغ SEGMENT_MIN_SCORE):
+- التنسيق: حجم خط أكبر من المتن بنسبة SEGMENT_SIZE_RATIO أو سطر عريض بالكامل
+  (مخرجات dict لـ PyMuPDF المحفوظة بجانب الصفحات — modules.pdf_pages.iter_page_styles).
+- الترقيم: 1.2 / ٣.١ / أولاً / الفصل الثاني / Section 4 (قوي)، أو 1. / أ- / A) (بسيط).
+- المعجم: عناوين العروض الفنية الشائعة بالعربية والإنجليزية (المنهجية، Work Plan، ...).
+
+مستند بلا عناوين يُقسَّم على حدود الصفحات بأحجام متقاربة.
+"""
+import os
+import re
+from bisect import bisect_right
+from statistics import median
+
+SEGMENT_MIN_SCORE = int(os.getenv("SEGMENT_MIN_SCORE", "2"))
+SEGMENT_SIZE_RATIO = float(os.getenv("SEGMENT_SIZE_RATIO", "1.15"))
+# قسم أقصر من هذا (بدون سطر عنوانه) يُضم إلى القسم التالي
+SEGMENT_MIN_CHARS = int(os.getenv("SEGMENT_MIN_CHARS", "150"))
+# سقف عدد الأقسام: عند تجاوزه تُرفع عتبة النقاط (تبقى العناوين الأقوى فقط)
+SEGMENT_MAX_SECTIONS = int(os.getenv("SEGMENT_MAX_SECTIONS", "80"))
+# حجم القسم التقريبي عند غياب العناوين (تجميع صفحات كاملة)
+SEGMENT_FALLBACK_CHARS = int(os.getenv("SEGMENT_FALLBACK_CHARS", "12000"))
+HEADING_MAX_CHARS = 100
+HEADING_MAX_WORDS = 12
+
+_ORDINALS = "أول|ثان|ثالث|رابع|خامس|سادس|سابع|ثامن|تاسع|عاشر"
+_STRONG_NUM_RE = re.compile(
+    r"^(?:"
+    r"(?:الفصل|الباب|القسم|المحور|الجزء|البند|chapter|section|part)\s+\S+"
+    rf"|(?:{_ORDINALS})(?:اً|ا|ًا)"
+    r"|\d+(?:\.\d+)+\.?"
+    r"|[٠-٩]+(?:[.٫][٠-٩]+)+"
+    r"|[IVX]+\."
+    r")(?:\s*[:：\-–.)]\s*|\s+|$)",
+    re.I,
+)
+_SIMPLE_NUM_RE = re.compile(r"^(?:\d{1,2}|[٠-٩]{1,2}|[A-Za-z]|[أ-ي])\s*[.)\-–:]\s+")
+_SENTENCE_END_RE = re.compile(r"[.،,؛;؟?!]$")
+
+HEADING_LEXICON = [
+    # عربي
+    "مقدمة", "المقدمة", "تمهيد", "الملخص التنفيذي", "ملخص تنفيذي", "نبذة عن الشركة", "نبذة عن",
+    "عن الشركة", "الأهداف", "أهداف المشروع", "فهم المشروع", "نطاق العمل", "نطاق المشروع",
+    "المنهجية", "منهجية", "منهجية العمل", "منهجية التنفيذ", "أسلوب التنفيذ", "خطة التنفيذ", "خطة العمل",
+    "الجدول الزمني", "الإطار الزمني", "مراحل المشروع", "فريق العمل", "الهيكل التنظيمي", "الخبرات",
+    "الخبرات السابقة", "المشاريع السابقة", "إدارة المشروع", "إدارة المخاطر", "المخاطر", "ضمان الجودة",
+    "إدارة الجودة", "الجودة", "المخرجات", "التسليمات", "النتائج المتوقعة", "النتائج", "التدريب",
+    "نقل المعرفة", "الدعم الفني", "الضمان", "الصيانة", "الحل المقترح", "الحل التقني", "المتطلبات",
+    "العرض المالي", "التكلفة", "الأسعار", "الشروط", "الخاتمة", "الملاحق", "ملحق", "المراجع",
+    # English
+    "introduction", "executive summary", "overview", "about us", "company profile", "background",
+    "objectives", "goals", "understanding", "project understanding", "scope", "scope of work",
+    "methodology", "approach", "technical approach", "proposed solution", "solution", "architecture",
+    "work plan", "implementation plan", "project plan", "timeline", "schedule", "team", "project team",
+    "organization", "experience", "references", "case studies", "project management",
+    "risk management", "risks", "quality assurance", "quality", "deliverables", "outcomes", "results",
+    "training", "knowledge transfer", "support", "maintenance", "warranty", "requirements",
+    "financial proposal", "pricing", "terms", "conclusion", "appendix", "annex",
+]
+_LEXICON_RE = re.compile(
+    r"^(?:" + "|".join(re.escape(w) for w in sorted(HEADING_LEXICON, key=len, reverse=True)) + r")(?=$|[\s:：\-–(])",
+    re.I,
+)
+_LEXICON_MAX_WORDS = 6
+
+
+def _norm(s: str) -> str:
+    return " ".join(s.split())
+
+
+def strip_numbering(line: str) -> str:
+    """العنوان بدون ترقيمه ("2.1 المنهجية" → "المنهجية")."""
+    line = line.strip()
+    m = _STRONG_NUM_RE.match(line)
+    if m and not re.match(r"(?:الفصل|الباب|القسم|المحور|الجزء|البند|chapter|section|part)\b", line, re.I):
+        line = line[m.end():]
+    else:
+        m = _SIMPLE_NUM_RE.match(line)
+        if m:
+            line = line[m.end():]
+    return line.strip(" :：-–.")
+
+
+def heading_score(line: str, style=None, body: float = 0.0) -> int:
+    """
+    نقاط سطر كعنوان: التنسيق (حجم +2، عريض +1) + الترقيم (قوي +2، بسيط +1) + المعجم (+2).
+    style: (الحجم، عريض؟) من تنسيق الصفحة أو None. السطر الطويل أو المنتهي بعلامة جملة = 0.
+    """
+    line = line.strip()
+    words = len(line.split())
+    if not (2 <= len(line) <= HEADING_MAX_CHARS) or words > HEADING_MAX_WORDS or _SENTENCE_END_RE.search(line):
+        return 0
+    score = 0
+    if style is not None:
+        size, bold = style
+        if body and size >= body * SEGMENT_SIZE_RATIO:
+            score += 2
+        if bold:
+            score += 1
+    if _STRONG_NUM_RE.match(line):
+        score += 2
+    elif _SIMPLE_NUM_RE.match(line):
+        score += 1
+    title = strip_numbering(line)
+    if len(title.split()) <= _LEXICON_MAX_WORDS and _LEXICON_RE.match(title):
+        score += 2
+    return score
+
+
+# ============================================================
+# ✂️ التقسيم بالإزاحات
+# ============================================================
+def _page_styles(styles) -> tuple:
+    """تنسيق كل صفحة → ({السطر الموحّد: (الحجم، عريض؟)} لكل صفحة، حجم خط متن المستند)."""
+    lookup, bodies = {}, []
+    for rec in styles or []:
+        st = rec.get("styles") if isinstance(rec, dict) else None
+        if not st:
+            continue
+        if st.get("body"):
+            bodies.append(st["body"])
+        lookup[rec.get("page_num")] = {_norm(t): (size, bold) for t, size, bold in st.get("lines", [])}
+    return lookup, (median(bodies) if bodies else 0.0)
+
+
+def _candidates(pages, offsets, styles) -> list:
+    """كل سطر بنقاطه: (النقاط، إزاحة بدايته في نص المستند، نص السطر)."""
+    lookup, body = _page_styles(styles)
+    out = []
+    for page, base in zip(pages, offsets):
+        page_styles = lookup.get(page["page_num"], {})
+        for m in re.finditer(r"[^\n]+", page["text"]):
+            line = m.group()
+            if not line.strip():
+                continue
+            style = page_styles.get(_norm(line)) if lookup else None
+            if lookup and style is None:
+                style = (body, False)
+            score = heading_score(line, style, body)
+            if score:
+                out.append((score, base + m.start(), _norm(line)))
+    return out
+
+
+def _select(candidates) -> list:
+    """العناوين فوق العتبة، مع رفعها حتى لا يتجاوز العدد SEGMENT_MAX_SECTIONS."""
+    threshold = SEGMENT_MIN_SCORE
+    picked = [c for c in candidates if c[0] >= threshold]
+    while len(picked) > SEGMENT_MAX_SECTIONS:
+        threshold += 1
+        stronger = [c for c in picked if c[0] >= threshold]
+        if not stronger:
+            break
+        picked = stronger
+    return [(pos, line) for _, pos, line in picked]
+
+
+def _page_groups(pages, offsets) -> list:
+    """مستند بلا عناوين: صفحات متتالية مجمّعة حتى SEGMENT_FALLBACK_CHARS تقريبًا."""
+    bounds, size = [], 0
+    for i, page in enumerate(pages):
+        if i and size >= SEGMENT_FALLBACK_CHARS:
+            bounds.append((offsets[i], ""))
+            size = 0
+        size += len(page["text"])
+    return [(0, "")] + bounds
+
+
+def _merge_small(bounds, text: str) -> list:
+    """قسم متنه (بعد سطر العنوان) أقصر من SEGMENT_MIN_CHARS يُضم إلى التالي، والأخير إلى السابق."""
+    merged = []
+    carry = None
+    for i, (start, heading) in enumerate(bounds):
+        end = bounds[i + 1][0] if i + 1 < len(bounds) else len(text)
+        if carry is not None:
+            start, heading = carry[0], " — ".join(h for h in (carry[1], heading) if h)
+            carry = None
+        body = text[start:end].split("\n", 1)[1] if heading and "\n" in text[start:end] else text[start:end]
+        if len(body.strip()) < SEGMENT_MIN_CHARS:
+            if i + 1 < len(bounds):
+                carry = (start, heading)
+                continue
+            if merged:
+                continue  # آخر قسم قصير: يمتد القسم السابق حتى نهاية المستند
+        merged.append((start, heading))
+    return merged
+
+
+def segment_pages(pages, styles=None) -> list:
+    """
+    pages: [{"page_num", "text"}] — styles: سجل الصفحات مع "styles" (PageStore.styles()) أو None.
+    يعيد الأقسام بالترتيب:
+      {"id": "s1", "heading", "start", "end", "start_page", "end_page", "content"}
+    start/end إزاحات أحرف في نص المستند (نصوص الصفحات متتالية)، والمحتوى قصّ حرفي منه.
+    """
+    pages = [p for p in pages if p.get("text", "").strip()]
+    if not pages:
+        return []
+    offsets, pos = [], 0
+    for p in pages:
+        offsets.append(pos)
+        pos += len(p["text"])
+    text = "".join(p["text"] for p in pages)
+
+    bounds = _select(_candidates(pages, offsets, styles))
+    if not bounds:
+        bounds = _page_groups(pages, offsets)
+    elif text[:bounds[0][0]].strip():
+        bounds.insert(0, (0, ""))  # ما قبل أول عنوان (الغلاف / التمهيد)
+    else:
+        bounds[0] = (0, bounds[0][1])
+    bounds = _merge_small(bounds, text)
+
+    page_of = lambda off: pages[bisect_right(offsets, off) - 1]["page_num"]  # noqa: E731
+    sections = []
+    for i, (start, heading) in enumerate(bounds):
+        end = bounds[i + 1][0] if i + 1 < len(bounds) else len(text)
+        sections.append({
+            "id": f"s{i + 1}",
+            "heading": heading,
+            "start": start,
+            "end": end,
+            "start_page": page_of(start),
+            "end_page": page_of(max(start, end - 1)),
+            "content": text[start:end].strip(),
+        })
+    return sections
@@ -0,0 +1,413 @@
+# modules/structured.py
+"""
+طبقة موحّدة لتحليل ردود النموذج المنظّمة (JSON) بدل التعابير النمطية الجشعة.
+
+- JSON mode: يُطلب response_format=json_object من الخلفيات التي تدعمه (Groq / OpenAI).
+- الاستخراج: فك أول قيمة JSON صالحة من الرد (مع إزالة ```json) بـ raw_decode.
+- التحليل التدريجي: JSONArrayStream يعيد عناصر مصفوفة ("scores" أو الجذر) فور اكتمال كل عنصر،
+  فيُستفاد من الرد المقطوع (max_tokens) ومن البث لاحقًا.
+- التحقق من المخطط: درجات المعايير (criterion/score/...) وتسميات الأقسام (id/section/summary).
+- الإصلاح الموجّه: رد غير صالح → طلب إصلاح صغير بالرد نفسه فقط (بدون المستند)،
+  ومعايير ناقصة → إعادة السؤال عن المعايير الناقصة فقط.
+- البث: مع on_item/on_row يُبث الرد (chat_stream) ويُمرَّر كل صف صالح فور اكتماله،
+  ويُسجَّل زمن أول توكن وأول صف لكل استدعاء (modules.llm.timing_summary).
+- المقاييس: parse_metrics() (نسبة فشل التحليل ونسبة إعادة المحاولة).
+
+STRUCTURED_JSON_MODE=0 لتعطيل JSON mode، STRUCTURED_MAX_RETRIES (افتراضي 1).
+"""
+import os
+import re
+import json
+import threading
+from collections import Counter
+
+import pandas as pd
+
+from modules import tracing
+from modules.llm import chat, chat_stream, get_backend, STREAM_ENABLED
+
+JSON_MODE = os.getenv("STRUCTURED_JSON_MODE", "1") != "0"
+MAX_RETRIES = int(os.getenv("STRUCTURED_MAX_RETRIES", "1"))
+REPAIR_MAX_CHARS = 12000
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*|```", re.I)
+
+
+# ============================================================
+# 📊 المقاييس
+# ============================================================
+_metrics = Counter()
+_metrics_lock = threading.Lock()
+
+
+def _count(name: str, n: int = 1):
+    with _metrics_lock:
+        _metrics[name] += n
+
+
+def parse_metrics() -> dict:
+    """
+    requests: ردود طُلب تحليلها | first_pass_failures: لم تُحلَّل كاملة من أول مرة
+    salvaged: أُنقذت عناصر من رد مقطوع | repairs / reasks: طلبات إصلاح وإعادة سؤال
+    failed: فشلت نهائيًا | reasked_criteria: عدد المعايير التي أُعيد السؤال عنها
+    """
+    with _metrics_lock:
+        m = dict(_metrics)
+    req = m.get("requests", 0)
+    m["parse_failure_rate"] = round(m.get("first_pass_failures", 0) / req, 3) if req else 0.0
+    m["retry_rate"] = round((m.get("repairs", 0) + m.get("reasks", 0)) / req, 3) if req else 0.0
+    return m
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+# ============================================================
+# 🧩 الاستخراج والتحليل التدريجي
+# ============================================================
+def extract_json(text: str):
+    """أول قيمة JSON كاملة (كائن أو مصفوفة) داخل الرد، أو None."""
+    if not text:
+        return None
+    text = _FENCE_RE.sub("", text).strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    decoder = json.JSONDecoder()
+    for m in list(re.finditer(r"[\[{]", text))[:50]:
+        try:
+            value, _ = decoder.raw_decode(text, m.start())
+        except ValueError:
+            continue
+        if isinstance(value, (dict, list)):
+            return value
+    return None
+
+
+class JSONArrayStream:
+    """
+    محلل تدريجي: يستقبل النص على دفعات (feed) ويعيد كائنات المصفوفة المستهدفة فور اكتمالها.
+    key=None → المصفوفة الجذرية [...]، key="scores" → {"scores": [...]}.
+    """
+
+    def __init__(self, key: str = None):
+        self.key = key
+        self.buf = ""
+        self.pos = 0
+        self.stack = []
+        self.in_str = self.esc = False
+        self.str_start = None
+        self.last_str = None
+        self.cur_key = None
+        self.target = None      # عمق المصفوفة المستهدفة في الـ stack
+        self.item_start = None
+        self.items = []
+
+    def feed(self, chunk: str) -> list:
+        self.buf += chunk
+        new = []
+        buf = self.buf
+        for i in range(self.pos, len(buf)):
+            ch = buf[i]
+            if self.in_str:
+                if self.esc:
+                    self.esc = False
+                elif ch == "\\":
+                    self.esc = True
+                elif ch == '"':
+                    self.in_str = False
+                    if len(self.stack) == 1:
+                        try:
+                            self.last_str = json.loads(buf[self.str_start:i + 1])
+                        except ValueError:
+                            self.last_str = None
+                continue
+            if ch == '"':
+                self.in_str, self.str_start = True, i
+            elif ch == ":" and len(self.stack) == 1:
+                self.cur_key = self.last_str
+            elif ch in "[{":
+                if ch == "[" and self.target is None and (
+                        (self.key is None and not self.stack)
+                        or (self.key is not None and self.stack == ["{"] and self.cur_key == self.key)):
+                    self.target = len(self.stack) + 1
+                elif ch == "{" and self.target is not None and len(self.stack) == self.target:
+                    self.item_start = i
+                self.stack.append(ch)
+            elif ch in "]}":
+                if self.stack:
+                    self.stack.pop()
+                if ch == "}" and self.item_start is not None and len(self.stack) == self.target:
+                    try:
+                        item = json.loads(buf[self.item_start:i + 1])
+                        new.append(item)
+                    except ValueError:
+                        pass
+                    self.item_start = None
+                elif ch == "]" and self.target is not None and len(self.stack) < self.target:
+                    self.target = -1  # انتهت المصفوفة المستهدفة
+        self.pos = len(buf)
+        self.items += new
+        return new
+
+
+def salvage_items(text: str, key: str = None) -> list:
+    """العناصر المكتملة فقط من رد مقطوع أو تالف جزئيًا."""
+    return JSONArrayStream(key).feed(_FENCE_RE.sub("", text or ""))
+
+
+# ============================================================
+# ✅ التحقق من المخطط
+# ============================================================
+def _norm(s) -> str:
+    return " ".join(str(s).split())
+
+
+def _clean_pages(value) -> list:
+    if isinstance(value, (int, float)):
+        value = [value]
+    if isinstance(value, str):
+        value = re.findall(r"\d+", value)
+    out = []
+    for p in value or []:
+        try:
+            out.append(int(p))
+        except (TypeError, ValueError):
+            continue
+    return out
+
+
+def validate_scores(rows, criteria_list, min_score: int = 0, max_score: int = 4):
+    """
+    صفوف {"criterion","score","ai_question","reason","pages"} → (صفوف صالحة حسب المعيار، المعايير الناقصة).
+    المطابقة بالاسم بعد توحيد المسافات، وإلا بالموضع إذا تساوى العدد.
+    """
+    rows = [r for r in (rows or []) if isinstance(r, dict)]
+    by_name = {_norm(r.get("criterion", "")): r for r in rows}
+    positional = len(rows) == len(criteria_list)
+    valid = {}
+    for i, crit in enumerate(criteria_list):
+        row = by_name.get(_norm(crit)) or (rows[i] if positional else None)
+        if row is None:
+            continue
+        score = pd.to_numeric(row.get("score"), errors="coerce")
+        if pd.isna(score):
+            continue
+        valid[crit] = {
+            "criterion": crit,
+            "score": float(min(max(score, min_score), max_score)),
+            "ai_question": str(row.get("ai_question") or "—"),
+            "reason": str(row.get("reason") or "—"),
+            "pages": _clean_pages(row.get("pages")),
+        }
+    missing = [c for c in criteria_list if c not in valid]
+    return valid, missing
+
+
+def validate_labels(data, ids) -> dict:
+    """
+    {"sections": [{"id","section","summary"}]} → {id: {"section","summary"}} للمعرّفات المطلوبة فقط
+    (الاسم غير فارغ). المطابقة بالمعرّف، وإلا بالموضع إذا تساوى العدد ولم يُذكر أي معرّف.
+    """
+    rows = data.get("sections") if isinstance(data, dict) else data
+    rows = [r for r in (rows if isinstance(rows, list) else []) if isinstance(r, dict)]
+    by_id = {_norm(r.get("id", "")): r for r in rows}
+    positional = len(rows) == len(ids) and not any(sid in by_id for sid in ids)
+    out = {}
+    for i, sid in enumerate(ids):
+        row = by_id.get(sid) or (rows[i] if positional else None)
+        if row is None or not str(row.get("section", "")).strip():
+            continue
+        out[sid] = {"section": _norm(row["section"]), "summary": str(row.get("summary") or "").strip()}
+    return out
+
+
+# ============================================================
+# 🔁 الطلب مع JSON mode والإصلاح الموجّه
+# ============================================================
+def _call(site, messages, backend, on_item, item_key, **kwargs) -> str:
+    """طلب عادي، أو مبثوث مع تمرير كل عنصر من المصفوفة المستهدفة فور اكتماله."""
+    if on_item is None:
+        return chat(site, messages, backend=backend, **kwargs).text
+    if not STREAM_ENABLED:
+        reply = chat(site, messages, backend=backend, **kwargs).text
+        for item in salvage_items(reply, item_key):
+            on_item(item)
+        return reply
+    stream = chat_stream(site, messages, backend=backend, **kwargs)
+    parser = JSONArrayStream(item_key)
+    for delta in stream:
+        for item in parser.feed(delta):
+            stream.mark_row()
+            on_item(item)
+    return stream.text
+
+
+def complete_json(site: str, prompt, object_root: bool = True, backend=None,
+                  on_item=None, item_key: str = None, **kwargs):
+    """
+    طلب واحد يُتوقع أن يعيد JSON: (القيمة المحللة أو None، النص الخام).
+    prompt: نص (رسالة user واحدة) أو رسائل جاهزة من PromptTemplate.messages().
+    JSON mode يُطلب فقط لجذر كائن (json_object لا يسمح بمصفوفة جذرية).
+    on_item(item): يُستدعى لكل عنصر مكتمل من المصفوفة item_key أثناء البث.
+    """
+    backend = backend or get_backend()
+    messages = prompt if isinstance(prompt, list) else [{"role": "user", "content": prompt}]
+    if object_root and JSON_MODE and getattr(backend, "supports_json_mode", False):
+        emitted = []
+
+        def first_on_item(item):
+            emitted.append(True)
+            on_item(item)
+
+        try:
+            reply = _call(site, messages, backend, on_item and first_on_item, item_key,
+                          response_format={"type": "json_object"}, **kwargs)
+        except Exception:
+            # بعض النماذج ترفض JSON mode أو تفشل في تحقق الخادم → طلب عادي.
+            # إن بُثّت عناصر قبل الفشل فلا بث في الطلب البديل (وإلا وصلت مكررة)، والنتيجة الكاملة تُعاد كالمعتاد.
+            _count("json_mode_fallbacks")
+            reply = _call(site, messages, backend, None if emitted else on_item, item_key, **kwargs)
+    else:
+        reply = _call(site, messages, backend, on_item, item_key, **kwargs)
+    with tracing.span("json.parse", site=site, chars=len(reply)) as sp:
+        data = extract_json(reply)
+        sp.set(ok=data is not None)
+    return data, reply
+
+
+def repair_json(site: str, reply: str, shape: str, backend=None, **kwargs):
+    """طلب إصلاح صغير: الرد التالف فقط + الشكل المطلوب (بدون إعادة إرسال المستند)."""
+    _count("repairs")
+    prompt = (
+        "The following model output was supposed to be valid JSON but could not be parsed. "
+        f"Return ONLY the corrected JSON with this shape: {shape}\n"
+        "Do not add, remove or translate any values.\n\n"
+        f"{reply[:REPAIR_MAX_CHARS]}"
+    )
+    data, _ = complete_json(site, prompt, object_root=shape.lstrip().startswith("{"), backend=backend, **kwargs)
+    return data
+
+
+SCORES_SHAPE = '{"scores": [{"criterion", "score", "ai_question", "reason", "pages"}], "overall_comment"}'
+LABELS_SHAPE = '{"sections": [{"id", "section", "summary"}]}'
+PACKED_SHAPE = '{"offers": {"<offer id>": {"scores": [{"criterion", "score", "ai_question", "reason", "pages"}], "overall_comment"}}}'
+
+
+def request_scores(site: str, build_prompt, criteria_list, backend=None, min_score: int = 0,
+                   max_retries: int = None, on_row=None, **kwargs):
+    """
+    build_prompt(criteria_subset) → نص التوجيه أو رسائله. يعيد (data, missing):
+      data = {"scores": [...بترتيب المعايير...], "overall_comment"} أو None
+      missing = المعايير التي لم تُرجع بعد كل المحاولات
+    عند النقص يُعاد السؤال عن المعايير الناقصة فقط (max_retries مرة).
+    on_row(row): كل صف درجة صالح فور اكتماله في الرد المبثوث.
+    """
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+    valid, comment = {}, ""
+    pending = list(criteria_list)
+    for attempt in range(max_retries + 1):
+        if attempt:
+            _count("reasks")
+            _count("reasked_criteria", len(pending))
+        _count("requests")
+        on_item = None
+        if on_row is not None:
+            asked = list(pending)
+
+            def on_item(item, asked=asked):
+                got, _ = validate_scores([item], asked, min_score=min_score)
+                for row in got.values():
+                    on_row(row)
+
+        data, reply = complete_json(site, build_prompt(pending), backend=backend,
+                                    on_item=on_item, item_key="scores", **kwargs)
+        rows = data.get("scores") if isinstance(data, dict) else None
+        if rows is None:
+            _count("first_pass_failures")
+            rows = salvage_items(reply, "scores")
+            if rows:
+                _count("salvaged")
+            else:
+                data = repair_json(site, reply, SCORES_SHAPE, backend=backend, **kwargs)
+                rows = data.get("scores") if isinstance(data, dict) else None
+        if isinstance(data, dict) and not comment:
+            comment = str(data.get("overall_comment") or "").strip()
+
+        got, pending = validate_scores(rows, pending, min_score=min_score)
+        valid.update(got)
+        if not pending:
+            break
+    if pending:
+        _count("failed")
+    if not valid:
+        return None, pending
+    scores = [valid[c] for c in criteria_list if c in valid]
+    return {"scores": scores, "overall_comment": comment}, pending
+
+
+def _offer_blocks(data) -> dict:
+    """{"offers": {...}} أو {"offers": [{"offer_id", ...}]} → {offer_id: block}."""
+    offers = data.get("offers") if isinstance(data, dict) else None
+    if isinstance(offers, list):
+        offers = {str(o.get("offer_id") or o.get("id")): o for o in offers if isinstance(o, dict)}
+    return offers if isinstance(offers, dict) else None
+
+
+def request_packed_scores(site: str, prompt, offer_ids, criteria_list, backend=None,
+                          min_score: int = 0, **kwargs) -> dict:
+    """
+    طلب واحد لعدة عروض بمخطط مفتاحه معرّف العرض.
+    يعيد {offer_id: (data | None, missing)}؛ لا يُعاد السؤال هنا، فالعرض الناقص
+    يُقيَّم وحده من جديد لدى المستدعي (أرخص من إعادة إرسال الحزمة كاملة).
+    """
+    _count("requests")
+    data, reply = complete_json(site, prompt, backend=backend, **kwargs)
+    offers = _offer_blocks(data)
+    if offers is None:
+        _count("first_pass_failures")
+        offers = _offer_blocks(repair_json(site, reply, PACKED_SHAPE, backend=backend, **kwargs)) or {}
+
+    out = {}
+    for oid in offer_ids:
+        block = offers.get(oid)
+        rows = block.get("scores") if isinstance(block, dict) else None
+        got, missing = validate_scores(rows, criteria_list, min_score=min_score)
+        if not got:
+            out[oid] = (None, missing)
+            continue
+        comment = str(block.get("overall_comment") or "").strip()
+        out[oid] = ({"scores": [got[c] for c in criteria_list if c in got], "overall_comment": comment}, missing)
+    if any(missing for _, missing in out.values()):
+        _count("failed")
+    return out
+
+
+def request_labels(site: str, prompt, ids, backend=None, on_label=None, **kwargs) -> dict:
+    """
+    أسماء وملخصات أقسام مقسّمة محليًا، مفتاحها معرّف القسم: {id: {"section","summary"}}.
+    تحقق → إنقاذ العناصر المكتملة → طلب إصلاح؛ المعرّفات الناقصة تُترك للمستدعي.
+    on_label(id, label): كل تسمية صالحة فور اكتمالها في الرد المبثوث.
+    """
+    _count("requests")
+    on_item = None
+    if on_label is not None:
+        def on_item(item):
+            for sid, label in validate_labels([item], [_norm(item.get("id", ""))]).items():
+                if sid in ids:
+                    on_label(sid, label)
+    data, reply = complete_json(site, prompt, backend=backend, on_item=on_item, item_key="sections", **kwargs)
+    labels = validate_labels(data, ids)
+    if not labels:
+        _count("first_pass_failures")
+        labels = validate_labels(salvage_items(reply, "sections"), ids)
+        if labels:
+            _count("salvaged")
+        else:
+            labels = validate_labels(repair_json(site, reply, LABELS_SHAPE, backend=backend, **kwargs), ids)
+    if len(labels) < len(ids):
+        _count("failed")
+    return labels
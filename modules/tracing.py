@@ -0,0 +1,352 @@
+# modules/tracing.py
+"""
+تتبّع منظَّم لمراحل التشغيل (spans) بصيغة متوافقة مع OpenTelemetry:
+الاستخراج (لكل صفحة)، اكتشاف اللغة، الترجمة، بناء التوجيه، استدعاء النموذج
+(انتظار الطابور، أول توكن، الكلي، التوكنات)، تحليل JSON، والترتيب.
+
+    with span("offer.evaluate", offer=name) as sp:
+        ...
+        sp.set(computed=3)
+
+TRACE (قائمة مفصولة بفواصل):
+  off (افتراضي) → span() يعيد كائنًا فارغًا مشتركًا (كلفة استدعاء دالة فقط)
+  memory        → حلقة في الذاكرة (TRACE_BUFFER) لملخص المراحل والتوكنات في الواجهة
+  jsonl         → + سطر لكل span في TRACE_DIR (أو TRACE_FILE) بحقول OTLP
+                  (traceId, spanId, parentSpanId, startTimeUnixNano, endTimeUnixNano, attributes)
+  otel          → + spans حقيقية عبر opentelemetry-api (المُصدِّر يُضبط بمتغيرات OTEL_* المعتادة)
+
+السياق: الـ span الحالي في contextvar، والـ threads الجديدة لا ترثه تلقائيًا، لذا تُغلَّف
+الدوال المرسلة إلى ThreadPool بـ wrap(fn). السمة tender (والعرض offer) تُورَّث للأبناء
+حتى يُجمع إنفاق التوكنات لكل منافسة.
+
+python -m modules.tracing cache/traces/trace-....jsonl
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import logging
+import random
+import threading
+import contextvars
+from collections import deque
+
+from modules.cache import CACHE_ROOT
+
+log = logging.getLogger("ai_tender")
+
+TRACE_DIR = os.getenv("TRACE_DIR", os.path.join(CACHE_ROOT, "traces"))
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", "20000"))
+TRACE_MODES = ("off", "memory", "jsonl", "otel")
+# سمات تنتقل من الأب إلى كل أبنائه
+INHERITED = ("tender", "offer")
+
+ENABLED = False
+_modes = set()
+_spans = deque(maxlen=TRACE_BUFFER)
+_spans_lock = threading.Lock()
+_current = contextvars.ContextVar("ai_tender_span", default=None)
+_jsonl = None
+_jsonl_lock = threading.Lock()
+_tracer = None
+_rand = random.getrandbits
+
+
+# ============================================================
+# 🧵 الـ span
+# ============================================================
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attrs", "start_ns", "end_ns", "error",
+                 "_token", "_otel")
+
+    def __init__(self, name: str, parent, attrs: dict, start_ns: int = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else "%032x" % _rand(128)
+        self.span_id = "%016x" % _rand(64)
+        self.parent_id = parent.span_id if parent is not None else None
+        if parent is not None:
+            for k in INHERITED:
+                if k in parent.attrs and k not in attrs:
+                    attrs[k] = parent.attrs[k]
+        self.attrs = attrs
+        self.start_ns, self.end_ns = start_ns, None
+        self.error = None
+        self._token = self._otel = None
+        if _tracer is not None:
+            self._otel = _otel_start(self, parent)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def add(self, **amounts):
+        for k, v in amounts.items():
+            self.attrs[k] = self.attrs.get(k, 0) + v
+        return self
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self.start_ns = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end_ns = time.time_ns()
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"[:300]
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            pass  # مولّد أُغلق من سياق آخر (بث متروك قبل نهايته)
+        _finish(self)
+        return False
+
+    def to_dict(self) -> dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+            "attributes": {k: _attr(v) for k, v in self.attrs.items() if v is not None},
+        }
+
+
+class _NoopSpan:
+    """ما يعيده span() عند تعطيل التتبع: نفس الواجهة بلا أي عمل."""
+
+    def set(self, **attrs):
+        return self
+
+    def add(self, **amounts):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def _attr(v):
+    """قيم السمات المسموحة في OTel: نص/رقم/منطقي (وما عداها نص)."""
+    return v if isinstance(v, (str, bool, int, float)) else str(v)
+
+
+def span(name: str, **attrs):
+    """span جديد ابن للحالي (أو جذر trace جديد)؛ يُستخدم مع with."""
+    if not ENABLED:
+        return _NOOP
+    return Span(name, _current.get(), attrs)
+
+
+def current():
+    """الـ span الحالي (أو الكائن الفارغ) لإضافة سمات من وحدة لا تملكه."""
+    return (_current.get() or _NOOP) if ENABLED else _NOOP
+
+
+def record(name: str, duration_s: float, **attrs):
+    """
+    span مكتمل بمدة معروفة ينتهي الآن — لأعمال قِيست في مكان آخر
+    (مثل زمن كل صفحة المحسوب داخل عمليات الاستخراج).
+    """
+    if not ENABLED:
+        return
+    end_ns = time.time_ns()
+    sp = Span(name, _current.get(), attrs, start_ns=end_ns - int(duration_s * 1e9))
+    sp.end_ns = end_ns
+    _finish(sp)
+
+
+def wrap(fn):
+    """fn تعمل في thread آخر كابن للـ span الحالي (للإرسال إلى ThreadPool)."""
+    if not ENABLED:
+        return fn
+    parent = _current.get()
+
+    def run(*args, **kwargs):
+        token = _current.set(parent)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+# ============================================================
+# 📤 التصدير: الذاكرة، JSONL، OpenTelemetry
+# ============================================================
+def _finish(sp: Span):
+    # الحلقة تحفظ الكائن نفسه، والتحويل إلى dict عند القراءة فقط (spans())
+    with _spans_lock:
+        _spans.append(sp)
+    if _jsonl is not None:
+        line = json.dumps(sp.to_dict(), ensure_ascii=False) + "\n"
+        with _jsonl_lock:
+            _jsonl.write(line)
+            if sp.parent_id is None:
+                _jsonl.flush()  # نهاية trace كامل (منافسة/مهمة)؛ والباقي عند الخروج
+    if sp._otel is not None:
+        _otel_end(sp)
+
+
+def _otel_start(sp: Span, parent):
+    from opentelemetry import trace
+    ctx = trace.set_span_in_context(parent._otel) if parent is not None and parent._otel is not None else None
+    return _tracer.start_span(sp.name, context=ctx, start_time=sp.start_ns or time.time_ns())
+
+
+def _otel_end(sp: Span):
+    from opentelemetry.trace import Status, StatusCode
+    otel = sp._otel
+    otel.set_attributes({k: _attr(v) for k, v in sp.attrs.items() if v is not None})
+    if sp.error:
+        otel.set_status(Status(StatusCode.ERROR, sp.error))
+    otel.end(end_time=sp.end_ns)
+
+
+def configure(modes: str = None):
+    """تفعيل/تعطيل التتبع أثناء التشغيل: "off" أو أي تركيبة من memory,jsonl,otel."""
+    global ENABLED, _modes, _jsonl, _tracer
+    modes = {m.strip().lower() for m in (modes if modes is not None else os.getenv("TRACE", "off")).split(",")}
+    unknown = modes - set(TRACE_MODES)
+    if unknown:
+        raise ValueError(f"TRACE غير معروف: {', '.join(sorted(unknown))} (المتاح: {', '.join(TRACE_MODES)})")
+    modes.discard("off")
+
+    with _jsonl_lock:
+        if _jsonl is not None and "jsonl" not in modes:
+            _jsonl.close()
+            _jsonl = None
+        if "jsonl" in modes and _jsonl is None:
+            path = os.getenv("TRACE_FILE") or os.path.join(
+                TRACE_DIR, f"trace-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl")
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            _jsonl = open(path, "a", encoding="utf-8")
+
+    _tracer = None
+    if "otel" in modes:
+        try:
+            from opentelemetry import trace
+            _tracer = trace.get_tracer("ai_tender")
+        except ImportError as e:
+            log.warning(f"⚠️ TRACE=otel بدون opentelemetry-api ({e})؛ التتبع في الذاكرة/JSONL فقط.")
+    _modes = modes
+    ENABLED = bool(modes)
+
+
+@atexit.register
+def flush():
+    """كتابة ما تبقى من أسطر JSONL على القرص (تلقائيًا عند الخروج)."""
+    with _jsonl_lock:
+        if _jsonl is not None:
+            _jsonl.flush()
+
+
+def trace_file():
+    """مسار ملف JSONL الحالي (أو None)."""
+    return _jsonl.name if _jsonl is not None else None
+
+
+def reset_traces():
+    with _spans_lock:
+        _spans.clear()
+
+
+def spans() -> list:
+    """كل الـ spans المكتملة في الحلقة بصيغة OTLP (نفس أسطر JSONL)."""
+    with _spans_lock:
+        done = list(_spans)
+    return [sp.to_dict() for sp in done]
+
+
+# ============================================================
+# 📊 الملخصات: زمن كل مرحلة وإنفاق التوكنات لكل منافسة
+# ============================================================
+def _pct(vals, q: float) -> float:
+    return vals[min(len(vals) - 1, int(len(vals) * q))]
+
+
+def stage_summary(rows=None) -> dict:
+    """لكل مرحلة (اسم الـ span): العدد، الأخطاء، p50/p95/max بالمللي ثانية، والمجموع بالثواني."""
+    rows = spans() if rows is None else rows
+    by_name = {}
+    for r in rows:
+        by_name.setdefault(r["name"], []).append(r)
+    out = {}
+    for name in sorted(by_name):
+        mine = by_name[name]
+        ms = sorted((r["endTimeUnixNano"] - r["startTimeUnixNano"]) / 1e6 for r in mine)
+        out[name] = {
+            "count": len(mine),
+            "errors": sum(1 for r in mine if r["status"]["code"] == "ERROR"),
+            "p50_ms": round(_pct(ms, 0.5), 2),
+            "p95_ms": round(_pct(ms, 0.95), 2),
+            "max_ms": round(ms[-1], 2),
+            "total_s": round(sum(ms) / 1000, 3),
+        }
+    return out
+
+
+def token_summary(rows=None) -> dict:
+    """
+    لكل منافسة (سمة tender؛ "—" لما خارج أي منافسة) من spans llm.call:
+    الطلبات، توكنات التوجيه والرد، زمن الانتظار في الطابور وزمن النموذج، و p50/p95 لأول توكن.
+    """
+    rows = spans() if rows is None else rows
+    out = {}
+    for r in rows:
+        if r["name"] != "llm.call":
+            continue
+        a = r["attributes"]
+        t = out.setdefault(a.get("tender", "—"), {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                                  "estimated_calls": 0, "queue_s": 0.0, "llm_s": 0.0,
+                                                  "_ttft": []})
+        t["calls"] += 1
+        t["prompt_tokens"] += a.get("prompt_tokens", 0)
+        t["completion_tokens"] += a.get("completion_tokens", 0)
+        t["estimated_calls"] += bool(a.get("tokens_estimated"))
+        t["queue_s"] += a.get("queue_s", 0.0)
+        t["llm_s"] += (r["endTimeUnixNano"] - r["startTimeUnixNano"]) / 1e9
+        if a.get("ttft_s") is not None:
+            t["_ttft"].append(a["ttft_s"])
+    for t in out.values():
+        ttft = sorted(t.pop("_ttft"))
+        if ttft:
+            t["ttft_p50_s"], t["ttft_p95_s"] = round(_pct(ttft, 0.5), 3), round(_pct(ttft, 0.95), 3)
+        t["queue_s"], t["llm_s"] = round(t["queue_s"], 3), round(t["llm_s"], 3)
+    return out
+
+
+def load_jsonl(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+try:
+    configure()
+except ValueError as e:
+    # خطأ إملائي في TRACE لا يجب أن يُسقط التطبيق أو الدفعات أو المهام عند الاستيراد
+    log.warning(f"⚠️ {e}؛ التتبع معطّل.")
+    configure("off")
+
+
+def main(argv=None):
+    argv = argv if argv is not None else sys.argv[1:]
+    for path in argv:
+        rows = load_jsonl(path)
+        print(f"📄 {path}: {len(rows)} spans")
+        for name, s in stage_summary(rows).items():
+            print(f"  {name:<18s} n={s['count']:5d}  p50={s['p50_ms']:9.2f}ms  p95={s['p95_ms']:9.2f}ms  "
+                  f"total={s['total_s']:8.2f}s  errors={s['errors']}")
+        for tender, t in token_summary(rows).items():
+            print(f"  💰 {tender}: {json.dumps(t, ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# modules/translation.py
+"""
+خدمة ترجمة مجمّعة مع كاش دائم (المعايير بالعادة، وأي نصوص قصيرة متكررة).
+
+- translate_many(texts, source, target): يزيل التكرار، يقرأ من الكاش، ويترجم الناقص فقط
+  في طلب واحد (أو عدد قليل من الدفعات) بدل طلب لكل نص.
+- الكاش في SQLite (DiskCache("translations")) بمفتاح (النص، المصدر، الهدف، المترجم)،
+  فعشرة عروض إنجليزية بنفس المعايير = ترجمة واحدة فقط، وتبقى بعد إعادة التشغيل.
+
+TRANSLATOR:
+  google (افتراضي) → deep_translator.GoogleTranslator (يحتاج شبكة)
+  llm              → نموذج "translator" عبر modules.llm (يعمل مع الخلفية المحلية أو الوهمية)
+  stub             → بدون شبكة: يعيد النص كما هو مع بادئة [target] (للتجارب والقياس)
+"""
+import os
+import json
+import threading
+
+from modules import tracing
+from modules.cache import DiskCache, make_key
+
+TRANSLATOR = os.getenv("TRANSLATOR", "google")
+# حد Google لطول الطلب الواحد (5000 حرف) مع هامش
+GOOGLE_BATCH_CHARS = 4500
+
+translation_cache = DiskCache("translations")
+
+
+# ============================================================
+# 🌐 المترجمات
+# ============================================================
+class Translator:
+    name = "base"
+
+    def translate_batch(self, texts, source: str, target: str) -> list:
+        raise NotImplementedError
+
+
+class GoogleBatchTranslator(Translator):
+    """يضم النصوص بفواصل أسطر في طلب واحد لكل ~4500 حرف، ثم يقسم الناتج."""
+
+    name = "google"
+
+    def translate_batch(self, texts, source, target):
+        from deep_translator import GoogleTranslator
+
+        tr = GoogleTranslator(source=source, target=target)
+        out, batch, size = [], [], 0
+        for t in texts:
+            if batch and size + len(t) + 1 > GOOGLE_BATCH_CHARS:
+                out += self._one_request(tr, batch)
+                batch, size = [], 0
+            batch.append(t)
+            size += len(t) + 1
+        if batch:
+            out += self._one_request(tr, batch)
+        return out
+
+    @staticmethod
+    def _one_request(tr, batch):
+        flat = [" ".join(t.split()) for t in batch]
+        result = (tr.translate("\n".join(flat)) or "").split("\n")
+        if len(result) == len(batch):
+            return [r.strip() for r in result]
+        # اختلف عدد الأسطر (دمج/تقسيم من المترجم) → طلب لكل نص في هذه الدفعة فقط
+        return [tr.translate(t) for t in flat]
+
+
+class LLMTranslator(Translator):
+    """طلب واحد للنموذج يعيد مصفوفة JSON بنفس الترتيب."""
+
+    name = "llm"
+
+    def translate_batch(self, texts, source, target):
+        from modules.llm import chat
+
+        prompt = (
+            f"Translate each item of this JSON array from '{source}' to '{target}'. "
+            "Return ONLY a JSON array of strings with the same length and order.\n"
+            + json.dumps(list(texts), ensure_ascii=False)
+        )
+        reply = chat("translator", [{"role": "user", "content": prompt}], temperature=0.0).text
+        try:
+            start, end = reply.index("["), reply.rindex("]") + 1
+            result = json.loads(reply[start:end])
+            if isinstance(result, list) and len(result) == len(texts):
+                return [str(r) for r in result]
+        except ValueError:
+            pass
+        raise ValueError("رد الترجمة من النموذج ليس مصفوفة JSON بنفس الطول")
+
+
+class StubTranslator(Translator):
+    name = "stub"
+
+    def translate_batch(self, texts, source, target):
+        return [f"[{target}] {t}" for t in texts]
+
+
+TRANSLATORS = {
+    "google": GoogleBatchTranslator,
+    "llm": LLMTranslator,
+    "stub": StubTranslator,
+}
+
+_translator = None
+_lock = threading.Lock()
+
+
+def get_translator() -> Translator:
+    global _translator
+    with _lock:
+        if _translator is None:
+            cls = TRANSLATORS.get(TRANSLATOR)
+            if cls is None:
+                raise ValueError(f"TRANSLATOR غير معروف: {TRANSLATOR} (المتاح: {', '.join(TRANSLATORS)})")
+            _translator = cls()
+        return _translator
+
+
+def set_translator(translator: Translator):
+    """استبدال المترجم (مثلاً StubTranslator في القياس أو بدون شبكة)."""
+    global _translator
+    with _lock:
+        _translator = translator
+
+
+# ============================================================
+# 🔁 الترجمة المجمّعة مع الكاش
+# ============================================================
+# طلب ترجمة واحد في كل مرة: العروض المتوازية بنفس المعايير تنتظر الأول ثم تقرأ من الكاش
+_inflight = threading.Lock()
+
+
+def _key(text: str, source: str, target: str, translator: Translator) -> str:
+    return make_key("translate", " ".join(text.split()), source, target, translator.name)
+
+
+def translate_many(texts, source: str = "ar", target: str = "en", translator: Translator = None) -> list:
+    """ترجمة قائمة نصوص بنفس ترتيبها؛ النصوص الفارغة تبقى كما هي."""
+    translator = translator or get_translator()
+    texts = [str(t) for t in texts]
+    found = {}
+
+    def _lookup(pending):
+        for t in pending:
+            hit = translation_cache.get(_key(t, source, target, translator))
+            if hit is not None:
+                found[t] = hit
+
+    with tracing.span("translate", translator=translator.name, source=source, target=target) as sp:
+        unique = list(dict.fromkeys(t for t in texts if t.strip()))
+        _lookup(unique)
+        missing = [t for t in unique if t not in found]
+        if missing:
+            with _inflight:
+                _lookup(missing)
+                missing = [t for t in missing if t not in found]
+                if missing:
+                    for t, tr in zip(missing, translator.translate_batch(missing, source, target)):
+                        found[t] = tr
+                        translation_cache.set(_key(t, source, target, translator), tr)
+        sp.set(texts=len(unique), translated=len(missing))
+    return [found.get(t, t) for t in texts]
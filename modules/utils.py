@@ -1,17 +1,8 @@
-import re, json
+from modules.structured import extract_json
 
 def robust_json_extract(text):
-    """Extract valid JSON even if surrounded by text."""
-    match = re.search(r"(\[.*\]|\{.*\})", text, flags=re.S)
-    if match:
-        try:
-            return json.loads(match.group(1))
-        except:
-            try:
-                return json.loads(match.group(1).replace("'", '"'))
-            except:
-                return None
-    return None
+    """Extract valid JSON even if surrounded by text (see modules.structured)."""
+    return extract_json(text)
 
 def normalized_mean_score(df_scores):
     """Convert mean (1..4) to normalized (0..1)."""
@@ -1,19 +1,23 @@
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import torch
+from modules.llm import TransformersBackend
+from modules.prompts import PromptTemplate
 
 model_name = "humain-ai/ALLAM-7B-Instruct-preview"
 
 print("🔹 تحميل النموذج والـ tokenizer ...")
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForCausalLM.from_pretrained(
-    model_name,
-    torch_dtype=torch.bfloat16,
-    device_map="auto"
-)
+backend = TransformersBackend(model_name)
 
-prompt = "حلّل النص التالي واستخرج النقاط الرئيسية:\nهذا العرض الفني يوضح المنهجية المقترحة وخطة التنفيذ والنتائج المتوقعة."
-inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+# بادئة ثابتة (التعليمات) + نص متغيّر: الطلب الثاني يعيد استخدام KV البادئة
+template = PromptTemplate("allam-demo", "v1",
+                          static="أنت مساعد لتحليل العروض الفنية. حلّل النص التالي واستخرج النقاط الرئيسية "
+                                 "في قائمة مرقّمة، واذكر أي نقص واضح في العرض.",
+                          dynamic="{text}")
+texts = [
+    "هذا العرض الفني يوضح المنهجية المقترحة وخطة التنفيذ والنتائج المتوقعة.",
+    "يقدّم هذا العرض فريق عمل مؤهلًا وخطة جودة واضحة ومدة تنفيذ محددة.",
+]
 
-print("🤖 يتم التوليد ...")
-outputs = model.generate(**inputs, max_new_tokens=400, do_sample=True, temperature=0.7)
-print("\n🧠 النتيجة:\n", tokenizer.decode(outputs[0], skip_special_tokens=True))
+for text in texts:
+    print("🤖 يتم التوليد ...")
+    result = backend.complete(template.messages(text=text), temperature=0.7, max_tokens=400)
+    print("\n🧠 النتيجة:\n", result.text)
+print("♻️ مرات إعادة استخدام البادئة:", backend.prefix_hits)